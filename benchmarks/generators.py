@@ -0,0 +1,62 @@
+"""
+Синтетические данные для бенчмарков: задачи, заполнение БД, фразы дат.
+Всё детерминировано (seed), чтобы прогоны были сравнимы.
+"""
+import random
+from datetime import datetime, timedelta, timezone
+
+CONTEXTS = ["AI", "Horien", "Energy", "System", None]
+VERBS = ["Позвонить", "Написать письмо", "Собрать отчёт", "Разработать бот", "Проверить поставку",
+         "Оформить счёт", "Настроить сервер", "Подготовить презентацию", "Лягушка:", "Камень:"]
+OBJECTS = ["клиенту", "по OOS", "для банка", "в Horien", "по налогам", "для ВБ", "по логистике",
+           "юристу", "команде", "по архитектуре"]
+DT_PHRASES = ["завтра 10:00", "через 2 часа", "в пятницу 18:30", "послезавтра утром",
+              "2025-11-05 14:00", "через неделю", "в понедельник", "сегодня 21:15"]
+
+
+def make_task_rows(n, seed=0, chat_id=1, now=None):
+    """n задач-словарей с полями как у строк tasks. Часть заголовков повторяется
+    (с вариациями регистра/пунктуации), чтобы дедупликация работала не вхолостую."""
+    rnd = random.Random(seed)
+    now = now or datetime.now(timezone.utc)
+    rows = []
+    for i in range(1, n + 1):
+        title = f"{rnd.choice(VERBS)} {rnd.choice(OBJECTS)} #{rnd.randint(1, max(1, n // 3))}"
+        if rnd.random() < 0.1:
+            title = title.upper() + "!"
+        due = None
+        if rnd.random() < 0.8:
+            due = (now + timedelta(hours=rnd.uniform(-48, 7 * 24))).isoformat()
+        rows.append({
+            "id": i,
+            "chat_id": chat_id,
+            "title": title,
+            "description": "",
+            "context": rnd.choice(CONTEXTS),
+            "due_at": due,
+            "added_at": (now - timedelta(days=rnd.uniform(0, 30))).isoformat(),
+            "status": "open" if rnd.random() < 0.85 else "done",
+            "priority": round(rnd.uniform(10, 90), 1),
+            "est_minutes": rnd.choice([15, 30, 45, 90]),
+            "source": rnd.choice(["text", "voice", "sheets"]),
+        })
+    return rows
+
+
+def populate_db(rows):
+    """Вставляет строки make_task_rows в текущую БД (db.DB_PATH) одним пакетом"""
+    from src.app.db import db_connect
+    conn = db_connect()
+    try:
+        conn.executemany("""
+          INSERT INTO tasks(id,chat_id,title,description,context,due_at,added_at,status,priority,est_minutes,source)
+          VALUES (:id,:chat_id,:title,:description,:context,:due_at,:added_at,:status,:priority,:est_minutes,:source)
+        """, rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def make_dt_phrases(n, seed=0):
+    rnd = random.Random(seed)
+    return [rnd.choice(DT_PHRASES) for _ in range(n)]
@@ -0,0 +1,161 @@
+"""
+Нагрузочный прогон: тысячи синтетических апдейтов через настоящие хендлеры Application.
+
+Все внешние сервисы подменены фейками из tests.fakes (Bot API, OpenAI, Sheets, Notion),
+БД — временная. Отчёт: пропускная способность и перцентили латентности обработки апдейта,
+в целом и по командам.
+
+Использование:
+    python -m benchmarks.loadgen --updates 5000 --concurrency 50
+    python -m benchmarks.loadgen --tg-latency-ms 30 --rate-limit-every 200
+"""
+import sys
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from unittest import mock
+
+from .run import _temp_db
+from .generators import make_task_rows, DT_PHRASES
+
+# Доли команд в синтетическом потоке
+COMMAND_MIX = [
+    ("/add", 30), ("/inbox", 15), ("/plan", 15), ("/week", 10), ("/done", 10),
+    ("/snooze", 5), ("/stats", 5), ("text", 10),
+]
+
+def make_updates(n, user_id, seed=0, task_ids=(1,)):
+    """n апдейтов Bot API (dict) со смесью команд COMMAND_MIX"""
+    rnd = random.Random(seed)
+    names = [c for c, _ in COMMAND_MIX]
+    weights = [w for _, w in COMMAND_MIX]
+    titles = [r["title"] for r in make_task_rows(200, seed=seed)]
+    now = int(time.time())
+    updates = []
+    for i in range(1, n + 1):
+        cmd = rnd.choices(names, weights)[0]
+        if cmd == "/add":
+            text = f"/add {rnd.choice(titles)} {rnd.choice(DT_PHRASES)}"
+        elif cmd == "/done":
+            text = f"/done {rnd.choice(task_ids)}"
+        elif cmd == "/snooze":
+            text = f"/snooze {rnd.choice(task_ids)} {rnd.choice(DT_PHRASES)}"
+        elif cmd == "text":
+            text = rnd.choice(titles)
+        else:
+            text = cmd
+        message = {
+            "message_id": i,
+            "date": now,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Load"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        updates.append({"update_id": i, "message": message})
+    return updates
+
+def _percentiles(values):
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    if len(values) == 1:
+        v = values[0]
+        return {"p50": v, "p95": v, "p99": v, "max": v}
+    q = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": q[49], "p95": q[94], "p99": q[98], "max": max(values)}
+
+async def run_load(updates=2000, concurrency=20, tg_latency_s=0.0, llm_latency_s=0.0,
+                   rate_limit_every=0, seed_tasks=500, seed=0):
+    """Прогоняет апдейты через build_application() на фейках. Возвращает отчёт (dict)."""
+    from telegram import Update
+    from src.app import ai
+    from src.app.config import ALLOWED_USER_ID
+    from src.app.integrations import sheets, notion
+    from src.app.main import build_application
+    from tests.fakes import FakeTelegramRequest, FakeOpenAI, FakeSpreadsheet, FakeNotionClient
+
+    fake_tg = FakeTelegramRequest(latency_s=tg_latency_s, rate_limit_every=rate_limit_every)
+    fake_ai = FakeOpenAI(latency_s=llm_latency_s)
+    fake_sheet = FakeSpreadsheet([sheets.SHEET_WEEK_TASKS, sheets.SHEET_DAYS, sheets.SHEET_REFLECTIONS])
+    fake_notion = FakeNotionClient()
+
+    tasks = make_task_rows(seed_tasks, seed=seed, chat_id=ALLOWED_USER_ID)
+    with _temp_db(tasks), \
+            mock.patch.object(ai, "_client", fake_ai), \
+            mock.patch.object(sheets, "_open_sheet", return_value=fake_sheet), \
+            mock.patch.object(notion, "_cli", return_value=fake_notion):
+        app = build_application(token="123456:LOADTEST", request=fake_tg)
+        await app.initialize()
+        batch = make_updates(updates, ALLOWED_USER_ID, seed=seed, task_ids=[t["id"] for t in tasks])
+        sem = asyncio.Semaphore(max(1, concurrency))
+        latencies = {}
+
+        async def one(data):
+            update = Update.de_json(data, app.bot)
+            text = data["message"]["text"]
+            kind = text.split()[0] if text.startswith("/") else "text"
+            async with sem:
+                t0 = time.perf_counter()
+                await app.process_update(update)
+                latencies.setdefault(kind, []).append(time.perf_counter() - t0)
+
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*(one(u) for u in batch))
+        finally:
+            elapsed = time.perf_counter() - started
+            await app.shutdown()
+
+    everything = [v for vs in latencies.values() for v in vs]
+    return {
+        "updates": len(everything),
+        "concurrency": concurrency,
+        "elapsed_s": elapsed,
+        "throughput": len(everything) / elapsed if elapsed else 0.0,
+        "latency": _percentiles(everything),
+        "by_command": {k: dict(_percentiles(v), count=len(v)) for k, v in sorted(latencies.items())},
+        "bot_api_requests": fake_tg.requests,
+        "bot_api_sent": len(fake_tg.sent),
+        "bot_api_rate_limited": fake_tg.rate_limited,
+        "llm_calls": fake_ai.calls,
+    }
+
+def format_report(report):
+    lat = report["latency"]
+    lines = [
+        f"updates: {report['updates']}  concurrency: {report['concurrency']}  elapsed: {report['elapsed_s']:.2f}s",
+        f"throughput: {report['throughput']:.1f} updates/s",
+        f"latency: p50 {lat['p50'] * 1000:.1f}ms  p95 {lat['p95'] * 1000:.1f}ms  "
+        f"p99 {lat['p99'] * 1000:.1f}ms  max {lat['max'] * 1000:.1f}ms",
+        f"bot api: {report['bot_api_requests']} requests, {report['bot_api_sent']} sends, "
+        f"{report['bot_api_rate_limited']} × 429;  llm calls: {report['llm_calls']}",
+        "",
+        f"{'command':<12}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}",
+    ]
+    for cmd, s in report["by_command"].items():
+        lines.append(f"{cmd:<12}{s['count']:>7}{s['p50'] * 1000:>10.1f}{s['p95'] * 1000:>10.1f}{s['p99'] * 1000:>10.1f}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.loadgen")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--tg-latency-ms", type=float, default=0.0, help="задержка фейкового Bot API")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="задержка фейкового OpenAI (блокирующая)")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="каждый N-й запрос к Bot API отвечает 429")
+    parser.add_argument("--seed-tasks", type=int, default=500, help="задач в БД перед прогоном")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load(
+        updates=args.updates, concurrency=args.concurrency,
+        tg_latency_s=args.tg_latency_ms / 1000, llm_latency_s=args.llm_latency_ms / 1000,
+        rate_limit_every=args.rate_limit_every, seed_tasks=args.seed_tasks,
+    ))
+    print(format_report(report))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
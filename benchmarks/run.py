@@ -0,0 +1,236 @@
+"""
+Бенчмарки горячих путей: планирование, дедупликация, ребалансировка, запросы БД,
+приоритеты, разбор дат, экспорт в Sheets (на FakeSpreadsheet) и CSV.
+
+Использование:
+    python -m benchmarks.run                      # 100/1k/10k, сравнение с baseline.json
+    python -m benchmarks.run --full               # + 100k
+    python -m benchmarks.run --only dedupe_rows --sizes 100,1000
+    python -m benchmarks.run --save               # записать текущие результаты как baseline
+
+Бенчмарки с max_n (квадратичная дедупликация) крупные размеры не гоняют — они
+печатаются как skipped с причиной.
+
+Код выхода 1, если какой-то замер медленнее baseline больше чем на --threshold (по умолчанию 25%).
+Baseline зависит от машины — сохраняйте его на той же машине, где проверяете.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import argparse
+import statistics
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from .generators import make_task_rows, populate_db, make_dt_phrases
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_SIZES = (100, 1000, 10000)
+FULL_SIZES = DEFAULT_SIZES + (100000,)
+DEFAULT_THRESHOLD = float(os.getenv("BENCH_THRESHOLD", "0.25"))
+
+# имя -> (генератор-настройка, максимальный размер, почему не больше)
+BENCHMARKS = {}
+# "имя@n" -> причина пропуска в последнем run_benchmarks
+SKIPPED = {}
+
+def bench(name, max_n=None, reason=None):
+    """Регистрирует бенчмарк. Функция получает n и делает yield вызываемого объекта,
+    код после yield — очистка. Размеры больше max_n пропускаются с reason в выводе."""
+    def decorator(fn):
+        BENCHMARKS[name] = (fn, max_n, reason)
+        return fn
+    return decorator
+
+@contextmanager
+def _temp_db(rows=()):
+    from src.app import db
+    tmp = tempfile.mkdtemp(prefix="bench_")
+    with mock.patch.object(db, "DB_PATH", os.path.join(tmp, "bench.db")):
+        db.db_init()
+        if rows:
+            populate_db(rows)
+        try:
+            yield
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+# Попарный SequenceMatcher, O(n²): 1k — ~8 с на вызов, 10k — ~10 мин, 100k — больше суток
+@bench("dedupe_rows", max_n=1000, reason="O(n²) SequenceMatcher: ~8 s at 1k, ~10 min at 10k")
+def _(n):
+    from src.app.handlers import _dedupe_rows
+    rows = make_task_rows(n)
+    yield lambda: _dedupe_rows(rows)
+
+# Внутри тот же _dedupe_rows, так что ограничение то же
+@bench("pick_plan", max_n=1000, reason="runs _dedupe_rows, same O(n²) cap")
+def _(n):
+    from src.app.handlers import _pick_plan
+    rows = make_task_rows(n)
+    yield lambda: _pick_plan(rows)
+
+@bench("rebalance_week", max_n=10000)
+def _(n):
+    from src.app.handlers import _rebalance_week_slots
+    start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    rows = make_task_rows(n)
+    yield lambda: _rebalance_week_slots(rows, start)
+
+@bench("compute_priority")
+def _(n):
+    from src.app.handlers import compute_priority
+    now = datetime.now(timezone.utc)
+    items = [(r["title"], now + timedelta(hours=i % 100), r["est_minutes"]) for i, r in enumerate(make_task_rows(n))]
+    yield lambda: [compute_priority(t, d, e) for t, d, e in items]
+
+@bench("parse_human_dt", max_n=1000)
+def _(n):
+    from src.app.handlers import parse_human_dt
+    phrases = make_dt_phrases(n)
+    yield lambda: [parse_human_dt(p) for p in phrases]
+
+@bench("list_today")
+def _(n):
+    from src.app.db import list_today, iso_utc
+    with _temp_db(make_task_rows(n)):
+        now = datetime.now(timezone.utc)
+        start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        yield lambda: list_today(1, iso_utc(now), iso_utc(start), iso_utc(start + timedelta(days=1)))
+
+@bench("list_week_tasks")
+def _(n):
+    from src.app.db import list_week_tasks, iso_utc
+    with _temp_db(make_task_rows(n)):
+        start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        yield lambda: list_week_tasks(1, iso_utc(start), iso_utc(start + timedelta(days=7)))
+
+@bench("export_week_to_sheets")
+def _(n):
+    from src.app.integrations import sheets
+    from tests.fakes import FakeSpreadsheet
+    fake = FakeSpreadsheet([sheets.SHEET_WEEK_TASKS, sheets.SHEET_DAYS])
+    with _temp_db(make_task_rows(n)), mock.patch.object(sheets, "_open_sheet", return_value=fake):
+        yield sheets.export_week_from_bot_to_sheets
+
+@bench("export_csv")
+def _(n):
+    from src.app.export import export_tasks
+
+    def run():
+        spool, _, _ = export_tasks(1, "csv")
+        spool.close()
+    with _temp_db(make_task_rows(n)):
+        yield run
+
+def measure(target, repeat=5, min_time=0.05):
+    """Медиана времени одного вызова (с), вызовов в замере столько, чтобы он длился >= min_time"""
+    started = time.perf_counter()
+    target()  # прогрев
+    once = time.perf_counter() - started
+    number = max(1, int(min_time / once)) if once > 0 else 1000
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            target()
+        samples.append((time.perf_counter() - t0) / number)
+    return statistics.median(samples)
+
+def run_benchmarks(sizes=DEFAULT_SIZES, only=None, repeat=5):
+    """Прогоняет бенчмарки. Возвращает {"имя@n": секунды}."""
+    results = {}
+    SKIPPED.clear()
+    for name, (setup, max_n, reason) in BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        for n in sizes:
+            if max_n and n > max_n:
+                SKIPPED[f"{name}@{n}"] = reason or f"max_n={max_n}"
+                continue
+            gen = setup(n)
+            try:
+                target = next(gen)
+                results[f"{name}@{n}"] = measure(target, repeat=repeat)
+            finally:
+                gen.close()
+    return results
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Список регрессий: [(ключ, baseline_s, current_s, рост)]"""
+    regressions = []
+    for key, current in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        growth = current / base - 1
+        if growth > threshold:
+            regressions.append((key, base, current, growth))
+    return regressions
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("results", {})
+
+def save_baseline(results, path=BASELINE_PATH):
+    data = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "saved": datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+def _fmt(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.2f} s"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run")
+    parser.add_argument("--sizes", help="через запятую, например 100,1000")
+    parser.add_argument("--full", action="store_true", help="добавить размер 100k")
+    parser.add_argument("--only", help="имена бенчмарков через запятую")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="сохранить результаты как baseline")
+    args = parser.parse_args(argv)
+
+    sizes = tuple(int(x) for x in args.sizes.split(",")) if args.sizes else (FULL_SIZES if args.full else DEFAULT_SIZES)
+    only = set(args.only.split(",")) if args.only else None
+    results = run_benchmarks(sizes, only, args.repeat)
+    baseline = load_baseline(args.baseline)
+
+    for key, value in results.items():
+        base = baseline.get(key)
+        delta = f"  ({(value / base - 1) * 100:+.0f}% vs baseline)" if base else ""
+        print(f"{key:<32} {_fmt(value):>12}{delta}")
+    for key, reason in SKIPPED.items():
+        print(f"{key:<32} {'skipped':>12}  ({reason})")
+
+    if args.save:
+        merged = dict(baseline)
+        merged.update(results)
+        save_baseline(merged, args.baseline)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for key, base, current, growth in regressions:
+        print(f"REGRESSION {key}: {_fmt(base)} -> {_fmt(current)} (+{growth * 100:.0f}%)")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
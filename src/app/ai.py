@@ -4,6 +4,7 @@ from datetime import datetime
 from pydub import AudioSegment
 from openai import OpenAI
 from .config import OPENAI_API_KEY, TZINFO
+from .instrumentation import timed
 
 # Lazy initialization для избежания проблем с импортом
 _client = None
@@ -22,6 +23,7 @@ SYSTEM_PROMPT = (
  "Верни строго JSON с ключами: title, description, due, context."
 )
 
+@timed("llm_call", op="whisper")
 def transcribe_ogg_to_text(ogg_bytes: bytes) -> str:
     client = get_client()
     audio = AudioSegment.from_file(io.BytesIO(ogg_bytes), format="ogg")
@@ -37,6 +39,7 @@ def transcribe_ogg_to_text(ogg_bytes: bytes) -> str:
     )
     return tr
 
+@timed("llm_call", op="parse_task")
 def parse_task(text: str) -> dict:
     client = get_client()
     r = client.chat.completions.create(
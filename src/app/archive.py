@@ -0,0 +1,83 @@
+"""
+Архив закрытых задач: горячая таблица tasks держит только живые задачи.
+
+Задачи в статусе done/dropped, закрытые больше ARCHIVE_AFTER_DAYS дней назад,
+переносятся в tasks_archive порциями по ARCHIVE_BATCH — каждая порция отдельной
+короткой транзакцией, чтобы не держать блокировку записи. Запускается из часового
+фонового потока (после бэкапа) или вручную:
+    python -m src.app.archive [--days N]
+
+Отчёты, которым нужна вся история (/export, пересчёт task_stats_daily), читают
+представление tasks_all. Журнал пишет перенос событием 'A', статистика не меняется.
+"""
+import sys
+import logging
+from datetime import datetime, timedelta, timezone
+from .config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH
+from .db import db_connect, iso_utc, TASK_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+def _archive_batch(conn, cutoff_iso, batch, archived_at):
+    """Переносит одну порцию; возвращает число перенесённых задач"""
+    cols = ",".join(TASK_COLUMNS)
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE;")
+    try:
+        ids = [r[0] for r in c.execute("""
+          SELECT id FROM tasks
+          WHERE status IN ('done','dropped') AND closed_at < ?
+          ORDER BY closed_at
+          LIMIT ?
+        """, (cutoff_iso, batch)).fetchall()]
+        if ids:
+            marks = ",".join("?" * len(ids))
+            c.execute(f"INSERT OR REPLACE INTO tasks_archive({cols},archived_at) "
+                      f"SELECT {cols},? FROM tasks WHERE id IN ({marks});", [archived_at] + ids)
+            c.execute(f"DELETE FROM tasks WHERE id IN ({marks});", ids)
+        conn.commit()
+        return len(ids)
+    except Exception:
+        conn.rollback()
+        raise
+
+def archive_closed_tasks(older_than_days=ARCHIVE_AFTER_DAYS, batch=ARCHIVE_BATCH, now_utc=None, max_batches=None):
+    """Переносит закрытые давнее older_than_days задачи в tasks_archive.
+    Возвращает число перенесённых задач (при ошибке — сколько успели до неё)."""
+    now_utc = now_utc or datetime.now(timezone.utc)
+    cutoff_iso = iso_utc(now_utc - timedelta(days=older_than_days))
+    moved = 0
+    conn = None
+    try:
+        conn = db_connect()
+        conn.isolation_level = None  # транзакциями управляем сами
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            n = _archive_batch(conn, cutoff_iso, batch, iso_utc(now_utc))
+            moved += n
+            batches += 1
+            if n < batch:
+                break
+        if moved:
+            logger.info(f"Archived {moved} closed tasks (closed before {cutoff_iso})")
+        return moved
+    except Exception as e:
+        logger.error(f"Failed to archive tasks (archived {moved} before error): {e}", exc_info=True)
+        return moved
+    finally:
+        if conn:
+            conn.close()
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="python -m src.app.archive")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="закрытые раньше стольких дней назад")
+    parser.add_argument("--batch", type=int, default=ARCHIVE_BATCH)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    print(f"Archived {archive_closed_tasks(args.days, args.batch)} tasks")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,26 @@
 import os
+import gzip
+import json
 import shutil
+import sqlite3
+import hashlib
 import logging
-from datetime import datetime
-from .config import DB_PATH
+import threading
+from datetime import datetime, timedelta
+from .config import (
+    DB_PATH, BACKUP_COMPRESSION, BACKUP_STEP_PAGES,
+    BACKUP_KEEP_HOURLY, BACKUP_KEEP_DAILY, BACKUP_KEEP_WEEKLY
+)
 
 logger = logging.getLogger(__name__)
 
+BACKUP_PREFIX = "daily_pilot_backup_"
+MANIFEST_FILE = "manifest.json"
+
+# Каталог бэкапов в памяти и блокировка (бэкап идёт из отдельного потока)
+_manifest = None
+_lock = threading.RLock()
+
 def get_backup_dir():
     """Возвращает директорию для бэкапов"""
     base_dir = os.path.dirname(DB_PATH)
@@ -13,71 +28,281 @@ def get_backup_dir():
     os.makedirs(backup_dir, exist_ok=True)
     return backup_dir
 
-def create_backup():
-    """Создает бэкап БД"""
+def _db_change_marker():
+    """Маркер изменений БД: счётчик изменений из заголовка файла + состояние WAL.
+    Счётчик (байты 24..27) растёт на каждой записи в rollback-режиме,
+    в WAL-режиме изменения видны по размеру/mtime файла -wal."""
+    with open(DB_PATH, "rb") as f:
+        header = f.read(100)
+    counter = int.from_bytes(header[24:28], "big") if len(header) >= 28 else 0
+    wal_path = DB_PATH + "-wal"
+    wal = None
+    if os.path.exists(wal_path):
+        st = os.stat(wal_path)
+        wal = [st.st_size, st.st_mtime_ns]
+    return {"counter": counter, "wal": wal, "size": os.path.getsize(DB_PATH)}
+
+def _manifest_path():
+    return os.path.join(get_backup_dir(), MANIFEST_FILE)
+
+def _adopt_existing_files():
+    """Разовая миграция: бэкапы, созданные до появления манифеста"""
+    backup_dir = get_backup_dir()
+    entries = []
+    for filename in os.listdir(backup_dir):
+        if filename.startswith(BACKUP_PREFIX) and not filename.endswith(".tmp"):
+            file_path = os.path.join(backup_dir, filename)
+            entries.append({
+                "filename": filename,
+                "size": os.path.getsize(file_path),
+                "sha256": None,
+                "created": datetime.fromtimestamp(os.path.getmtime(file_path)).isoformat(),
+            })
+    entries.sort(key=lambda x: x["created"])
+    return {"version": 1, "marker": None, "backups": entries}
+
+def _load_manifest():
+    """Манифест бэкапов (кэшируется в памяти; диск читается один раз за процесс)"""
+    global _manifest
+    if _manifest is not None:
+        return _manifest
+    path = _manifest_path()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            _manifest = json.load(f)
+    except FileNotFoundError:
+        _manifest = _adopt_existing_files()
+        if _manifest["backups"]:
+            _save_manifest(_manifest)
+    except Exception as e:
+        logger.warning(f"Failed to read backup manifest, rebuilding: {e}")
+        _manifest = _adopt_existing_files()
+    return _manifest
+
+def _save_manifest(manifest):
+    global _manifest
+    path = _manifest_path()
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+    _manifest = manifest
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _online_copy(dst_path, step_pages=None):
+    """Копия БД через sqlite3 backup API порциями страниц — без долгой блокировки писателей"""
+    step = step_pages or BACKUP_STEP_PAGES
+    src = sqlite3.connect(DB_PATH)
+    dst = sqlite3.connect(dst_path)
+    try:
+        src.backup(dst, pages=step, sleep=0.01)
+    finally:
+        dst.close()
+        src.close()
+
+def verify_backup(path):
+    """PRAGMA integrity_check для несжатого файла бэкапа"""
+    conn = None
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        row = conn.execute("PRAGMA integrity_check;").fetchone()
+        return bool(row) and row[0] == "ok"
+    except Exception as e:
+        logger.error(f"Backup integrity check failed for {path}: {e}", exc_info=True)
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+def _journal_position(path):
+    """Последний id из task_events внутри файла бэкапа (None, если журнала нет)"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        row = conn.execute("SELECT MAX(id) FROM task_events;").fetchone()
+        return row[0] if row and row[0] is not None else 0
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+def open_backup_copy(entry, dst_path):
+    """Распаковывает бэкап из манифеста в dst_path (несжатый файл SQLite)"""
+    src_path = entry["path"] if "path" in entry else os.path.join(get_backup_dir(), entry["filename"])
+    if src_path.endswith(".gz"):
+        with gzip.open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+    elif src_path.endswith(".zst"):
+        import zstandard
+        with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+            zstandard.ZstdDecompressor().copy_stream(src, dst)
+    else:
+        shutil.copyfile(src_path, dst_path)
+    return dst_path
+
+def _compress(path, method):
+    """Сжимает файл бэкапа; возвращает путь итогового файла"""
+    if method == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            logger.warning("zstandard не установлен, используем gzip")
+            method = "gzip"
+        else:
+            out = path + ".zst"
+            with open(path, "rb") as src, open(out, "wb") as dst:
+                zstandard.ZstdCompressor(level=10).copy_stream(src, dst)
+            os.remove(path)
+            return out
+    if method == "gzip":
+        out = path + ".gz"
+        with open(path, "rb") as src, gzip.open(out, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.remove(path)
+        return out
+    return path
+
+def create_backup(force=False):
+    """Создает бэкап БД (online backup API + проверка целостности) и регистрирует его в манифесте.
+    Если БД не менялась с прошлого бэкапа — копия не делается (force=True отключает проверку)."""
+    tmp_path = None
     try:
         if not os.path.exists(DB_PATH):
             logger.warning("Database file not found, skipping backup")
             return None
-        
-        backup_dir = get_backup_dir()
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_filename = f"daily_pilot_backup_{timestamp}.db"
-        backup_path = os.path.join(backup_dir, backup_filename)
-        
-        shutil.copy2(DB_PATH, backup_path)
-        logger.info(f"Backup created: {backup_path}")
-        
-        # Удаляем старые бэкапы (старше 7 дней)
-        cleanup_old_backups()
-        
-        return backup_path
+
+        with _lock:
+            backup_dir = get_backup_dir()
+            manifest = _load_manifest()
+            marker = _db_change_marker()
+            last = manifest["backups"][-1] if manifest["backups"] else None
+            if not force and last and manifest.get("marker") == marker:
+                logger.info("Database unchanged since last backup, skipping")
+                return os.path.join(backup_dir, last["filename"])
+
+            now = datetime.now()
+            timestamp = now.strftime("%Y%m%d_%H%M%S")
+            backup_filename = f"{BACKUP_PREFIX}{timestamp}.db"
+            backup_path = os.path.join(backup_dir, backup_filename)
+            tmp_path = backup_path + ".tmp"
+
+            _online_copy(tmp_path)
+            if not verify_backup(tmp_path):
+                raise RuntimeError("integrity_check failed for fresh backup")
+            journal_id = _journal_position(tmp_path)
+            os.replace(tmp_path, backup_path)
+            tmp_path = None
+            backup_path = _compress(backup_path, BACKUP_COMPRESSION)
+            logger.info(f"Backup created: {backup_path}")
+
+            entries = [b for b in manifest["backups"] if b["filename"] != os.path.basename(backup_path)]
+            entries.append({
+                "filename": os.path.basename(backup_path),
+                "size": os.path.getsize(backup_path),
+                "sha256": _sha256(backup_path),
+                "created": now.isoformat(),
+                "journal_id": journal_id,
+            })
+            _save_manifest({"version": 1, "marker": marker, "backups": entries})
+
+            # Ротация по схеме grandfather-father-son
+            cleanup_old_backups()
+
+            return backup_path
     except Exception as e:
         logger.error(f"Failed to create backup: {e}", exc_info=True)
         return None
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def select_retained(entries, now=None, hourly=None, daily=None, weekly=None):
+    """GFS-ротация: какие бэкапы оставить.
+    - все бэкапы за последние `hourly` часов;
+    - самый свежий бэкап каждого дня за последние `daily` дней;
+    - самый свежий бэкап каждой ISO-недели за последние `weekly` недель.
+    Возвращает множество имён файлов."""
+    now = now or datetime.now()
+    hourly = BACKUP_KEEP_HOURLY if hourly is None else hourly
+    daily = BACKUP_KEEP_DAILY if daily is None else daily
+    weekly = BACKUP_KEEP_WEEKLY if weekly is None else weekly
+
+    keep = set()
+    days_seen = set()
+    weeks_seen = set()
+    for e in sorted(entries, key=lambda x: x["created"], reverse=True):
+        created = datetime.fromisoformat(e["created"])
+        age = now - created
+        if age <= timedelta(hours=hourly):
+            keep.add(e["filename"])
+        day = created.date()
+        if day not in days_seen and age <= timedelta(days=daily):
+            days_seen.add(day)
+            keep.add(e["filename"])
+        week = tuple(created.isocalendar()[:2])
+        if week not in weeks_seen and age <= timedelta(weeks=weekly):
+            weeks_seen.add(week)
+            keep.add(e["filename"])
+    return keep
 
-def cleanup_old_backups(days=7):
-    """Удаляет бэкапы старше N дней"""
+def cleanup_old_backups(now=None):
+    """Удаляет бэкапы, не попавшие в GFS-политику хранения (по манифесту, без обхода каталога)"""
     try:
-        backup_dir = get_backup_dir()
-        if not os.path.exists(backup_dir):
-            return
-        
-        from datetime import timedelta
-        cutoff_time = datetime.now() - timedelta(days=days)
-        
-        for filename in os.listdir(backup_dir):
-            if filename.startswith("daily_pilot_backup_"):
-                file_path = os.path.join(backup_dir, filename)
-                file_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-                if file_time < cutoff_time:
-                    os.remove(file_path)
-                    logger.info(f"Removed old backup: {filename}")
+        with _lock:
+            manifest = _load_manifest()
+            keep = select_retained(manifest["backups"], now=now)
+            backup_dir = get_backup_dir()
+            kept = []
+            for e in manifest["backups"]:
+                if e["filename"] in keep:
+                    kept.append(e)
+                    continue
+                try:
+                    os.remove(os.path.join(backup_dir, e["filename"]))
+                except FileNotFoundError:
+                    pass
+                logger.info(f"Removed old backup: {e['filename']}")
+            if len(kept) != len(manifest["backups"]):
+                _save_manifest({**manifest, "backups": kept})
     except Exception as e:
         logger.error(f"Failed to cleanup old backups: {e}", exc_info=True)
 
 def list_backups(limit=10):
-    """Возвращает список последних бэкапов"""
+    """Возвращает список последних бэкапов (из манифеста)"""
     try:
-        backup_dir = get_backup_dir()
-        if not os.path.exists(backup_dir):
-            return []
-        
-        backups = []
-        for filename in os.listdir(backup_dir):
-            if filename.startswith("daily_pilot_backup_"):
-                file_path = os.path.join(backup_dir, filename)
-                file_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-                size = os.path.getsize(file_path)
+        with _lock:
+            manifest = _load_manifest()
+            backup_dir = get_backup_dir()
+            backups = []
+            for e in reversed(manifest["backups"][-limit:] if limit else manifest["backups"]):
                 backups.append({
-                    "filename": filename,
-                    "path": file_path,
-                    "size": size,
-                    "created": file_time
+                    "filename": e["filename"],
+                    "path": os.path.join(backup_dir, e["filename"]),
+                    "size": e["size"],
+                    "sha256": e.get("sha256"),
+                    "journal_id": e.get("journal_id"),
+                    "created": datetime.fromisoformat(e["created"])
                 })
-        
-        backups.sort(key=lambda x: x["created"], reverse=True)
-        return backups[:limit]
+            return backups
     except Exception as e:
         logger.error(f"Failed to list backups: {e}", exc_info=True)
         return []
+
+def backup_summary():
+    """Сводка для /health: количество, общий размер и последний бэкап"""
+    try:
+        with _lock:
+            entries = _load_manifest()["backups"]
+            return {
+                "count": len(entries),
+                "total_size": sum(e["size"] for e in entries),
+                "last": datetime.fromisoformat(entries[-1]["created"]) if entries else None,
+            }
+    except Exception as e:
+        logger.error(f"Failed to summarize backups: {e}", exc_info=True)
+        return {"count": 0, "total_size": 0, "last": None}
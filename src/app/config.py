@@ -1,4 +1,5 @@
 import os
+import json
 import pytz
 from dotenv import load_dotenv
 
@@ -13,3 +14,36 @@ DB_PATH = os.getenv("DB_PATH", "/app/db/daily_pilot.db")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
 TZINFO = pytz.timezone(LOCAL_TZ)
+
+# Бэкапы: сжатие none|gzip|zstd и размер порции страниц для online backup API
+BACKUP_COMPRESSION = os.getenv("BACKUP_COMPRESSION", "none").lower()
+BACKUP_STEP_PAGES = int(os.getenv("BACKUP_STEP_PAGES", "256"))
+# Ротация бэкапов (grandfather-father-son): часы / дни / недели
+BACKUP_KEEP_HOURLY = int(os.getenv("BACKUP_KEEP_HOURLY", "24"))
+BACKUP_KEEP_DAILY = int(os.getenv("BACKUP_KEEP_DAILY", "7"))
+BACKUP_KEEP_WEEKLY = int(os.getenv("BACKUP_KEEP_WEEKLY", "4"))
+# Архив: закрытые (done/dropped) задачи старше стольких дней уходят из tasks в tasks_archive
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "500"))
+# Пересчёт приоритетов открытых задач (срочность зависит от текущего времени), минуты
+PRIORITY_REFRESH_MIN = int(os.getenv("PRIORITY_REFRESH_MIN", "15"))
+# AI-планировщик: сколько минут живёт снимок Goals/Projects и бюджет данных в промпте (токены)
+AI_CONTEXT_TTL_MIN = int(os.getenv("AI_CONTEXT_TTL_MIN", "30"))
+AI_CONTEXT_TOKEN_BUDGET = int(os.getenv("AI_CONTEXT_TOKEN_BUDGET", "2500"))
+# Ключевые слова классификатора задач (keywords.py): подстроки названия в нижнем регистре.
+# Любую группу можно переопределить JSON-файлом TASK_KEYWORDS_FILE ({"important": [...], ...})
+TASK_KEYWORDS = {
+    "important": ["клиент", "доход", "выручка", "счёт", "оплата",
+                  "дет", "здоров", "сон", "гзт", "банк", "налог", "юрист", "легал",
+                  "ai", "бот", "horien", "вб", "озон", "поставка", "логист", "oos"],
+    "frog_bonus": ["лягушк"],
+    "frog": ["лягуш"],
+    "stone": ["камень"],
+    "est_low": ["позвон", "звонок", "письмо", "написать", "отправ", "созвон", "счёт", "напомнить"],
+    "est_mid": ["собрать", "настро", "загруз", "оформ", "опис", "документ", "провер"],
+    "est_high": ["разработ", "бот", "проект", "декомпоз", "презентац", "архитектур"],
+}
+TASK_KEYWORDS_FILE = os.getenv("TASK_KEYWORDS_FILE")
+if TASK_KEYWORDS_FILE:
+    with open(TASK_KEYWORDS_FILE, encoding="utf-8") as f:
+        TASK_KEYWORDS.update(json.load(f))
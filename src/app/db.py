@@ -1,11 +1,28 @@
+import re
 import sqlite3
 import logging
 import os
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timezone
-from .config import DB_PATH
+from .config import DB_PATH, ALLOWED_USER_ID, LOCAL_TZ
+from .instrumentation import timed
 
 logger = logging.getLogger(__name__)
 
+# Колонки tasks, которые попадают в журнал изменений (task_events)
+TASK_COLUMNS = [
+    "id", "chat_id", "title", "description", "context", "due_at", "added_at",
+    "status", "priority", "est_minutes", "source", "closed_at",
+]
+
+# Сроки в целых секундах UTC рядом с ISO-текстом: сравнение строк ломается на
+# смещениях, отличных от +00:00, и не даёт нормальных диапазонных индексов.
+# Колонки генерируемые — SQLite сам пишет их при любой записи due_at/added_at
+# (хендлеры, импорт из Sheets, восстановление из журнала).
+EPOCH_COLUMNS = {"due_epoch": "due_at", "added_epoch": "added_at"}
+
 def db_connect():
     # Создаем директорию если её нет
     try:
@@ -25,6 +42,69 @@ def db_connect():
         logger.error(f"Failed to connect to database at {DB_PATH}: {e}", exc_info=True)
         raise
 
+class ReadOnlyPool:
+    """Пул read-only соединений для фоновых/конкурентных чтений.
+    Каждое соединение используется одним потоком за раз; курсор переиспользуется.
+    Соединение, на котором случилась ошибка БД, закрывается и пересоздаётся при следующем запросе."""
+
+    def __init__(self, size=4, timeout=10.0):
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, check_same_thread=False, timeout=self.timeout)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only=1;")
+        return conn, conn.cursor()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._open()
+                except Exception:
+                    self._created -= 1
+                    raise
+        return self._idle.get(timeout=self.timeout)
+
+    def _discard(self, item):
+        with self._lock:
+            self._created -= 1
+        try:
+            item[0].close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def cursor(self):
+        """Выдаёт курсор пулового соединения"""
+        item = self._acquire()
+        try:
+            yield item[1]
+        except sqlite3.DatabaseError:
+            self._discard(item)
+            item = None
+            raise
+        finally:
+            if item is not None:
+                self._idle.put(item)
+
+    def close(self):
+        while True:
+            try:
+                item = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(item)
+
 def db_init():
     logger.info(f"Initializing database at {DB_PATH}")
     try:
@@ -42,11 +122,67 @@ def db_init():
             status TEXT,          -- open/done/snoozed
             priority REAL,        -- 0..100
             est_minutes INTEGER,  -- оценка длительности
-            source TEXT           -- voice/text
+            source TEXT,          -- voice/text
+            closed_at TEXT,       -- ISO UTC, когда стала done/dropped
+            priority_base REAL    -- кэш не зависящей от времени части priority (см. priority.py)
         );
         """)
-        c.execute("CREATE INDEX IF NOT EXISTS idx_chat_status ON tasks(chat_id, status);")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_due_at ON tasks(due_at);")
+        migrate_epoch_columns(c)
+        migrate_closed_at(c)
+        migrate_priority_base(c)
+        create_indexes(c)
+        create_archive_table(c)
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS task_events(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER NOT NULL,
+            op TEXT NOT NULL,     -- I/U/D/A (A — перенос в архив)
+            at TEXT NOT NULL,     -- UTC, YYYY-MM-DDTHH:MM:SS.SSS
+            row_json TEXT         -- состояние строки после изменения (NULL для D)
+        );
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_task_events_at ON task_events(at);")
+        create_journal_triggers(c)
+        create_fts(c)
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS task_stats_daily(
+            chat_id INTEGER NOT NULL,
+            day TEXT NOT NULL,       -- дата added_at (UTC), YYYY-MM-DD
+            context TEXT NOT NULL,   -- '' если без контекста
+            status TEXT NOT NULL,
+            source TEXT NOT NULL,
+            has_due INTEGER NOT NULL,
+            cnt INTEGER NOT NULL DEFAULT 0,
+            minutes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, day, context, status, source, has_due)
+        ) WITHOUT ROWID;
+        """)
+        create_stats_triggers(c)
+        if c.execute("SELECT 1 FROM task_stats_daily LIMIT 1;").fetchone() is None:
+            rebuild_task_stats(c)
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS tenants(
+            chat_id INTEGER PRIMARY KEY,
+            timezone TEXT NOT NULL,
+            plan_at TEXT NOT NULL DEFAULT '08:00',       -- ежедневный план
+            frog_at TEXT NOT NULL DEFAULT '08:00',       -- пинок про лягушку
+            reflect_at TEXT NOT NULL DEFAULT '21:00',    -- рефлексия
+            rollover_at TEXT NOT NULL DEFAULT '22:00',   -- автоперенос несделанного
+            commit_week_at TEXT NOT NULL DEFAULT '03:00',
+            weekend_at TEXT NOT NULL DEFAULT '22:00',    -- воскресный отчёт
+            sheets_id TEXT,
+            notion_week_db TEXT,
+            notion_days_db TEXT,
+            max_open_tasks INTEGER,                      -- NULL — без лимита
+            active INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT
+        );
+        """)
+        # Однопользовательская установка становится первым тенантом
+        c.execute("""
+          INSERT OR IGNORE INTO tenants(chat_id, timezone, created_at)
+          VALUES (?, ?, ?);
+        """, (ALLOWED_USER_ID, LOCAL_TZ, datetime.now(timezone.utc).isoformat()))
         conn.commit()
         conn.close()
         logger.info("Database initialized successfully")
@@ -54,11 +190,238 @@ def db_init():
         logger.error(f"Failed to initialize database: {e}", exc_info=True)
         raise
 
+def migrate_epoch_columns(c):
+    """Добавляет due_epoch/added_epoch (идемпотентно)"""
+    existing = {r["name"] for r in c.execute("PRAGMA table_xinfo(tasks);").fetchall()}
+    for col, src in EPOCH_COLUMNS.items():
+        if col not in existing:
+            c.execute(f"""
+              ALTER TABLE tasks ADD COLUMN {col} INTEGER
+              GENERATED ALWAYS AS (CAST(strftime('%s', {src}) AS INTEGER)) VIRTUAL;
+            """)
+            logger.info(f"Added column tasks.{col}")
+
+def migrate_closed_at(c):
+    """Добавляет tasks.closed_at; уже закрытым задачам проставляет added_at (точнее не узнать).
+    Снимает триггеры журнала, чтобы заполнение не попало в журнал, — вызывающий создаёт их заново."""
+    existing = {r["name"] for r in c.execute("PRAGMA table_xinfo(tasks);").fetchall()}
+    if "closed_at" not in existing:
+        drop_journal_triggers(c)
+        c.execute("ALTER TABLE tasks ADD COLUMN closed_at TEXT;")
+        c.execute("UPDATE tasks SET closed_at = added_at WHERE status IN ('done','dropped');")
+        logger.info("Added column tasks.closed_at")
+
+def migrate_priority_base(c):
+    """Добавляет tasks.priority_base и триггер, сбрасывающий его при смене названия или оценки"""
+    existing = {r["name"] for r in c.execute("PRAGMA table_xinfo(tasks);").fetchall()}
+    if "priority_base" not in existing:
+        c.execute("ALTER TABLE tasks ADD COLUMN priority_base REAL;")
+        logger.info("Added column tasks.priority_base")
+    c.execute("DROP TRIGGER IF EXISTS trg_tasks_priority_base;")
+    c.execute("""
+    CREATE TRIGGER trg_tasks_priority_base AFTER UPDATE OF title, est_minutes ON tasks BEGIN
+        UPDATE tasks SET priority_base = NULL WHERE id = NEW.id;
+    END;
+    """)
+
+# Индексы tasks под конкретные запросы. Частичные (WHERE status='open') держат только
+# живые задачи и не растут с историей; запрос попадает в частичный индекс, только если
+# в его WHERE буквально есть то же условие. Планы проверяет tests/test_query_plans.py.
+TASK_INDEXES = {
+    # Сроки в чате с фильтром по статусу: list_today, list_week_tasks, list_week_page, list_overdue,
+    # list_midnight_due, open_due_in_windows, сделанное за период в ai_planner
+    "idx_tasks_chat_status_due": "tasks(chat_id, status, due_epoch)",
+    # due_overdues по всем чатам раз в минуту: только открытые, уже в порядке срока.
+    # Покрывающим не сделать: обращение к генерируемой колонке SQLite считает
+    # обращением ко всем колонкам строки
+    "idx_tasks_open_due": "tasks(due_epoch) WHERE status='open'",
+    # list_open_tasks: ORDER BY priority DESC, id DESC — обратный проход по индексу без сортировки
+    "idx_tasks_open_priority": "tasks(chat_id, priority) WHERE status='open'",
+    # Постраничный инбокс: keyset по (priority, id) без сортировки
+    "idx_tasks_inbox": "tasks(chat_id, priority) WHERE status='open' AND due_epoch IS NULL",
+    # Число открытых в чате (лимит тенанта) покрывается idx_tasks_chat_status_due.
+    # Экспорт и отчёты за период добавления
+    "idx_tasks_chat_added": "tasks(chat_id, added_epoch)",
+    # Архиватор: только закрытые задачи; с status выборка id покрывающая
+    "idx_tasks_closed": "tasks(closed_at, status) WHERE status IN ('done','dropped')",
+}
+# Старые индексы, перекрытые набором выше
+OBSOLETE_INDEXES = ("idx_chat_status", "idx_due_at", "idx_tasks_status_due")
+
+def create_indexes(c):
+    """Создаёт индексы TASK_INDEXES и удаляет устаревшие (идемпотентно).
+    Индекс с тем же именем, но другим определением пересоздаётся."""
+    existing = {r["name"]: r["sql"] for r in c.execute("SELECT name, sql FROM sqlite_master WHERE type='index' AND tbl_name='tasks';")}
+    for name, spec in TASK_INDEXES.items():
+        sql = f"CREATE INDEX {name} ON {spec}"
+        if name in existing and existing[name] != sql:
+            c.execute(f"DROP INDEX {name};")
+            logger.info(f"Rebuilding index {name}")
+        c.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {spec};")
+    for name in OBSOLETE_INDEXES:
+        c.execute(f"DROP INDEX IF EXISTS {name};")
+
+def create_archive_table(c):
+    """Холодная таблица tasks_archive и представление tasks_all (tasks + архив) для отчётов"""
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS tasks_archive(
+        id INTEGER PRIMARY KEY,
+        chat_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        description TEXT,
+        context TEXT,
+        due_at TEXT,
+        added_at TEXT,
+        status TEXT,
+        priority REAL,
+        est_minutes INTEGER,
+        source TEXT,
+        closed_at TEXT,
+        archived_at TEXT,
+        due_epoch INTEGER GENERATED ALWAYS AS (CAST(strftime('%s', due_at) AS INTEGER)) VIRTUAL,
+        added_epoch INTEGER GENERATED ALWAYS AS (CAST(strftime('%s', added_at) AS INTEGER)) VIRTUAL
+    );
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_archive_chat_added ON tasks_archive(chat_id, added_epoch);")
+    cols = ", ".join(TASK_COLUMNS + list(EPOCH_COLUMNS))
+    c.execute("DROP VIEW IF EXISTS tasks_all;")
+    c.execute(f"CREATE VIEW tasks_all AS SELECT {cols} FROM tasks UNION ALL SELECT {cols} FROM tasks_archive;")
+
+def create_journal_triggers(c):
+    """(Пере)создаёт триггеры журнала по текущему списку TASK_COLUMNS.
+    Перенос в архив пишется событием 'A' (строка архива), а не 'D' — восстановление
+    из журнала перенесёт задачу в tasks_archive, а не потеряет её."""
+    row_json = "json_object(" + ", ".join(f"'{col}', NEW.{col}" for col in TASK_COLUMNS) + ")"
+    now = "strftime('%Y-%m-%dT%H:%M:%f', 'now')"
+    drop_journal_triggers(c)
+    c.execute(f"""
+    CREATE TRIGGER trg_tasks_journal_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO task_events(task_id, op, at, row_json) VALUES (NEW.id, 'I', {now}, {row_json});
+    END;
+    """)
+    # Пересчёт одного priority (priority.refresh_priorities, каждые несколько минут по всем
+    # открытым задачам) не журналируется: он производный и после восстановления пересчитается
+    journaled = ", ".join(col for col in TASK_COLUMNS if col not in ("id", "priority"))
+    c.execute(f"""
+    CREATE TRIGGER trg_tasks_journal_update AFTER UPDATE OF {journaled} ON tasks BEGIN
+        INSERT INTO task_events(task_id, op, at, row_json) VALUES (NEW.id, 'U', {now}, {row_json});
+    END;
+    """)
+    c.execute(f"""
+    CREATE TRIGGER trg_tasks_journal_delete AFTER DELETE ON tasks
+    WHEN NOT EXISTS (SELECT 1 FROM tasks_archive WHERE id = OLD.id) BEGIN
+        INSERT INTO task_events(task_id, op, at, row_json) VALUES (OLD.id, 'D', {now}, NULL);
+    END;
+    """)
+    c.execute(f"""
+    CREATE TRIGGER trg_tasks_journal_archive AFTER INSERT ON tasks_archive BEGIN
+        INSERT INTO task_events(task_id, op, at, row_json) VALUES (NEW.id, 'A', {now}, {row_json});
+    END;
+    """)
+
+def drop_journal_triggers(c):
+    for name in ("trg_tasks_journal_insert", "trg_tasks_journal_update", "trg_tasks_journal_delete",
+                 "trg_tasks_journal_archive"):
+        c.execute(f"DROP TRIGGER IF EXISTS {name};")
+
+def _fold(expr):
+    """SQL-выражение: ё -> е (unicode61 в FTS5 их не склеивает)"""
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+def create_fts(c):
+    """Полнотекстовый индекс tasks_fts по title/description и триггеры синхронизации.
+    Хранит свёрнутую (ё -> е) копию текста; при первом создании заполняется из tasks.
+    Если SQLite собран без FTS5 — только предупреждение, поиск работает через LIKE."""
+    try:
+        if c.execute("SELECT 1 FROM sqlite_master WHERE name='tasks_fts';").fetchone() is None:
+            c.execute("""
+              CREATE VIRTUAL TABLE tasks_fts USING fts5(title, description, tokenize='unicode61 remove_diacritics 2');
+            """)
+            c.execute(f"""
+              INSERT INTO tasks_fts(rowid, title, description)
+              SELECT id, {_fold('title')}, {_fold("COALESCE(description, '')")} FROM tasks;
+            """)
+            logger.info("Created full-text index tasks_fts")
+    except sqlite3.OperationalError as e:
+        logger.warning(f"FTS5 unavailable, /search falls back to LIKE: {e}")
+        return False
+    row = ", ".join(_fold(x) for x in ("NEW.title", "COALESCE(NEW.description, '')"))
+    for name in ("trg_tasks_fts_insert", "trg_tasks_fts_update", "trg_tasks_fts_delete"):
+        c.execute(f"DROP TRIGGER IF EXISTS {name};")
+    c.execute(f"""
+    CREATE TRIGGER trg_tasks_fts_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts(rowid, title, description) VALUES (NEW.id, {row});
+    END;
+    """)
+    c.execute(f"""
+    CREATE TRIGGER trg_tasks_fts_update AFTER UPDATE OF title, description ON tasks BEGIN
+        DELETE FROM tasks_fts WHERE rowid = OLD.id;
+        INSERT INTO tasks_fts(rowid, title, description) VALUES (NEW.id, {row});
+    END;
+    """)
+    c.execute("CREATE TRIGGER trg_tasks_fts_delete AFTER DELETE ON tasks BEGIN DELETE FROM tasks_fts WHERE rowid = OLD.id; END;")
+    return True
+
+def _stats_key(ref):
+    """Ключ строки свёртки; day — дата added_at по UTC, пояс чата не учитывается"""
+    return (f"{ref}.chat_id, COALESCE(substr({ref}.added_at, 1, 10), ''), COALESCE({ref}.context, ''), "
+            f"COALESCE({ref}.status, ''), COALESCE({ref}.source, ''), ({ref}.due_at IS NOT NULL)")
+
+def _stats_upsert(ref, sign):
+    return f"""
+        INSERT INTO task_stats_daily(chat_id, day, context, status, source, has_due, cnt, minutes)
+        VALUES ({_stats_key(ref)}, {sign}1, {sign}COALESCE({ref}.est_minutes, 0))
+        ON CONFLICT(chat_id, day, context, status, source, has_due)
+        DO UPDATE SET cnt = cnt + excluded.cnt, minutes = minutes + excluded.minutes;
+    """
+
+def create_stats_triggers(c):
+    """Триггеры, поддерживающие task_stats_daily инкрементально"""
+    for name in ("trg_tasks_stats_insert", "trg_tasks_stats_update", "trg_tasks_stats_delete"):
+        c.execute(f"DROP TRIGGER IF EXISTS {name};")
+    c.execute(f"CREATE TRIGGER trg_tasks_stats_insert AFTER INSERT ON tasks BEGIN {_stats_upsert('NEW', '+')} END;")
+    # Перенос в архив статистику не меняет: задача остаётся в tasks_all
+    c.execute(f"""
+    CREATE TRIGGER trg_tasks_stats_delete AFTER DELETE ON tasks
+    WHEN NOT EXISTS (SELECT 1 FROM tasks_archive WHERE id = OLD.id)
+    BEGIN {_stats_upsert('OLD', '-')} END;
+    """)
+    c.execute(f"""
+    CREATE TRIGGER trg_tasks_stats_update AFTER UPDATE OF chat_id, added_at, context, status, source, due_at, est_minutes ON tasks
+    BEGIN
+        {_stats_upsert('OLD', '-')}
+        {_stats_upsert('NEW', '+')}
+    END;
+    """)
+
+def rebuild_task_stats(c):
+    """Полный пересчёт task_stats_daily из tasks и архива"""
+    c.execute("DELETE FROM task_stats_daily;")
+    c.execute("""
+        INSERT INTO task_stats_daily(chat_id, day, context, status, source, has_due, cnt, minutes)
+        SELECT chat_id, COALESCE(substr(added_at, 1, 10), ''), COALESCE(context, ''),
+               COALESCE(status, ''), COALESCE(source, ''), (due_at IS NOT NULL),
+               COUNT(*), COALESCE(SUM(est_minutes), 0)
+        FROM tasks_all
+        GROUP BY 1, 2, 3, 4, 5, 6;
+    """)
+
 def iso_utc(dt):
     if not dt:
         return None
     return dt.astimezone(timezone.utc).isoformat()
 
+def to_epoch(value):
+    """datetime или ISO-строка -> секунды UTC (как due_epoch; строка без смещения — UTC)"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+@timed("db_query", op="add_task")
 def add_task(chat_id, title, description, context_tag, due_at_iso, added_at_iso, priority, est_minutes, source):
     conn = None
     try:
@@ -81,6 +444,38 @@ def add_task(chat_id, title, description, context_tag, due_at_iso, added_at_iso,
         if conn:
             conn.close()
 
+@timed("db_query", op="add_tasks_bulk")
+def add_tasks_bulk(rows):
+    """Вставка многих задач одной транзакцией. rows — кортежи в порядке аргументов add_task
+    (chat_id, title, description, context_tag, due_at_iso, added_at_iso, priority, est_minutes, source).
+    Возвращает id новых задач в порядке rows."""
+    rows = [(r[0], r[1], r[2], r[3], r[4], r[5], "open", r[6], r[7], r[8]) for r in rows]
+    if not rows:
+        return []
+    conn = None
+    try:
+        conn = db_connect()
+        c = conn.cursor()
+        c.executemany("""
+            INSERT INTO tasks(chat_id,title,description,context,due_at,added_at,status,priority,est_minutes,source)
+            VALUES (?,?,?,?,?,?,?,?,?,?);
+        """, rows)
+        # AUTOINCREMENT внутри одной пишущей транзакции выдаёт id подряд: последние len(rows) до seq
+        last = c.execute("SELECT seq FROM sqlite_sequence WHERE name='tasks';").fetchone()["seq"]
+        conn.commit()
+        ids = list(range(last - len(rows) + 1, last + 1))
+        logger.info(f"Added {len(ids)} tasks in bulk (#{ids[0]}..#{ids[-1]})")
+        return ids
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Failed to add tasks in bulk: {e}", exc_info=True)
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+@timed("db_query", op="list_open_tasks")
 def list_open_tasks(chat_id):
     conn = None
     try:
@@ -100,14 +495,17 @@ def list_open_tasks(chat_id):
         if conn:
             conn.close()
 
+@timed("db_query", op="list_inbox")
 def list_inbox(chat_id):
+    """Открытые задачи без срока (и с нераспознаваемым сроком — иначе их нигде не видно).
+    due_epoch IS NULL — поиск по (chat_id, status, due_epoch) без отдельного индекса"""
     conn = None
     try:
         conn = db_connect()
         c = conn.cursor()
         c.execute("""
           SELECT id,title,context,due_at,priority FROM tasks
-          WHERE chat_id=? AND status='open' AND (due_at IS NULL)
+          WHERE chat_id=? AND status='open' AND due_epoch IS NULL
         """, (chat_id,))
         rows = c.fetchall()
         return rows
@@ -118,6 +516,42 @@ def list_inbox(chat_id):
         if conn:
             conn.close()
 
+def _page(rows, limit, cursor_id, backward):
+    """(строки страницы, есть ли предыдущая, есть ли следующая) из выборки на limit+1 строк"""
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        return rows[::-1], more, True
+    return rows, cursor_id is not None, more
+
+@timed("db_query", op="list_inbox_page")
+def list_inbox_page(chat_id, cursor_id=None, backward=False, limit=20):
+    """Страница инбокса в порядке priority DESC, id DESC (keyset-пагинация).
+    cursor_id — задача, после которой (backward=True — перед которой) начинается страница;
+    её priority берётся из БД, поэтому в курсоре достаточно id. priority у задач всегда задан.
+    Возвращает (строки, есть_предыдущая, есть_следующая)."""
+    conn = None
+    try:
+        conn = db_connect()
+        sql = """
+          SELECT id,title,context,due_at,priority FROM tasks
+          WHERE chat_id=? AND status='open' AND due_epoch IS NULL
+        """
+        params = [chat_id]
+        if cursor_id is not None:
+            sql += f" AND (priority, id) {'>' if backward else '<'} ((SELECT priority FROM tasks WHERE id=?), ?)"
+            params += [cursor_id, cursor_id]
+        sql += " ORDER BY priority ASC, id ASC" if backward else " ORDER BY priority DESC, id DESC"
+        rows = conn.execute(sql + " LIMIT ?", params + [limit + 1]).fetchall()
+        return _page(rows, limit, cursor_id, backward)
+    except Exception as e:
+        logger.error(f"Failed to list inbox page: {e}", exc_info=True)
+        return [], False, False
+    finally:
+        if conn:
+            conn.close()
+
+@timed("db_query", op="list_today")
 def list_today(chat_id, now_iso, start_iso, end_iso):
     conn = None
     try:
@@ -126,12 +560,9 @@ def list_today(chat_id, now_iso, start_iso, end_iso):
         c.execute("""
           SELECT id,title,context,due_at,priority,est_minutes FROM tasks
           WHERE chat_id=? AND status='open'
-            AND (
-                (due_at IS NOT NULL AND due_at < ?)
-                OR (due_at IS NOT NULL AND due_at >= ? AND due_at < ?)
-            )
+            AND (due_epoch < ? OR (due_epoch >= ? AND due_epoch < ?))
           ORDER BY priority DESC
-        """, (chat_id, now_iso, start_iso, end_iso))
+        """, (chat_id, to_epoch(now_iso), to_epoch(start_iso), to_epoch(end_iso)))
         rows = c.fetchall()
         return rows
     except Exception as e:
@@ -141,12 +572,14 @@ def list_today(chat_id, now_iso, start_iso, end_iso):
         if conn:
             conn.close()
 
+@timed("db_query", op="mark_done")
 def mark_done(chat_id, task_id):
     conn = None
     try:
         conn = db_connect()
         c = conn.cursor()
-        c.execute("UPDATE tasks SET status='done' WHERE chat_id=? AND id=? AND status!='done';", (chat_id, task_id))
+        c.execute("UPDATE tasks SET status='done', closed_at=? WHERE chat_id=? AND id=? AND status!='done';",
+                  (iso_utc(datetime.now(timezone.utc)), chat_id, task_id))
         changed = c.rowcount
         conn.commit()
         if changed > 0:
@@ -161,6 +594,7 @@ def mark_done(chat_id, task_id):
         if conn:
             conn.close()
 
+@timed("db_query", op="snooze_task")
 def snooze_task(chat_id, task_id, new_due_iso):
     conn = None
     try:
@@ -181,6 +615,7 @@ def snooze_task(chat_id, task_id, new_due_iso):
         if conn:
             conn.close()
 
+@timed("db_query", op="due_overdues")
 def due_overdues(now_iso, limit=5):
     conn = None
     try:
@@ -189,10 +624,10 @@ def due_overdues(now_iso, limit=5):
         c.execute("""
           SELECT id, chat_id, title, due_at
           FROM tasks
-          WHERE status='open' AND due_at IS NOT NULL AND due_at <= ?
-          ORDER BY due_at ASC
+          WHERE status='open' AND due_epoch <= ?
+          ORDER BY due_epoch ASC
           LIMIT ?
-        """, (now_iso, limit))
+        """, (to_epoch(now_iso), limit))
         rows = c.fetchall()
         return rows
     except Exception as e:
@@ -202,13 +637,118 @@ def due_overdues(now_iso, limit=5):
         if conn:
             conn.close()
 
+@timed("db_query", op="open_due_in_windows")
+def open_due_in_windows(windows):
+    """Открытые задачи со сроком в окне своего чата — одним запросом на все чаты.
+    windows: [(chat_id, start_iso, end_iso)]"""
+    if not windows:
+        return []
+    conn = None
+    try:
+        conn = db_connect()
+        values = ",".join(["(?,?,?)"] * len(windows))
+        params = [v for chat_id, start, end in windows for v in (chat_id, to_epoch(start), to_epoch(end))]
+        rows = conn.execute(f"""
+          WITH win(chat_id, start_at, end_at) AS (VALUES {values})
+          SELECT t.id, t.chat_id, t.title, t.due_at, t.est_minutes
+          FROM win w JOIN tasks t ON t.chat_id = w.chat_id
+          WHERE t.status='open' AND t.due_epoch >= w.start_at AND t.due_epoch < w.end_at
+          ORDER BY t.chat_id, t.due_epoch
+        """, params).fetchall()
+        return rows
+    except Exception as e:
+        logger.error(f"Failed to get tasks due in windows: {e}", exc_info=True)
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+@timed("db_query", op="list_overdue")
+def list_overdue(chat_id, now_iso):
+    """Открытые задачи чата со сроком раньше now (диапазон по индексу)"""
+    conn = None
+    try:
+        conn = db_connect()
+        rows = conn.execute("""
+          SELECT id, title, context, due_at, priority, est_minutes
+          FROM tasks
+          WHERE chat_id=? AND status='open' AND due_epoch < ?
+          ORDER BY due_epoch ASC
+        """, (chat_id, to_epoch(now_iso))).fetchall()
+        return rows
+    except Exception as e:
+        logger.error(f"Failed to list overdue tasks: {e}", exc_info=True)
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+@timed("db_query", op="list_midnight_due")
+def list_midnight_due(chat_id, utc_offsets):
+    """Открытые задачи чата со сроком ровно в местную полночь.
+    utc_offsets — смещения пояса чата в секундах (летнее/зимнее время); строка
+    подходит, если полночь при одном из них. Вызывающий сверяет точное смещение
+    на дату задачи — сюда попадают только кандидаты, а не все задачи со сроком."""
+    offsets = sorted(set(utc_offsets))
+    if not offsets:
+        return []
+    conn = None
+    try:
+        conn = db_connect()
+        cond = " OR ".join(["(due_epoch + ?) % 86400 = 0"] * len(offsets))
+        rows = conn.execute(f"""
+          SELECT id, title, context, due_at, priority, est_minutes
+          FROM tasks
+          WHERE chat_id=? AND status='open' AND due_epoch IS NOT NULL AND ({cond})
+          ORDER BY due_epoch ASC
+        """, [chat_id] + offsets).fetchall()
+        return rows
+    except Exception as e:
+        logger.error(f"Failed to list midnight tasks: {e}", exc_info=True)
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+@timed("db_query", op="reschedule_tasks")
+def reschedule_tasks(chat_id, changes, strict=False):
+    """Новые сроки для пачки задач чата одной транзакцией.
+    changes: [(task_id, new_due_iso)]. Возвращает число изменённых задач.
+    strict=True — всё или ничего: если какой-то задачи уже нет, транзакция откатывается (0)."""
+    if not changes:
+        return 0
+    conn = None
+    try:
+        conn = db_connect()
+        c = conn.cursor()
+        c.executemany("UPDATE tasks SET due_at=? WHERE chat_id=? AND id=?;",
+                      [(due_iso, chat_id, task_id) for task_id, due_iso in changes])
+        changed = c.rowcount
+        if strict and changed != len(changes):
+            conn.rollback()
+            logger.warning(f"Reschedule for chat {chat_id} rolled back: {changed} of {len(changes)} tasks found")
+            return 0
+        conn.commit()
+        logger.info(f"Rescheduled {changed} tasks for chat {chat_id}")
+        return changed
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Failed to reschedule tasks: {e}", exc_info=True)
+        return 0
+    finally:
+        if conn:
+            conn.close()
+
+@timed("db_query", op="drop_task")
 def drop_task(chat_id, task_id):
     """Помечает задачу как dropped"""
     conn = None
     try:
         conn = db_connect()
         c = conn.cursor()
-        c.execute("UPDATE tasks SET status='dropped' WHERE chat_id=? AND id=? AND status!='done';", (chat_id, task_id))
+        c.execute("UPDATE tasks SET status='dropped', closed_at=? WHERE chat_id=? AND id=? AND status!='done';",
+                  (iso_utc(datetime.now(timezone.utc)), chat_id, task_id))
         changed = c.rowcount
         conn.commit()
         if changed > 0:
@@ -223,6 +763,39 @@ def drop_task(chat_id, task_id):
         if conn:
             conn.close()
 
+@timed("db_query", op="list_week_page")
+def list_week_page(chat_id, start_iso, end_iso, cursor_id=None, backward=False, limit=20):
+    """Страница задач периода в порядке list_week_tasks (due_epoch ASC, priority DESC, id DESC).
+    Курсор — как в list_inbox_page. Возвращает (строки, есть_предыдущая, есть_следующая)."""
+    conn = None
+    try:
+        conn = db_connect()
+        source, after, params = "tasks", "", []
+        if cursor_id is not None:
+            # Направления сортировки разные — row values не подходят, условие расписано
+            later, higher = ("<", ">") if backward else (">", "<")
+            source += ", (SELECT due_epoch AS d, priority AS p, id AS i FROM tasks WHERE id=?) c"
+            after = f"AND (due_epoch {later} c.d OR (due_epoch = c.d AND (priority {higher} c.p OR (priority = c.p AND id {higher} c.i))))"
+            params.append(cursor_id)
+        order = "due_epoch DESC, priority ASC, id ASC" if backward else "due_epoch ASC, priority DESC, id DESC"
+        sql = f"""
+          SELECT id, title, context, due_at, priority, est_minutes
+          FROM {source}
+          WHERE chat_id=? AND status='open'
+            AND due_epoch >= ? AND due_epoch < ? {after}
+          ORDER BY {order}
+        """
+        params += [chat_id, to_epoch(start_iso), to_epoch(end_iso)]
+        rows = conn.execute(sql + " LIMIT ?", params + [limit + 1]).fetchall()
+        return _page(rows, limit, cursor_id, backward)
+    except Exception as e:
+        logger.error(f"Failed to list week page: {e}", exc_info=True)
+        return [], False, False
+    finally:
+        if conn:
+            conn.close()
+
+@timed("db_query", op="list_week_tasks")
 def list_week_tasks(chat_id, start_iso, end_iso):
     """Список задач на неделю (SQL фильтрация вместо Python)"""
     conn = None
@@ -232,10 +805,10 @@ def list_week_tasks(chat_id, start_iso, end_iso):
         c.execute("""
           SELECT id, title, context, due_at, priority, est_minutes
           FROM tasks
-          WHERE chat_id=? AND status='open' AND due_at IS NOT NULL
-            AND due_at >= ? AND due_at < ?
-          ORDER BY due_at ASC, priority DESC
-        """, (chat_id, start_iso, end_iso))
+          WHERE chat_id=? AND status='open'
+            AND due_epoch >= ? AND due_epoch < ?
+          ORDER BY due_epoch ASC, priority DESC
+        """, (chat_id, to_epoch(start_iso), to_epoch(end_iso)))
         rows = c.fetchall()
         return rows
     except Exception as e:
@@ -244,3 +817,92 @@ def list_week_tasks(chat_id, start_iso, end_iso):
     finally:
         if conn:
             conn.close()
+
+def fts_terms(text):
+    """Слова запроса в виде, в котором они лежат в tasks_fts (нижний регистр, ё -> е)"""
+    return re.findall(r"\w+", (text or "").lower().replace("ё", "е"))
+
+# Маркеры совпадений в highlight/snippet — не встречаются в тексте задач
+MATCH_START, MATCH_END = "\x02", "\x03"
+
+@timed("db_query", op="search_tasks")
+def search_tasks(chat_id, query, limit=10):
+    """Полнотекстовый поиск по задачам чата (открытые и ещё не ушедшие в архив закрытые).
+    Каждое слово ищется как префикс, все слова обязательны; название весит больше описания.
+    Строки: id, title, context, due_at, status, title_hl, snippet — в title_hl/snippet
+    совпадения обрамлены MATCH_START/MATCH_END (snippet пуст, если в описании совпадений нет)."""
+    terms = fts_terms(query)
+    if not terms:
+        return []
+    conn = None
+    try:
+        conn = db_connect()
+        match = " ".join(f'"{t}"*' for t in terms)
+        try:
+            return conn.execute("""
+              SELECT t.id, t.title, t.context, t.due_at, t.status,
+                     highlight(tasks_fts, 0, ?, ?) AS title_hl,
+                     snippet(tasks_fts, 1, ?, ?, '…', 12) AS snippet
+              FROM tasks_fts JOIN tasks t ON t.id = tasks_fts.rowid
+              WHERE tasks_fts MATCH ? AND t.chat_id = ?
+              ORDER BY bm25(tasks_fts, 10.0, 1.0)
+              LIMIT ?
+            """, (MATCH_START, MATCH_END, MATCH_START, MATCH_END, match, chat_id, limit)).fetchall()
+        except sqlite3.OperationalError as e:
+            if "tasks_fts" not in str(e):
+                raise
+            # Без FTS5: все слова — подстроки названия или описания
+            title_col, desc_col = _fold("lower(title)"), _fold("lower(COALESCE(description, ''))")
+            cond = " AND ".join([f"({title_col} LIKE ? OR {desc_col} LIKE ?)"] * len(terms))
+            return conn.execute(f"""
+              SELECT id, title, context, due_at, status, title AS title_hl, '' AS snippet
+              FROM tasks WHERE chat_id = ? AND {cond}
+              ORDER BY status = 'open' DESC, id DESC
+              LIMIT ?
+            """, [chat_id] + [f"%{t}%" for t in terms for _ in (0, 1)] + [limit]).fetchall()
+    except Exception as e:
+        logger.error(f"Failed to search tasks: {e}", exc_info=True)
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+@timed("db_query", op="find_tasks_by_title")
+def find_tasks_by_title(chat_id, title, status="open", limit=None):
+    """Кандидаты на совпадение по названию для сопоставления со строками Sheets:
+    задачи чата, в названии которых есть все слова title, новые первыми (как раньше —
+    совпадение берётся с самой свежей задачи). Точное сравнение — на вызывающем, поэтому
+    по умолчанию без лимита: иначе общие слова вытесняют точное совпадение.
+    Название без слов (только знаки/эмодзи) ищется точным сравнением."""
+    terms = fts_terms(title)
+    limit = -1 if limit is None else limit
+    conn = None
+    try:
+        conn = db_connect()
+        if not terms:
+            return conn.execute("""
+              SELECT id, title, context, due_at FROM tasks
+              WHERE chat_id = ? AND status = ? AND trim(title) = ?
+              ORDER BY id DESC LIMIT ?
+            """, (chat_id, status, (title or "").strip(), limit)).fetchall()
+        match = "title : (" + " ".join(f'"{t}"' for t in terms) + ")"
+        try:
+            return conn.execute("""
+              SELECT t.id, t.title, t.context, t.due_at
+              FROM tasks_fts JOIN tasks t ON t.id = tasks_fts.rowid
+              WHERE tasks_fts MATCH ? AND t.chat_id = ? AND t.status = ?
+              ORDER BY t.id DESC
+              LIMIT ?
+            """, (match, chat_id, status, limit)).fetchall()
+        except sqlite3.OperationalError as e:
+            if "tasks_fts" not in str(e):
+                raise
+            # Без FTS5 — все задачи чата в этом статусе, как раньше
+            return conn.execute("SELECT id, title, context, due_at FROM tasks WHERE chat_id = ? AND status = ? ORDER BY id DESC",
+                                (chat_id, status)).fetchall()
+    except Exception as e:
+        logger.error(f"Failed to find tasks by title: {e}", exc_info=True)
+        return []
+    finally:
+        if conn:
+            conn.close()
@@ -0,0 +1,80 @@
+import io
+import csv
+import gzip
+import json
+import logging
+import tempfile
+from .db import db_connect, to_epoch
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = ["id","title","description","context","due_at","added_at","status","priority","est_minutes","source"]
+# До этого размера файл держится в памяти, дальше уходит на диск
+SPOOL_MAX_BYTES = 1024 * 1024
+
+def _query(chat_id, since_iso=None, until_iso=None, status=None):
+    # tasks_all — живые задачи вместе с архивом
+    sql = f"SELECT {','.join(EXPORT_COLUMNS)} FROM tasks_all WHERE chat_id=?"
+    params = [chat_id]
+    if since_iso:
+        sql += " AND added_epoch >= ?"
+        params.append(to_epoch(since_iso))
+    if until_iso:
+        sql += " AND added_epoch < ?"
+        params.append(to_epoch(until_iso))
+    if status:
+        sql += " AND status=?"
+        params.append(status)
+    sql += " ORDER BY id"
+    return sql, params
+
+def export_tasks(chat_id, fmt="csv", compress=False, since_iso=None, until_iso=None, status=None, chunk=500):
+    """Потоковый экспорт задач чата в CSV/JSONL (опционально gzip).
+    Строки читаются курсором порциями по chunk и сразу пишутся в SpooledTemporaryFile,
+    поэтому память не растёт с размером таблицы. Блокирующая функция — вызывать вне event loop.
+    Возвращает (файл, открытый на чтение с начала, имя файла, число строк)."""
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"Неизвестный формат экспорта: {fmt}")
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode="w+b")
+    raw = gzip.GzipFile(fileobj=spool, mode="wb", compresslevel=6) if compress else spool
+    text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+    conn = None
+    count = 0
+    try:
+        conn = db_connect()
+        c = conn.cursor()
+        sql, params = _query(chat_id, since_iso, until_iso, status)
+        c.execute(sql, params)
+
+        writer = csv.writer(text) if fmt == "csv" else None
+        if writer:
+            writer.writerow(EXPORT_COLUMNS)
+        while True:
+            rows = c.fetchmany(chunk)
+            if not rows:
+                break
+            if writer:
+                writer.writerows(tuple(r) for r in rows)
+            else:
+                for r in rows:
+                    text.write(json.dumps(dict(zip(EXPORT_COLUMNS, r)), ensure_ascii=False))
+                    text.write("\n")
+            count += len(rows)
+
+        text.flush()
+        text.detach()
+        if compress:
+            raw.close()  # дописывает gzip-трейлер, spool остаётся открытым
+        spool.seek(0)
+    except Exception as e:
+        spool.close()
+        logger.error(f"Failed to export tasks: {e}", exc_info=True)
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+    filename = f"daily_pilot_export.{fmt}" + (".gz" if compress else "")
+    logger.info(f"Exported {count} tasks for chat {chat_id} as {filename}")
+    return spool, filename, count
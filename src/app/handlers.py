@@ -9,14 +9,19 @@ from dateutil import tz as dateutil_tz
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ChatAction, ParseMode
 from telegram.ext import ContextTypes, CallbackQueryHandler
-from telegram.error import TelegramError
-from .config import ALLOWED_USER_ID, TZINFO
+from telegram.error import TelegramError, BadRequest
+from .config import TZINFO
 from .db import (
-    add_task, list_inbox, list_open_tasks, list_today,
-    mark_done, snooze_task, iso_utc, list_week_tasks, drop_task
+    add_task, list_inbox_page, list_open_tasks, list_today,
+    mark_done, snooze_task, iso_utc, list_week_page, drop_task,
+    search_tasks, MATCH_START, MATCH_END
 )
 from .ai import transcribe_ogg_to_text, parse_task
 from .metrics import Metrics
+from . import tenants
+from .tzcalendar import day_bounds, local_today
+from .priority import estimate_minutes, compute_priority, refresh_priorities
+from .keywords import task_kind
 from .integrations.sheets import append_reflection
 from .integrations.sheets import get_week_tasks_done_last_7d, get_reflections_last_7d
 from .ai import get_client
@@ -27,67 +32,38 @@ metrics = Metrics()
 
 def ensure_allowed(update: Update) -> bool:
     user_id = update.effective_user.id if update.effective_user else 0
-    return user_id == ALLOWED_USER_ID
+    chat_id = update.effective_chat.id if update.effective_chat else None
+    return tenants.is_allowed(user_id, chat_id)
+
+def _integration_id(update: Update, field):
+    """ID таблицы Sheets / базы Notion текущего чата (None — глобальные из env)"""
+    return tenants.integration_id(update.effective_chat.id, field)
+
+LIMIT_REACHED_TEXT = "⚠️ Достигнут лимит открытых задач для этого чата. Закройте или удалите часть задач (/done, /drop)."
+ADMIN_ONLY_TEXT = "⛔ Команда доступна только администратору."
 
 def now_local():
     return datetime.now(TZINFO)
 
-def parse_human_dt(text: str):
+def chat_tz(update: Update):
+    """Часовой пояс тенанта текущего чата"""
+    return tenants.tenant_tz(update.effective_chat.id)
+
+def local_slot(tz, day, hour, minute):
+    """Местное время hour:minute даты day в поясе tz (через localize, без LMT-смещения pytz)"""
+    return tz.localize(datetime(day.year, day.month, day.day, hour, minute))
+
+def parse_human_dt(text: str, tz=None):
+    """Срок из человеческого текста («завтра 10:00») в поясе tz (по умолчанию TZINFO)"""
+    tz = tz or TZINFO
     settings = {
-        "TIMEZONE": TZINFO.zone,
+        "TIMEZONE": tz.zone,
         "RETURN_AS_TIMEZONE_AWARE": True,
         "PREFER_DATES_FROM": "future",
-        "RELATIVE_BASE": now_local()
+        "RELATIVE_BASE": datetime.now(tz)
     }
     return dateparser.parse(text, settings=settings)
 
-def estimate_minutes(title: str) -> int:
-    low = ["позвон", "звонок", "письмо", "написать", "отправ", "созвон", "счёт", "напомнить"]
-    mid = ["собрать", "настро", "загруз", "оформ", "опис", "документ", "провер"]
-    high = ["разработ", "бот", "проект", "декомпоз", "презентац", "архитектур"]
-    t = title.lower()
-    if any(k in t for k in high): return 90
-    if any(k in t for k in mid):  return 45
-    if any(k in t for k in low):  return 15
-    return 30
-
-IMPORTANT = [
-    "клиент","доход","выручка","счёт","оплата",
-    "дет","здоров","сон","гзт","банк","налог","юрист","легал",
-    "ai","бот","horien","вб","озон","поставка","логист","oos"
-]
-
-def urgency_score(due):
-    if not due: return 10.0
-    now = now_local()
-    delta_h = (due - now).total_seconds() / 3600.0
-    if delta_h <= 0: return 100.0
-    # 12-часовая шкала
-    val = 100.0 * (1.0 / (1.0 + delta_h / 12.0))
-    return max(10.0, min(100.0, val))
-
-def importance_boost(title: str) -> float:
-    t = title.lower()
-    score = 0.0
-    for kw in IMPORTANT:
-        if kw in t:
-            score += 8.0
-    if "лягушк" in t:
-        score += 12.0
-    return score
-
-def duration_bonus(minutes_: int) -> float:
-    if minutes_ <= 25: return +10.0
-    if minutes_ <= 50: return 0.0
-    return -10.0
-
-def compute_priority(title: str, due, est_min: int) -> float:
-    u = urgency_score(due)
-    i = importance_boost(title)
-    d = duration_bonus(est_min)
-    raw = 0.5*u + 0.4*i + 0.1*(50 + d)
-    return max(0.0, min(100.0, raw))
-
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not ensure_allowed(update): return
     await update.message.reply_text(
@@ -99,6 +75,7 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/done <id> - выполнить задачу\n"
         "/snooze <id> <время> - отложить\n"
         "/week - неделя\n"
+        "/search <слова> - поиск задач\n"
         "/export - экспорт CSV\n"
         "/stats - статистика\n"
         "/health - проверка\n\n"
@@ -113,8 +90,12 @@ async def cmd_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not text:
             await update.message.reply_text("Формат: /add <задача> (можно добавить срок: «сегодня 19:00», «завтра», «через 2 часа»)")
             return
+        if tenants.open_tasks_limit_reached(update.effective_chat.id):
+            await update.message.reply_text(LIMIT_REACHED_TEXT)
+            return
         parsed = parse_task(text)
-        due_dt = parse_human_dt(parsed.get("due")) if parsed.get("due") else None
+        tz = chat_tz(update)
+        due_dt = parse_human_dt(parsed.get("due"), tz) if parsed.get("due") else None
         est = estimate_minutes(parsed["title"])
         pr = compute_priority(parsed["title"], due_dt, est)
         tid = add_task(
@@ -125,7 +106,7 @@ async def cmd_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         msg = f"✅ Добавлено #{tid}: *{parsed['title']}*\n"
         if due_dt:
-            msg += f"🗓 {due_dt.astimezone(TZINFO).strftime('%d.%m %H:%M')}\n"
+            msg += f"🗓 {due_dt.astimezone(tz).strftime('%d.%m %H:%M')}\n"
         msg += f"📎 [{parsed['context']}] • ⏱~{est} мин • ⚡{int(pr)}"
         await update.message.reply_text(msg, parse_mode=ParseMode.MARKDOWN)
     except Exception as e:
@@ -135,13 +116,17 @@ async def cmd_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def msg_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not ensure_allowed(update): return
     if not update.message.voice: return
+    if tenants.open_tasks_limit_reached(update.effective_chat.id):
+        await update.message.reply_text(LIMIT_REACHED_TEXT)
+        return
     try:
         await update.message.chat.send_action(ChatAction.TYPING)
         file = await context.bot.get_file(update.message.voice.file_id)
         ogg_bytes = await file.download_as_bytearray()
         text = transcribe_ogg_to_text(bytes(ogg_bytes))
         parsed = parse_task(text)
-        due_dt = parse_human_dt(parsed.get("due")) if parsed.get("due") else None
+        tz = chat_tz(update)
+        due_dt = parse_human_dt(parsed.get("due"), tz) if parsed.get("due") else None
         est = estimate_minutes(parsed["title"])
         pr = compute_priority(parsed["title"], due_dt, est)
         tid = add_task(
@@ -153,48 +138,100 @@ async def msg_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
         msg = (f"🎙 Распознано: _{text}_\n\n"
            f"✅ Добавлено #{tid}: *{parsed['title']}*\n")
         if due_dt:
-            msg += f"🗓 {due_dt.astimezone(TZINFO).strftime('%d.%m %H:%M')}\n"
+            msg += f"🗓 {due_dt.astimezone(tz).strftime('%d.%m %H:%M')}\n"
         msg += f"📎 [{parsed['context']}] • ⏱~{est} мин • ⚡{int(pr)}"
         await update.message.reply_text(msg, parse_mode=ParseMode.MARKDOWN)
     except Exception as e:
         logger.error(f"Error in msg_voice: {e}", exc_info=True)
         await update.message.reply_text("❌ Ошибка при обработке голосового сообщения. Попробуйте ещё раз.")
 
+# Постраничные /inbox и /week: одна страница — одно сообщение, ◀/▶ редактируют его.
+# callback_data: page:inbox:<n|p>:<id> и page:week:<YYYYMMDD>:<n|p>:<id>, где id —
+# последняя (n) или первая (p) задача текущей страницы
+PAGE_SIZE = 15
+PAGE_TITLE_MAX = 150
+
+def _page_title(title):
+    title = title or ""
+    return title if len(title) <= PAGE_TITLE_MAX else title[:PAGE_TITLE_MAX - 1] + "…"
+
+def _page_keyboard(prefix, rows, has_prev, has_next):
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton("◀", callback_data=f"{prefix}:p:{rows[0]['id']}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton("▶", callback_data=f"{prefix}:n:{rows[-1]['id']}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+def inbox_page(chat_id, cursor_id=None, backward=False):
+    """(текст, клавиатура) страницы инбокса; (None, None), если инбокс пуст"""
+    rows, has_prev, has_next = list_inbox_page(chat_id, cursor_id, backward, limit=PAGE_SIZE)
+    if not rows and cursor_id is not None:
+        # Задачи с соседней страницы успели закрыть — начинаем сначала
+        rows, has_prev, has_next = list_inbox_page(chat_id, limit=PAGE_SIZE)
+    if not rows:
+        return None, None
+    lines = ["📥 *Инбокс*:"]
+    for r in rows:
+        lines.append(f"#{r['id']} • {_escape_markdown(_page_title(r['title']))} — [{_escape_markdown(r['context'] or '')}] • ⚡{int(r['priority'] or 0)}")
+    return "\n".join(lines), _page_keyboard("page:inbox", rows, has_prev, has_next)
+
+def week_page(chat_id, tz, first_day, cursor_id=None, backward=False):
+    """(текст, клавиатура) страницы 7 дней начиная с first_day; (None, None), если пусто"""
+    start_iso, end_iso = day_bounds(tz, first_day, days=7)
+    rows, has_prev, has_next = list_week_page(chat_id, start_iso, end_iso, cursor_id, backward, limit=PAGE_SIZE)
+    if not rows and cursor_id is not None:
+        rows, has_prev, has_next = list_week_page(chat_id, start_iso, end_iso, limit=PAGE_SIZE)
+    if not rows:
+        return None, None
+    lines = ["🗓 *Неделя (7 дней)*"]
+    current = ""
+    for r in rows:
+        dt = datetime.fromisoformat(r["due_at"]).astimezone(tz)
+        day = dt.strftime("%a %d.%m")
+        if day != current:
+            current = day
+            lines.append(f"\n*{day}*")
+        lines.append(f"#{r['id']} {_escape_markdown(_page_title(r['title']))} — [{_escape_markdown(r['context'] or '')}] • ⏱~{r['est_minutes'] or 0}м • ⚡{int(r['priority'] or 0)} • {dt.strftime('%H:%M')}")
+    return "\n".join(lines), _page_keyboard(f"page:week:{first_day:%Y%m%d}", rows, has_prev, has_next)
+
 async def cmd_inbox(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not ensure_allowed(update): return
     try:
-        rows = list_inbox(update.effective_chat.id)
-        if not rows:
+        text, keyboard = inbox_page(update.effective_chat.id)
+        if text is None:
             await update.message.reply_text("📥 Инбокс пуст.")
             return
-        lines = ["📥 *Инбокс*:"]
-        for r in rows:
-            tid = r["id"]
-            title = r["title"] if "title" in r.keys() else ""
-            ctx = r["context"] if "context" in r.keys() else ""
-            pr = r["priority"] if "priority" in r.keys() else 0
-            lines.append(f"#{tid} • {_escape_markdown(title)} — [{_escape_markdown(ctx)}] • ⚡{int(pr)}")
-        # Сообщение может быть слишком длинным — режем на части
-        text = "\n".join(lines)
-        max_len = 3800  # чуть меньше лимита Telegram
-        if len(text) <= max_len:
-            await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
-        else:
-            chunk = []
-            size = 0
-            for ln in lines:
-                if size + len(ln) + 1 > max_len:
-                    await update.message.reply_text("\n".join(chunk), parse_mode=ParseMode.MARKDOWN)
-                    chunk = []
-                    size = 0
-                chunk.append(ln)
-                size += len(ln) + 1
-            if chunk:
-                await update.message.reply_text("\n".join(chunk), parse_mode=ParseMode.MARKDOWN)
+        await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN, reply_markup=keyboard)
     except Exception as e:
         logger.error(f"Error in cmd_inbox: {e}", exc_info=True)
         await update.message.reply_text("❌ Ошибка при получении задач.")
 
+async def callback_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """◀/▶ в /inbox и /week: достаёт соседнюю страницу и редактирует то же сообщение"""
+    if not ensure_allowed(update): return
+    query = update.callback_query
+    await query.answer()
+    try:
+        parts = (query.data or "").split(":")
+        chat_id = update.effective_chat.id
+        if parts[1] == "inbox" and len(parts) == 4:
+            text, keyboard = inbox_page(chat_id, int(parts[3]), backward=parts[2] == "p")
+            empty = "📥 Инбокс пуст."
+        elif parts[1] == "week" and len(parts) == 5:
+            first_day = datetime.strptime(parts[2], "%Y%m%d").date()
+            text, keyboard = week_page(chat_id, chat_tz(update), first_day, int(parts[4]), backward=parts[3] == "p")
+            empty = "На неделю пока пусто."
+        else:
+            return
+        await query.edit_message_text(text or empty, parse_mode=ParseMode.MARKDOWN if text else None, reply_markup=keyboard)
+    except BadRequest as e:
+        # Повторное нажатие: страница не изменилась
+        if "not modified" not in str(e).lower():
+            logger.warning(f"Page edit failed: {e}")
+    except Exception as e:
+        logger.error(f"Error in callback_page: {e}", exc_info=True)
+
 def _norm_title(s: str) -> str:
     s = (s or "").strip().lower()
     s = re.sub(r"[^\w\s\-]+", "", s, flags=re.U)   # убрать знаки
@@ -308,7 +345,7 @@ def check_time_overload(tasks: list, day_date: date) -> tuple:
     overload_percent = ((total_minutes / available_minutes) * 100) if available_minutes > 0 else 0
     return (is_overloaded, total_minutes, available_minutes, overload_percent)
 
-def _pick_plan(rows, target_date=None):
+def _pick_plan(rows, target_date=None, tz=None):
     """
     Умный выбор задач на день с учётом:
     - Доступного времени пользователя
@@ -317,8 +354,12 @@ def _pick_plan(rows, target_date=None):
     
     Args:
         rows: список задач
-        target_date: дата для планирования (по умолчанию - сегодня)
+        target_date: дата для планирования (по умолчанию - сегодня в поясе tz)
+        tz: часовой пояс чата (по умолчанию TZINFO)
     """
+    tz = tz or TZINFO
+    # sqlite3.Row не поддерживает .get — работаем со словарями
+    rows = [dict(r) for r in rows]
     # ДОБАВЛЕНО: антидубли
     rows, _reps = _dedupe_rows(rows)
 
@@ -327,7 +368,7 @@ def _pick_plan(rows, target_date=None):
     
     # Получаем целевую дату для расчёта доступного времени
     if target_date is None:
-        target_date = now_local().date()
+        target_date = datetime.now(tz).date()
     available_minutes = get_available_time_minutes(target_date)
     
     # Классифицируем задачи по времени дедлайна или названию
@@ -351,8 +392,7 @@ def _pick_plan(rows, target_date=None):
         due_at = r["due_at"] if "due_at" in r.keys() and r["due_at"] else None
         if due_at:
             try:
-                from datetime import datetime
-                dt = datetime.fromisoformat(due_at).astimezone(TZINFO)
+                dt = datetime.fromisoformat(due_at).astimezone(tz)
                 hour = dt.hour
                 # Лягушка: 08:00-12:00
                 if 8 <= hour < 12:
@@ -367,12 +407,8 @@ def _pick_plan(rows, target_date=None):
         
         # Если не определили по времени, проверяем название
         if not is_frog and not is_stone:
-            title = r["title"] if "title" in r.keys() else ""
-            title_lower = (title or "").lower()
-            if "лягуш" in title_lower:
-                is_frog = True
-            elif "камень" in title_lower:
-                is_stone = True
+            kind = task_kind(r["title"] if "title" in r.keys() else "")
+            is_frog, is_stone = kind == "frog", kind == "stone"
         
         # Распределяем по категориям
         if is_frog:
@@ -436,35 +472,36 @@ def _escape_markdown(text: str) -> str:
         text = text.replace(char, f'\\{char}')
     return text
 
+def _plan_line(r, tz=None):
+    """Строка задачи в плане: id, название, контекст, приоритет, оценка, время (в поясе tz)"""
+    due_str = ""
+    if r["due_at"]:
+        dt = datetime.fromisoformat(r["due_at"]).astimezone(tz or TZINFO)
+        due_str = f" • 🗓 {dt.strftime('%H:%M')}"
+    keys = r.keys()
+    title = r["title"] if "title" in keys else ""
+    context = r["context"] if "context" in keys else ""
+    est_minutes = (r["est_minutes"] if "est_minutes" in keys else 0) or 0
+    priority = (r["priority"] if "priority" in keys else 0) or 0
+    return f"#{r['id']} {_escape_markdown(title)} — [{_escape_markdown(context or '')}] • ⚡{int(priority)} • ⏱~{est_minutes}м{due_str}"
+
 async def cmd_plan(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not ensure_allowed(update): return
     try:
-        now = now_local()
-    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    end = start + timedelta(days=1)
-    rows = list_today(update.effective_chat.id, iso_utc(now), iso_utc(start), iso_utc(end))
-    if not rows:
-        rows = list_open_tasks(update.effective_chat.id)[:10]
-    frog, stones, sand = _pick_plan(rows)
+        tz = chat_tz(update)
+        now = datetime.now(tz)
+        start_iso, end_iso = day_bounds(tz, now.date())
+        rows = list_today(update.effective_chat.id, iso_utc(now), start_iso, end_iso)
+        if not rows:
+            rows = list_open_tasks(update.effective_chat.id)[:10]
+        today = now.date()
+        frog, stones, sand = _pick_plan(rows, today, tz)
         
         # Проверяем перегрузку по времени
         all_selected = frog + stones + sand
-        today = now.date()
         is_overloaded, total_minutes, available_minutes, overload_percent = check_time_overload(all_selected, today)
-        
-    def fmt(r):
-        due_str = ""
-        if r["due_at"]:
-            from datetime import datetime
-            dt = datetime.fromisoformat(r["due_at"]).astimezone(TZINFO)
-            due_str = f" • 🗓 {dt.strftime('%H:%M')}"
-            title = r["title"] if "title" in r.keys() else ""
-            context = r["context"] if "context" in r.keys() else ""
-            est_minutes = r.get("est_minutes", 0) or 0
-            priority = r.get("priority", 0) or 0
-            return f"#{r['id']} {_escape_markdown(title)} — [{_escape_markdown(context)}] • ⚡{int(priority)} • ⏱~{est_minutes}м{due_str}"
-
-    out = ["📅 *План на сегодня*"]
+
+        out = ["📅 *План на сегодня*"]
         
         # Информация о времени
         weekday_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
@@ -479,17 +516,17 @@ async def cmd_plan(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             out.append(f"\n⏱ *Время:* {used_hours:.1f}ч / {available_hours:.1f}ч ({weekday_name})")
         
-    if frog:
-        out.append("\n🐸 *ЛЯГУШКА*")
-        out += [fmt(x) for x in frog]
-    if stones:
-        out.append("\n◼︎ *КАМНИ*")
-        out += [fmt(x) for x in stones]
-    if sand:
-        out.append("\n▫︎ *ПЕСОК*")
-            out += [fmt(x) for x in sand[:5]]
+        if frog:
+            out.append("\n🐸 *ЛЯГУШКА*")
+            out += [_plan_line(x, tz) for x in frog]
+        if stones:
+            out.append("\n◼︎ *КАМНИ*")
+            out += [_plan_line(x, tz) for x in stones]
+        if sand:
+            out.append("\n▫︎ *ПЕСОК*")
+            out += [_plan_line(x, tz) for x in sand[:5]]
         
-    await update.message.reply_text("\n".join(out), parse_mode=ParseMode.MARKDOWN)
+        await update.message.reply_text("\n".join(out), parse_mode=ParseMode.MARKDOWN)
     except Exception as e:
         logger.error(f"Error in cmd_plan: {e}", exc_info=True)
         await update.message.reply_text("❌ Ошибка при формировании плана.")
@@ -498,7 +535,7 @@ async def cmd_plan_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """План на указанную дату в формате ISO (например: 2025-11-05) с учётом доступного времени"""
     if not ensure_allowed(update): return
     try:
-        try:
+        if not context.args:
             await update.message.reply_text(
                 "📅 Использование: `/plan_date 2025-11-05`\n"
                 "Формат даты: YYYY-MM-DD (ISO)",
@@ -514,33 +551,21 @@ async def cmd_plan_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         # Формируем диапазон для выбранной даты
-        start = datetime.combine(target_date, datetime.min.time()).replace(tzinfo=TZINFO)
-        end = start + timedelta(days=1)
+        tz = chat_tz(update)
+        start_iso, end_iso = day_bounds(tz, target_date)
         
         # Получаем задачи на эту дату
-        rows = list_today(update.effective_chat.id, iso_utc(now_local()), iso_utc(start), iso_utc(end))
+        rows = list_today(update.effective_chat.id, iso_utc(datetime.now(tz)), start_iso, end_iso)
         if not rows:
             # Если нет задач на конкретную дату, показываем открытые задачи
             rows = list_open_tasks(update.effective_chat.id)[:10]
         
-        frog, stones, sand = _pick_plan(rows, target_date)
+        frog, stones, sand = _pick_plan(rows, target_date, tz)
         
         # Проверяем перегрузку по времени
         all_selected = frog + stones + sand
         is_overloaded, total_minutes, available_minutes, overload_percent = check_time_overload(all_selected, target_date)
         
-        def fmt(r):
-            due_str = ""
-            if r["due_at"]:
-                from datetime import datetime
-                dt = datetime.fromisoformat(r["due_at"]).astimezone(TZINFO)
-                due_str = f" • 🗓 {dt.strftime('%H:%M')}"
-            title = r["title"] if "title" in r.keys() else ""
-            context = r["context"] if "context" in r.keys() else ""
-            est_minutes = r.get("est_minutes", 0) or 0
-            priority = r.get("priority", 0) or 0
-            return f"#{r['id']} {_escape_markdown(title)} — [{_escape_markdown(context)}] • ⚡{int(priority)} • ⏱~{est_minutes}м{due_str}"
-
         date_display = target_date.strftime("%d.%m.%Y")
         weekday_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
         weekday_name = weekday_names[target_date.weekday()]
@@ -558,13 +583,13 @@ async def cmd_plan_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
             out.append(f"\n⏱ *Время:* {used_hours:.1f}ч / {available_hours:.1f}ч")
         if frog:
             out.append("\n🐸 *ЛЯГУШКА*")
-            out += [fmt(x) for x in frog]
+            out += [_plan_line(x, tz) for x in frog]
         if stones:
             out.append("\n◼︎ *КАМНИ*")
-            out += [fmt(x) for x in stones]
+            out += [_plan_line(x, tz) for x in stones]
         if sand:
             out.append("\n▫︎ *ПЕСОК*")
-            out += [fmt(x) for x in sand[:5]]
+            out += [_plan_line(x, tz) for x in sand[:5]]
         
         if not frog and not stones and not sand:
             out.append("\n_Нет задач на эту дату._")
@@ -576,39 +601,39 @@ async def cmd_plan_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def cmd_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not ensure_allowed(update): return
-        if not context.args:
-    if not context.args:
-        await update.message.reply_text("Формат: /done <id>")
-        return
     try:
-        tid = int(context.args[0])
-    except ValueError:
-        await update.message.reply_text("id должен быть числом.")
-        return
-    ok = mark_done(update.effective_chat.id, tid)
-    await update.message.reply_text("✅ Готово." if ok else "Не нашёл открытую задачу с таким id.")
+        if not context.args:
+            await update.message.reply_text("Формат: /done <id>")
+            return
+        try:
+            tid = int(context.args[0])
+        except ValueError:
+            await update.message.reply_text("id должен быть числом.")
+            return
+        ok = mark_done(update.effective_chat.id, tid)
+        await update.message.reply_text("✅ Готово." if ok else "Не нашёл открытую задачу с таким id.")
     except Exception as e:
         logger.error(f"Error in cmd_done: {e}", exc_info=True)
         await update.message.reply_text("❌ Ошибка при выполнении задачи.")
 
 async def cmd_snooze(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not ensure_allowed(update): return
-        if len(context.args) < 2:
-    if len(context.args) < 2:
-        await update.message.reply_text("Формат: /snooze <id> <когда> (пример: /snooze 12 завтра 10:00)")
-        return
     try:
-        tid = int(context.args[0])
-    except ValueError:
-        await update.message.reply_text("id должен быть числом.")
-        return
-    when = " ".join(context.args[1:])
-    new_due = parse_human_dt(when)
-    if not new_due:
-        await update.message.reply_text("Не понял дату. Пример: завтра 10:00")
-        return
-    ok = snooze_task(update.effective_chat.id, tid, iso_utc(new_due))
-    await update.message.reply_text("⏳ Перенёс." if ok else "Не нашёл задачу.")
+        if len(context.args) < 2:
+            await update.message.reply_text("Формат: /snooze <id> <когда> (пример: /snooze 12 завтра 10:00)")
+            return
+        try:
+            tid = int(context.args[0])
+        except ValueError:
+            await update.message.reply_text("id должен быть числом.")
+            return
+        when = " ".join(context.args[1:])
+        new_due = parse_human_dt(when, chat_tz(update))
+        if not new_due:
+            await update.message.reply_text("Не понял дату. Пример: завтра 10:00")
+            return
+        ok = snooze_task(update.effective_chat.id, tid, iso_utc(new_due))
+        await update.message.reply_text("⏳ Перенёс." if ok else "Не нашёл задачу.")
     except Exception as e:
         logger.error(f"Error in cmd_snooze: {e}", exc_info=True)
         await update.message.reply_text("❌ Ошибка при переносе задачи.")
@@ -617,7 +642,7 @@ async def cmd_drop(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Убирает задачу из плана (помечает как dropped)"""
     if not ensure_allowed(update): return
     try:
-        try:
+        if not context.args:
             await update.message.reply_text("Формат: /drop <id>")
             return
         try:
@@ -631,102 +656,133 @@ async def cmd_drop(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Error in cmd_drop: {e}", exc_info=True)
         await update.message.reply_text("❌ Ошибка при удалении задачи.")
 
+async def cmd_reprioritize(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Пересчёт приоритетов открытых задач чата по текущему времени (обычно идёт сам по расписанию)"""
+    if not ensure_allowed(update): return
+    try:
+        changed = refresh_priorities(update.effective_chat.id)
+        await update.message.reply_text(f"⚡ Приоритеты пересчитаны: изменилось у {changed} задач.")
+    except Exception as e:
+        logger.error(f"Error in cmd_reprioritize: {e}", exc_info=True)
+        await update.message.reply_text("❌ Ошибка пересчёта приоритетов.")
+
+SEARCH_LIMIT = 10
+SEARCH_STATUS_ICONS = {"open": "•", "done": "✅", "dropped": "🗑"}
+
+def _search_marked(text):
+    """Совпадения из search_tasks -> *жирный* Markdown"""
+    return _escape_markdown(text).replace(MATCH_START, "*").replace(MATCH_END, "*")
+
+async def cmd_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Полнотекстовый поиск по названиям и описаниям задач чата"""
+    if not ensure_allowed(update): return
+    try:
+        query = " ".join(context.args or []).strip()
+        if not query:
+            await update.message.reply_text("Формат: /search <слова> (пример: /search бюджет отчёт)")
+            return
+        rows = search_tasks(update.effective_chat.id, query, limit=SEARCH_LIMIT)
+        if not rows:
+            await update.message.reply_text("🔍 Ничего не нашёл.")
+            return
+        tz = chat_tz(update)
+        lines = [f"🔍 *Поиск*: {_escape_markdown(query)}"]
+        for r in rows:
+            line = f"{SEARCH_STATUS_ICONS.get(r['status'], '•')} #{r['id']} {_search_marked(r['title_hl'])}"
+            if r["context"]:
+                line += f" — [{_escape_markdown(r['context'])}]"
+            if r["due_at"]:
+                line += f" • {datetime.fromisoformat(r['due_at']).astimezone(tz):%d.%m %H:%M}"
+            lines.append(line)
+            if MATCH_START in (r["snippet"] or ""):
+                lines.append(f"    {_search_marked(r['snippet'])}")
+        await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.MARKDOWN)
+    except Exception as e:
+        logger.error(f"Error in cmd_search: {e}", exc_info=True)
+        await update.message.reply_text("❌ Ошибка поиска.")
+
 async def cmd_week(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not ensure_allowed(update): return
-        now = now_local().replace(hour=0, minute=0, second=0, microsecond=0)
-    now = now_local().replace(hour=0, minute=0, second=0, microsecond=0)
-    end = now + timedelta(days=7)
-        # Используем SQL фильтрацию вместо Python
-        rows = list_week_tasks(update.effective_chat.id, iso_utc(now), iso_utc(end))
-    if not rows:
-        await update.message.reply_text("На неделю пока пусто.")
-        return
-    lines = ["🗓 *Неделя (7 дней)*"]
-    current = ""
-    for r in rows:
-            from datetime import datetime
-        dt = datetime.fromisoformat(r["due_at"]).astimezone(TZINFO)
-        day = dt.strftime("%a %d.%m")
-        if day != current:
-            current = day
-            lines.append(f"\n*{day}*")
-            title = r["title"] if "title" in r.keys() else ""
-            context = r["context"] if "context" in r.keys() else ""
-            est_minutes = r.get("est_minutes", 0) or 0
-            priority = r.get("priority", 0) or 0
-            lines.append(f"#{r['id']} {_escape_markdown(title)} — [{_escape_markdown(context)}] • ⏱~{est_minutes}м • ⚡{int(priority)} • {dt.strftime('%H:%M')}")
-        # Пагинация: Telegram ограничивает длину сообщения
-        text = "\n".join(lines)
-        max_len = 3800
-        if len(text) <= max_len:
-            await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
-        else:
-            chunk = []
-            size = 0
-            for ln in lines:
-                if size + len(ln) + 1 > max_len:
-                    await update.message.reply_text("\n".join(chunk), parse_mode=ParseMode.MARKDOWN)
-                    chunk = []
-                    size = 0
-                chunk.append(ln)
-                size += len(ln) + 1
-            if chunk:
-                await update.message.reply_text("\n".join(chunk), parse_mode=ParseMode.MARKDOWN)
+    try:
+        tz = chat_tz(update)
+        text, keyboard = week_page(update.effective_chat.id, tz, local_today(tz))
+        if text is None:
+            await update.message.reply_text("На неделю пока пусто.")
+            return
+        await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN, reply_markup=keyboard)
     except Exception as e:
         logger.error(f"Error in cmd_week: {e}", exc_info=True)
         await update.message.reply_text("❌ Ошибка при получении плана на неделю.")
 
+def export_bounds(tz, dates):
+    """(since_iso, until_iso) для /export: с начала первой даты по конец второй, местные сутки tz"""
+    since_iso = day_bounds(tz, dates[0])[0] if dates else None
+    until_iso = day_bounds(tz, dates[1])[1] if len(dates) > 1 else None
+    return since_iso, until_iso
+
 async def cmd_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Экспорт задач текущего чата.
+    Использование: /export [csv|jsonl] [gz] [open|done|dropped] [с YYYY-MM-DD] [по YYYY-MM-DD]
+    Даты фильтруют по дате добавления задачи.
+    """
     if not ensure_allowed(update): return
-    conn = None
-        import csv, io
-    import csv, io
-    from .db import db_connect
-    conn = db_connect()
-    c = conn.cursor()
-    c.execute("SELECT id,title,description,context,due_at,added_at,status,priority,est_minutes,source FROM tasks ORDER BY id;")
-    rows = c.fetchall()
-    buf = io.StringIO()
-    w = csv.writer(buf)
-    w.writerow(["id","title","description","context","due_at","added_at","status","priority","est_minutes","source"])
-    for r in rows:
-        w.writerow([r["id"],r["title"],r["description"],r["context"],r["due_at"],r["added_at"],r["status"],r["priority"],r["est_minutes"],r["source"]])
-    await update.message.reply_document(document=buf.getvalue().encode("utf-8"), filename="daily_pilot_export.csv", caption="Экспорт задач (CSV)")
+    spool = None
+    try:
+        import asyncio
+        from .export import export_tasks
+
+        fmt, compress, status = "csv", False, None
+        dates = []
+        for arg in context.args or []:
+            a = arg.strip().lower()
+            if a in ("csv", "jsonl"):
+                fmt = a
+            elif a in ("gz", "gzip"):
+                compress = True
+            elif a in ("open", "done", "dropped"):
+                status = a
+            else:
+                try:
+                    dates.append(datetime.strptime(a, "%Y-%m-%d").date())
+                except ValueError:
+                    await update.message.reply_text(
+                        "Формат: /export [csv|jsonl] [gz] [open|done|dropped] [YYYY-MM-DD] [YYYY-MM-DD]"
+                    )
+                    return
+        since_iso, until_iso = export_bounds(chat_tz(update), dates)
+
+        # Чтение БД и запись файла — вне event loop
+        loop = asyncio.get_running_loop()
+        spool, filename, count = await loop.run_in_executor(
+            None, lambda: export_tasks(update.effective_chat.id, fmt, compress, since_iso, until_iso, status)
+        )
+        await update.message.reply_document(
+            document=spool, filename=filename,
+            caption=f"Экспорт задач ({fmt.upper()}{', gzip' if compress else ''}): {count}"
+        )
     except Exception as e:
         logger.error(f"Error in cmd_export: {e}", exc_info=True)
         await update.message.reply_text("❌ Ошибка при экспорте данных.")
     finally:
-        if conn:
-            conn.close()
+        if spool:
+            spool.close()
 
 async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not ensure_allowed(update): return
     try:
-        try:
+        import asyncio
+        # Metrics потокобезопасен (пул read-only соединений) — читаем вне event loop
+        loop = asyncio.get_running_loop()
+        chat_id = update.effective_chat.id
+        stats = await loop.run_in_executor(None, metrics.get_stats, chat_id)
         if not stats:
             await update.message.reply_text("❌ Ошибка при получении статистики.")
             return
         
-        productivity = metrics.get_productivity_score(update.effective_chat.id)
-        
-        # Получаем статистику по контекстам
-        from .db import db_connect
-        conn = db_connect()
-        c = conn.cursor()
+        productivity = await loop.run_in_executor(None, metrics.get_productivity_score, chat_id)
         
-        # Статистика по контекстам (выполнено и открыто)
-        c.execute("""
-            SELECT context,
-                   SUM(CASE WHEN status='done' THEN 1 ELSE 0 END) as done_count,
-                   SUM(CASE WHEN status='open' THEN 1 ELSE 0 END) as open_count,
-                   COUNT(*) as total_count
-            FROM tasks
-            WHERE chat_id=?
-            GROUP BY context
-            ORDER BY total_count DESC
-        """, (update.effective_chat.id,))
-        context_stats = c.fetchall()
-        conn.close()
+        # Статистика по контекстам (выполнено и открыто) — из свёртки task_stats_daily
+        context_stats = await loop.run_in_executor(None, metrics.get_context_stats, chat_id)
         
         lines = ["📊 *Статистика*"]
         lines.append(f"\n📝 Всего задач: {stats['total_tasks']}")
@@ -766,7 +822,7 @@ async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cmd_health(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not ensure_allowed(update): return
     try:
-        try:
+        import sys
         import platform
         from .config import DB_PATH
         import os
@@ -783,26 +839,161 @@ async def cmd_health(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             lines.append("❌ DB: не найдена")
         
-        # Проверка бэкапов
-        from .backup import list_backups
-        backups = list_backups(1)
-        if backups:
-            lines.append(f"💾 Backups: {len(backups)} последний")
+        # Проверка бэкапов (по манифесту, без обхода каталога)
+        from .backup import backup_summary
+        summary = backup_summary()
+        if summary["last"]:
+            lines.append(
+                f"💾 Backups: {summary['count']} шт., {round(summary['total_size']/1024, 1)} КБ, "
+                f"последний {summary['last'].strftime('%d.%m %H:%M')}"
+            )
         else:
             lines.append("⚠️ Backups: нет бэкапов")
         
+        # Сторож event loop и латентность — по всему процессу (всем чатам), только администратору
+        is_admin = tenants.is_admin(update.effective_user.id)
+        from .watchdog import watchdog_summary
+        wd = watchdog_summary() if is_admin else None
+        if wd:
+            lag = f"{wd['lag_p95_s'] * 1000:.0f}мс" if wd["lag_p95_s"] is not None else "—"
+            status = "✅" if not wd["stalls"] else "⚠️"
+            lines.append(f"\n{status} Event loop: лаг p95 {lag}, max {wd['max_lag_s'] * 1000:.0f}мс, "
+                         f"остановок {wd['stalls']}, медленных колбэков {wd['slow_callbacks']}")
+            if wd["last_stall"]:
+                ls = wd["last_stall"]
+                when = datetime.fromtimestamp(ls["at"], TZINFO).strftime("%d.%m %H:%M")
+                lines.append(_escape_markdown(f"  последняя: {when}, {ls['lag_s'] * 1000:.0f}мс, "
+                                              f"{ls['handler'] or 'unknown'} @ {ls['frame'] or '?'}"))
+        
+        # Латентность горячих путей (из instrumentation)
+        from .instrumentation import format_latency_summary
+        for title, metric, label in (
+            ("⏱ Команды", "handler_seconds", "handler"),
+            ("🗄 DB", "db_query_seconds", "op"),
+            ("🤖 LLM", "llm_call_seconds", "op"),
+            ("🔗 Интеграции", "integration_call_seconds", "op"),
+        ) if is_admin else ():
+            latency = format_latency_summary(metric, label, top=3)
+            if latency:
+                lines.append(f"\n{title} (p95 top-3):")
+                lines += [_escape_markdown(l) for l in latency]
+        
         await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.MARKDOWN)
     except Exception as e:
         logger.error(f"Error in cmd_health: {e}", exc_info=True)
         await update.message.reply_text("❌ Ошибка при проверке здоровья.")
 
+async def cmd_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Профилирование живого процесса (только администратор: в профиль попадают запросы всех чатов).
+    Использование: /profile [30s|2m] [sample|cprofile]
+    Включается переменной PROFILER_ENABLED=1.
+    """
+    if not ensure_allowed(update): return
+    if not tenants.is_admin(update.effective_user.id):
+        await update.message.reply_text(ADMIN_ONLY_TEXT)
+        return
+    import os
+    from .profiler import PROFILER_ENABLED, profile_for, parse_duration
+    if not PROFILER_ENABLED:
+        await update.message.reply_text("Профайлер выключен (PROFILER_ENABLED=1 чтобы включить).")
+        return
+    result = None
+    try:
+        seconds, mode = 30, "sample"
+        for arg in context.args or []:
+            a = arg.strip().lower()
+            if a in ("sample", "cprofile"):
+                mode = a
+            else:
+                try:
+                    seconds = parse_duration(a)
+                except ValueError:
+                    await update.message.reply_text("Формат: /profile [30s|2m] [sample|cprofile]")
+                    return
+        await update.message.reply_text(f"⏱ Профилирую {seconds} с ({mode})...")
+        result = await profile_for(seconds, mode)
+
+        stalls = result["stalls"]
+        lines = [f"Профиль {result['mode']} за {result['seconds']} с"]
+        if result["samples"] is not None:
+            lines.append(f"Сэмплов: {result['samples']}")
+        lines.append(f"Остановок event loop: {stalls['count']} "
+                     f"(max {stalls['max_s'] * 1000:.0f} мс, всего {stalls['total_s']:.2f} с)")
+        lines.append("")
+        lines.append("Горячие кадры:" if mode == "sample" else "Топ по cumulative time:")
+        for frame, value in result["top"]:
+            lines.append(f"  {value * 100:.1f}% {frame}" if mode == "sample" else f"  {value:.3f} с {frame}")
+        with open(result["path"], "rb") as f:
+            await update.message.reply_document(
+                document=f, filename=result["filename"], caption="\n".join(lines)[:1024]
+            )
+    except RuntimeError as e:
+        await update.message.reply_text(f"⚠️ {e}")
+    except Exception as e:
+        logger.error(f"Error in cmd_profile: {e}", exc_info=True)
+        await update.message.reply_text("❌ Ошибка профилирования.")
+    finally:
+        if result and os.path.exists(result["path"]):
+            os.remove(result["path"])
+
+TENANT_USAGE = (
+    "Формат:\n"
+    "/tenant list\n"
+    "/tenant add <chat_id> [часовой пояс]\n"
+    "/tenant off <chat_id>\n"
+    "/tenant set <chat_id> <поле> <значение>\n"
+    "Поля: " + ", ".join(tenants.TENANT_FIELDS)
+)
+
+def _tenant_line(t):
+    line = (f"{'✅' if t['active'] else '⛔'} {t['chat_id']} • {t['timezone']} • "
+            f"план {t['plan_at']} • перенос {t['rollover_at']}")
+    if t["max_open_tasks"]:
+        line += f" • лимит {t['max_open_tasks']}"
+    if t["sheets_id"]:
+        line += " • Sheets"
+    if t["notion_week_db"] or t["notion_days_db"]:
+        line += " • Notion"
+    return line
+
+async def cmd_tenant(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Управление чатами-тенантами (только администратор)"""
+    if not ensure_allowed(update): return
+    if not tenants.is_admin(update.effective_user.id):
+        await update.message.reply_text(ADMIN_ONLY_TEXT)
+        return
+    args = context.args or []
+    action = args[0].lower() if args else "list"
+    try:
+        if action == "list":
+            tenants.invalidate()
+            rows = sorted(tenants.get_all_tenants(), key=lambda t: t["chat_id"])
+            lines = ["👥 Тенанты:"] + [_tenant_line(t) for t in rows]
+            await update.message.reply_text("\n".join(lines) if rows else "Тенантов нет.")
+        elif action == "add" and len(args) >= 2:
+            t = tenants.add_tenant(int(args[1]), args[2] if len(args) >= 3 else tenants.LOCAL_TZ)
+            await update.message.reply_text(f"✅ Тенант добавлен:\n{_tenant_line(t)}")
+        elif action == "off" and len(args) >= 2:
+            ok = tenants.deactivate_tenant(int(args[1]))
+            await update.message.reply_text("✅ Тенант отключён." if ok else "Тенант не найден.")
+        elif action == "set" and len(args) >= 4:
+            ok = tenants.set_tenant(int(args[1]), args[2], " ".join(args[3:]))
+            await update.message.reply_text("✅ Сохранено." if ok else "Тенант не найден.")
+        else:
+            await update.message.reply_text(TENANT_USAGE)
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}\n\n{TENANT_USAGE}")
+    except Exception as e:
+        logger.error(f"Error in cmd_tenant: {e}", exc_info=True)
+        await update.message.reply_text(f"❌ Ошибка: {e}")
+
 async def cmd_push_week(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not ensure_allowed(update): return
     try:
-        try:
         from .integrations.sheets import export_week_from_bot_to_sheets
         
-        wk_count, days_count = export_week_from_bot_to_sheets()
+        wk_count, days_count = export_week_from_bot_to_sheets(
+            update.effective_chat.id, _integration_id(update, "sheets_id"))
         await update.message.reply_text(f"✅ В Sheets отправлено: Week_Tasks={wk_count}, Days={days_count}")
     except Exception as e:
         logger.error(f"Error in cmd_push_week: {e}", exc_info=True)
@@ -811,34 +1002,47 @@ async def cmd_push_week(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cmd_pull_week(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not ensure_allowed(update): return
     try:
-        try:
-        
+        from .integrations.sheets import import_week_from_sheets_to_bot
+
         # Поддержка принудительного импорта: /pull_week force
         force = False
         if context.args and len(context.args) >= 1 and str(context.args[0]).lower() in ("force","new","all"):
             force = True
         
-        added = import_week_from_sheets_to_bot(force_new=force)
+        added = import_week_from_sheets_to_bot(
+            force_new=force, chat_id=update.effective_chat.id, spreadsheet_id=_integration_id(update, "sheets_id"))
         await update.message.reply_text(f"✅ Из Sheets подтянуто задач: {added}")
     except Exception as e:
         logger.error(f"Error in cmd_pull_week: {e}", exc_info=True)
         await update.message.reply_text(f"❌ Ошибка импорта из Sheets: {e}")
 
 async def cmd_sync_notion(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Берём актуальные таблицы из Sheets и шьём в Notion базы (если настроены IDs)."""
+    """Берём актуальные таблицы из Sheets и шьём в Notion базы (если настроены IDs).
+    Повторный запуск обновляет уже созданные страницы, а не плодит дубли."""
     if not ensure_allowed(update): return
     try:
-        try:
+        from .integrations.sheets import _open_sheet, SHEET_WEEK_TASKS, SHEET_DAYS
         from .integrations.notion import push_week_tasks, push_days
         
-        sh = _open_sheet()
+        sh = _open_sheet(_integration_id(update, "sheets_id"))
         wk = sh.worksheet(SHEET_WEEK_TASKS).get_all_records()
         ds = sh.worksheet(SHEET_DAYS).get_all_records()
-        t1 = push_week_tasks(wk) if wk else 0
+        empty = {"created": 0, "updated": 0, "skipped": 0, "failed": 0}
+        t1 = await push_week_tasks(wk, _integration_id(update, "notion_week_db")) if wk else empty
         # подготовим минимальные поля для Days
         days_rows = [{"Date": r["Date"], "Day": r["Day"], "Frog": r["Frog"], "Stone1": r["Stone1"], "Stone2": r["Stone2"]} for r in ds]
-        t2 = push_days(days_rows) if ds else 0
-        await update.message.reply_text(f"✅ В Notion добавлено: Week_Tasks={t1}, Days={t2}")
+        t2 = await push_days(days_rows, _integration_id(update, "notion_days_db")) if ds else empty
+
+        def fmt(s):
+            line = f"+{s['created']} / ~{s['updated']} / ={s['skipped']}"
+            if s["failed"]:
+                line += f" / ❌{s['failed']}"
+            return line
+
+        await update.message.reply_text(
+            f"✅ Notion синхронизирован (создано / обновлено / без изменений):\n"
+            f"Week_Tasks: {fmt(t1)}\nDays: {fmt(t2)}"
+        )
     except Exception as e:
         logger.error(f"Error in cmd_sync_notion: {e}", exc_info=True)
         await update.message.reply_text(f"❌ Ошибка синхронизации Notion: {e}")
@@ -847,9 +1051,9 @@ async def cmd_generate_week(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Генерирует неделю из Goals/Projects в Sheets."""
     if not ensure_allowed(update): return
     try:
-        try:
-        
-        w, d, added = generate_week_from_goals()
+        from .integrations.planner import generate_week_from_goals
+
+        w, d, added = generate_week_from_goals(update.effective_chat.id, _integration_id(update, "sheets_id"))
         await update.message.reply_text(f"✅ Сгенерирована неделя: Week_Tasks={w}, Days={d}, задач создано={added}")
     except Exception as e:
         logger.error(f"Error in cmd_generate_week: {e}", exc_info=True)
@@ -859,9 +1063,10 @@ async def cmd_merge_inbox(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Слить текучку из бота в Week_Tasks (добавить как камни недели по приоритету)"""
     if not ensure_allowed(update): return
     try:
-        try:
-        
-        wk_count, _ = export_week_from_bot_to_sheets()
+        from .integrations.sheets import export_week_from_bot_to_sheets
+
+        wk_count, _ = export_week_from_bot_to_sheets(
+            update.effective_chat.id, _integration_id(update, "sheets_id"))
         await update.message.reply_text(f"✅ Текучка добавлена в Week_Tasks (Sheets): {wk_count} строк")
     except Exception as e:
         logger.error(f"Error in cmd_merge_inbox: {e}", exc_info=True)
@@ -871,9 +1076,10 @@ async def cmd_commit_week(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Прочитать Week_Tasks из Sheets и зафиксировать в БД задач (дедлайны на дни недели)"""
     if not ensure_allowed(update): return
     try:
-        try:
-        
-        added = import_week_from_sheets_to_bot()
+        from .integrations.sheets import import_week_from_sheets_to_bot
+
+        added = import_week_from_sheets_to_bot(
+            chat_id=update.effective_chat.id, spreadsheet_id=_integration_id(update, "sheets_id"))
         await update.message.reply_text(f"✅ Неделя зафиксирована: добавлено задач={added}")
     except Exception as e:
         logger.error(f"Error in cmd_commit_week: {e}", exc_info=True)
@@ -883,13 +1089,13 @@ async def cmd_reflect(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Запускает рефлексию в конце дня: показывает план и задаёт 5 вопросов."""
     if not ensure_allowed(update): return
     # Покажем краткий план
-    now = now_local()
-    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    end = start + timedelta(days=1)
-    rows = list_today(update.effective_chat.id, iso_utc(now), iso_utc(start), iso_utc(end))
+    tz = chat_tz(update)
+    now = datetime.now(tz)
+    start_iso, end_iso = day_bounds(tz, now.date())
+    rows = list_today(update.effective_chat.id, iso_utc(now), start_iso, end_iso)
     if not rows:
         rows = list_open_tasks(update.effective_chat.id)[:10]
-    frog, stones, sand = _pick_plan(rows)
+    frog, stones, sand = _pick_plan(rows, now.date(), tz)
     def fmt(r):
         return f"- {r['title']} [{r['context']}]"
     preview = []
@@ -937,7 +1143,6 @@ async def msg_text_any(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     user_label = update.effective_user.username if update.effective_user and update.effective_user.username else str(update.effective_user.id)
     try:
-        try:
         await update.message.reply_text("🪞 Рефлексия сохранена. Хорошего дня!")
     except Exception as e:
         await update.message.reply_text(f"❌ Не удалось сохранить рефлексию: {e}")
@@ -948,8 +1153,8 @@ async def cmd_ai_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Не задан OPENAI_API_KEY.")
         return
     try:
-        try:
-        refl = get_reflections_last_7d()
+        tasks = get_week_tasks_done_last_7d(_integration_id(update, "sheets_id"))
+        refl = get_reflections_last_7d(_integration_id(update, "sheets_id"))
 
         def fmt_tasks(xs):
             if not xs: return "(no done tasks)"
@@ -1011,9 +1216,8 @@ async def cmd_ai_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cmd_weekend(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not ensure_allowed(update): return
     try:
-        try:
-        tasks = get_week_tasks_done_last_7d()
-        refl = get_reflections_last_7d()
+        tasks = get_week_tasks_done_last_7d(_integration_id(update, "sheets_id"))
+        refl = get_reflections_last_7d(_integration_id(update, "sheets_id"))
 
         # Баланс по контекстам
         by_ctx = {}
@@ -1024,9 +1228,8 @@ async def cmd_weekend(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not ctx_lines:
             ctx_lines = ["(no data)"]
 
-        # Проверка сегодняшней рефлексии
-        from datetime import datetime
-        today = datetime.now(TZINFO).strftime("%Y-%m-%d")
+        # Проверка сегодняшней рефлексии (сегодня — в поясе чата, как и ручная отметка в scheduler)
+        today = local_today(chat_tz(update)).strftime("%Y-%m-%d")
         did_reflect_today = any((x.get("Date") or "").startswith(today) for x in refl)
 
         # AI обзор (мягкий fallback)
@@ -1087,7 +1290,7 @@ async def cmd_weekend(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # пометим ручной запуск для планировщика выходных
         try:
             from .scheduler import mark_weekend_manual_invoked
-            mark_weekend_manual_invoked()
+            mark_weekend_manual_invoked(update.effective_chat.id)
         except Exception:
             pass
     except Exception as e:
@@ -1097,11 +1300,11 @@ async def cmd_weekend(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cmd_writeback_ids(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not ensure_allowed(update): return
     try:
-        try:
         from gspread.utils import rowcol_to_a1
-        from .db import db_connect
+        from .integrations.sheets import _open_sheet, SHEET_WEEK_TASKS
+        from .db import find_tasks_by_title
 
-        sh = _open_sheet()
+        sh = _open_sheet(_integration_id(update, "sheets_id"))
         ws = sh.worksheet(SHEET_WEEK_TASKS)
         header = ws.row_values(1)
         col = {name: (idx+1) for idx, name in enumerate(header)}
@@ -1116,27 +1319,11 @@ async def cmd_writeback_ids(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Нет строк в Week_Tasks.")
             return
 
-        # Загружаем открытые задачи из БД
-        conn = db_connect()
-        c = conn.cursor()
-        c.execute("""
-          SELECT id,title,context,due_at FROM tasks
-          WHERE status='open'
-        """)
-        tasks = c.fetchall()
-        conn.close()
-
         def norm(s):
             return " ".join((s or "").strip().lower().replace("ё","е").split())
 
-        # Индекс по (context,title,deadline)
-        idx = {}
-        for t in tasks:
-            ctx = norm(t["context"])
-            ttl = norm(t["title"])
-            ddl = (t["due_at"] or "")[:10]
-            idx.setdefault((ctx, ttl, ddl), []).append(t["id"])
-
+        chat_id = update.effective_chat.id
+        used = set()
         wb = []
         matched = 0
         for r_idx, row in enumerate(rows, start=2):
@@ -1148,9 +1335,12 @@ async def cmd_writeback_ids(update: Update, context: ContextTypes.DEFAULT_TYPE):
             ctx = norm(row[col["Direction"]-1] if "Direction" in col else "")
             ttl = norm(title)
             ddl = (row[col["Deadline"]-1] or "")[:10] if "Deadline" in col else ""
-            key = (ctx, ttl, ddl)
-            if key in idx and idx[key]:
-                t_id = idx[key].pop(0)
+            # Кандидаты по словам названия из полнотекстового индекса, точное совпадение (context,title,deadline) — здесь
+            t_id = next((t["id"] for t in find_tasks_by_title(chat_id, title)
+                         if t["id"] not in used
+                         and (norm(t["context"]), norm(t["title"]), (t["due_at"] or "")[:10]) == (ctx, ttl, ddl)), None)
+            if t_id is not None:
+                used.add(t_id)
                 wb.append({"range": rowcol_to_a1(r_idx, col["Bot_ID"]), "values": [[str(t_id)]]})
                 matched += 1
 
@@ -1168,12 +1358,12 @@ async def cmd_calendar_advice(update: Update, context: ContextTypes.DEFAULT_TYPE
     await update.message.chat.send_action(ChatAction.TYPING)
     
     try:
-        try:
         from collections import defaultdict
+        from .integrations.sheets import get_week_tasks_last_14d
         from dateutil.parser import isoparse
         
         # 1. Получаем данные за 14 дней
-        tasks = get_week_tasks_last_14d()
+        tasks = get_week_tasks_last_14d(_integration_id(update, "sheets_id"))
         
         if not tasks:
             await update.message.reply_text("❌ Нет данных за последние 14 дней для анализа.")
@@ -1324,12 +1514,12 @@ async def cmd_can_take(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.chat.send_action(ChatAction.TYPING)
     
     try:
-        try:
+        from .integrations.sheets import get_active_week_tasks
         from .db import db_connect
         
         # 1. Загружаем активные задачи из БД и Week_Tasks
         active_db_tasks = list_open_tasks(update.effective_chat.id)
-        active_sheets_tasks = get_active_week_tasks()
+        active_sheets_tasks = get_active_week_tasks(_integration_id(update, "sheets_id"))
         
         # Формируем список активных задач для контекста
         tasks_context = []
@@ -1470,7 +1660,7 @@ async def callback_can_take(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     try:
-        try:
+        data = query.data or ""
         if not data.startswith("can_take_"):
             return
         
@@ -1493,7 +1683,7 @@ async def callback_can_take(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if action == "add":
             # Добавляем задачу в план
             parsed = parse_task(task_text)
-            due_dt = parse_human_dt(parsed.get("due")) if parsed.get("due") else None
+            due_dt = parse_human_dt(parsed.get("due"), chat_tz(update)) if parsed.get("due") else None
             est = estimate_minutes(parsed["title"])
             pr = compute_priority(parsed["title"], due_dt, est)
             
@@ -1538,16 +1728,26 @@ async def callback_can_take(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def cmd_unknown(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not ensure_allowed(update): return
-    await update.message.reply_text("Команды: /add /inbox /plan /done /snooze /drop /week /export /stats /health /push_week /pull_week /sync_notion /generate_week /merge_inbox /commit_week /reflect /ai_review /weekend /calendar_advice /can_take /fix_times /roll_over /rebalance_week /ai_rebalance")
+    await update.message.reply_text("Команды: /add /inbox /plan /done /snooze /drop /week /search /export /stats /health /push_week /pull_week /sync_notion /generate_week /merge_inbox /commit_week /reflect /ai_review /weekend /calendar_advice /can_take /fix_times /roll_over /rebalance_week /ai_rebalance /reprioritize")
+
+def _default_slot(title):
+    """Время по умолчанию по типу задачи: лягушка 09:00, камни 14:00, прочее 20:00"""
+    return {"frog": (9, 0), "stone": (14, 0)}.get(task_kind(title), (20, 0))
 
 async def cmd_roll_over(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Переносит все просроченные открытые задачи на указанную дату (или сегодня).
     Использование: /roll_over [YYYY-MM-DD]
     Время ставится по правилу: лягушка 09:00, камни 14:00, прочее 20:00.
+    /roll_over day — то же, что ночной автоперенос: несделанное сегодня → завтра / воскресенье.
     """
     if not ensure_allowed(update): return
     try:
-        try:
+        tz = chat_tz(update)
+        if context.args and context.args[0].lower() == "day":
+            from .rollover import rollover_day, format_report
+            report = rollover_day(update.effective_chat.id, tz=tz)
+            await update.message.reply_text(format_report(report))
+            return
         target_date = None
         if context.args:
             try:
@@ -1556,41 +1756,17 @@ async def cmd_roll_over(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await update.message.reply_text("❌ Формат: /roll_over YYYY-MM-DD (например: 2025-11-06)")
                 return
         if target_date is None:
-            target_date = now_local().date()
-
-        # Выбираем открытые задачи с due_at в прошлом
-        from .db import db_connect, snooze_task, iso_utc
-        conn = db_connect()
-        c = conn.cursor()
-        c.execute(
-            """
-              SELECT id, chat_id, title, due_at
-              FROM tasks
-              WHERE status='open' AND due_at IS NOT NULL
-            """
-        )
-        rows = c.fetchall()
-        conn.close()
+            target_date = datetime.now(tz).date()
 
-        fixed = 0
+        # Только просроченные задачи этого чата — фильтр в SQL по индексу
+        from .db import list_overdue, reschedule_tasks
+        rows = list_overdue(update.effective_chat.id, iso_utc(datetime.now(timezone.utc)))
+        changes = []
         for r in rows:
-            try:
-                # due_at в прошлом?
-                due_dt = datetime.fromisoformat(r["due_at"]).astimezone(TZINFO)
-                if due_dt >= now_local():
-                    continue
-                # Новый datetime на целевую дату с подходящим временем
-                lt = (r["title"] or "").lower()
-                if "лягуш" in lt:
-                    nd_local = datetime.combine(target_date, datetime.min.time()).replace(tzinfo=TZINFO).replace(hour=9, minute=0)
-                elif "камень" in lt:
-                    nd_local = datetime.combine(target_date, datetime.min.time()).replace(tzinfo=TZINFO).replace(hour=14, minute=0)
-                else:
-                    nd_local = datetime.combine(target_date, datetime.min.time()).replace(tzinfo=TZINFO).replace(hour=20, minute=0)
-                if snooze_task(r["chat_id"], r["id"], iso_utc(nd_local)):
-                    fixed += 1
-            except Exception:
-                continue
+            h, m = _default_slot(r["title"])
+            nd_local = tz.localize(datetime(target_date.year, target_date.month, target_date.day, h, m))
+            changes.append((r["id"], iso_utc(nd_local)))
+        fixed = reschedule_tasks(update.effective_chat.id, changes)
 
         await update.message.reply_text(f"🔁 Перенесено задач: {fixed}")
     except Exception as e:
@@ -1601,49 +1777,172 @@ async def cmd_fix_times(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Нормализует время задач с дедлайном 00:00 → лягушка 09:00, камни 14:00, прочее 20:00."""
     if not ensure_allowed(update): return
     try:
-        try:
-        from .config import TZINFO
-        conn = db_connect()
-        c = conn.cursor()
-        c.execute(
-            """
-          SELECT id, chat_id, title, due_at FROM tasks
-          WHERE status='open' AND due_at IS NOT NULL
-        """
-        )
-        rows = c.fetchall()
-        conn.close()
-
-        fixed = 0
-        from datetime import datetime
+        from .db import list_midnight_due, reschedule_tasks
+        from .tzcalendar import utc_offsets
+        tz = chat_tz(update)
+        # SQL отбирает кандидатов «полночь при одном из смещений пояса», здесь — точная проверка
+        rows = list_midnight_due(update.effective_chat.id, utc_offsets(tz))
+        changes = []
         for r in rows:
-            try:
-                dt = datetime.fromisoformat(r["due_at"]).astimezone(TZINFO)
-                if dt.hour == 0 and dt.minute == 0:
-                    lt = (r["title"] or "").lower()
-                    if "лягуш" in lt:
-                        nd = dt.replace(hour=9, minute=0, second=0, microsecond=0)
-                    elif "камень" in lt:
-                        nd = dt.replace(hour=14, minute=0, second=0, microsecond=0)
-                    else:
-                        nd = dt.replace(hour=20, minute=0, second=0, microsecond=0)
-                    if snooze_task(r["chat_id"], r["id"], iso_utc(nd)):
-                        fixed += 1
-            except Exception:
-                continue
+            dt = datetime.fromisoformat(r["due_at"]).astimezone(tz)
+            if dt.hour == 0 and dt.minute == 0:
+                h, m = _default_slot(r["title"])
+                nd = tz.localize(datetime(dt.year, dt.month, dt.day, h, m))
+                changes.append((r["id"], iso_utc(nd)))
+        fixed = reschedule_tasks(update.effective_chat.id, changes)
 
         await update.message.reply_text(f"🔧 Обновлено задач: {fixed}")
     except Exception as e:
         logger.error(f"Error in cmd_fix_times: {e}", exc_info=True)
         await update.message.reply_text("❌ Ошибка при нормализации времени.")
 
+def _rebalance_week_slots(rows, start, max_stones=2, max_sand=4):
+    """Раскладка задач недели по дням: 1 лягушка, max_stones камней, песок до max_sand
+    в пределах доступного времени; крупные задачи (90+ мин) — на воскресенье.
+    Возвращает (unique_rows, large_tasks, day_slots, unplaced)."""
+    rows = [dict(r) for r in rows]
+
+    def norm_title(s: str) -> str:
+        s = (s or "").lower().replace("ё","е").strip()
+        import re
+        s = re.sub(r"[^\w\s\-]+", "", s)
+        s = re.sub(r"\s+", " ", s)
+        return s
+
+    # Глобальная дедупликация: оставляем один экземпляр на нормализованное название
+    seen_titles = {}
+    unique_rows = []
+    for r in rows:
+        nt = norm_title(r["title"])
+        if nt not in seen_titles:
+            seen_titles[nt] = r
+            unique_rows.append(r)
+        else:
+            # Оставляем задачу с более высоким приоритетом
+            existing = seen_titles[nt]
+            if r["priority"] > existing["priority"]:
+                seen_titles[nt] = r
+                unique_rows = [x for x in unique_rows if x["id"] != existing["id"]]
+                unique_rows.append(r)
+
+    # Разделяем на категории
+    frogs = []
+    stones = []
+    sand = []
+    for r in unique_rows:
+        kind = task_kind(r["title"])
+        if kind == "frog":
+            frogs.append(r)
+        elif kind == "stone":
+            stones.append(r)
+        else:
+            sand.append(r)
+
+    # Сортируем по приоритету внутри категорий
+    frogs.sort(key=lambda x: (-x["priority"], x["est_minutes"] or 999))
+    stones.sort(key=lambda x: (-x["priority"], x["est_minutes"] or 999))
+    sand.sort(key=lambda x: (-x["priority"], x["est_minutes"] or 999))
+
+    # Разделяем задачи на крупные (90+ минут) и обычные
+    large_tasks = []
+    normal_frogs = []
+    normal_stones = []
+    normal_sand = []
+    
+    for r in frogs:
+        if (r.get("est_minutes") or 0) >= 90:
+            large_tasks.append(r)
+        else:
+            normal_frogs.append(r)
+    
+    for r in stones:
+        if (r.get("est_minutes") or 0) >= 90:
+            large_tasks.append(r)
+        else:
+            normal_stones.append(r)
+    
+    for r in sand:
+        if (r.get("est_minutes") or 0) >= 90:
+            large_tasks.append(r)
+        else:
+            normal_sand.append(r)
+    
+    # Распределяем по дням недели с учётом доступного времени
+    days = [start + timedelta(days=i) for i in range(7)]
+    day_slots = {d.date(): {"frog": [], "stones": [], "sand": [], "used_minutes": 0} for d in days}
+    
+    # Крупные задачи (90+ минут) только на воскресенье
+    sunday_date = None
+    for day in days:
+        if day.weekday() == 6:  # Воскресенье
+            sunday_date = day.date()
+            break
+    
+    if sunday_date:
+        for large in large_tasks:
+            est_min = large.get("est_minutes", 90) or 90
+            available_minutes = get_available_time_minutes(sunday_date)
+            if day_slots[sunday_date]["used_minutes"] + est_min <= available_minutes:
+                day_slots[sunday_date]["sand"].append(large)
+                day_slots[sunday_date]["used_minutes"] += est_min
+
+    # Распределяем обычные лягушки (по одной на день, до 60 минут)
+    frog_idx = 0
+    for day in days:
+        if frog_idx >= len(normal_frogs):
+            break
+        day_date = day.date()
+        available_minutes = get_available_time_minutes(day_date)
+        frog = normal_frogs[frog_idx]
+        est_min = frog.get("est_minutes", 30) or 30
+        if est_min <= 60 and day_slots[day_date]["used_minutes"] + est_min <= available_minutes:
+            day_slots[day_date]["frog"].append(frog)
+            day_slots[day_date]["used_minutes"] += est_min
+            frog_idx += 1
+
+    # Распределяем камни (по 2 на день, до 45 минут каждый)
+    stone_idx = 0
+    for day in days:
+        day_date = day.date()
+        available_minutes = get_available_time_minutes(day_date)
+        for _ in range(max_stones):
+            if stone_idx >= len(normal_stones):
+                break
+            stone = normal_stones[stone_idx]
+            est_min = stone.get("est_minutes", 30) or 30
+            if est_min <= 45 and day_slots[day_date]["used_minutes"] + est_min <= available_minutes:
+                day_slots[day_date]["stones"].append(stone)
+                day_slots[day_date]["used_minutes"] += est_min
+                stone_idx += 1
+            else:
+                break
+
+    # Распределяем песок (до max_sand на день, до 30 минут каждый)
+    sand_idx = 0
+    for day in days:
+        day_date = day.date()
+        available_minutes = get_available_time_minutes(day_date)
+        for _ in range(max_sand):
+            if sand_idx >= len(normal_sand):
+                break
+            s = normal_sand[sand_idx]
+            est_min = s.get("est_minutes", 30) or 30
+            if est_min <= 30 and day_slots[day_date]["used_minutes"] + est_min <= available_minutes:
+                day_slots[day_date]["sand"].append(s)
+                day_slots[day_date]["used_minutes"] += est_min
+                sand_idx += 1
+            else:
+                break
+
+    unplaced_tasks = len(normal_frogs) - frog_idx + len(normal_stones) - stone_idx + len(normal_sand) - sand_idx
+    return unique_rows, large_tasks, day_slots, unplaced_tasks
+
 async def cmd_rebalance_week(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Перераспределяет задачи в пределах 7 дней: 1 лягушка, 2 камня, песок до N.
     Использование: /rebalance_week [max_sand]
     """
     if not ensure_allowed(update): return
     try:
-        try:
         max_frog = 1
         max_stones = 2
         max_sand = 4
@@ -1653,21 +1952,21 @@ async def cmd_rebalance_week(update: Update, context: ContextTypes.DEFAULT_TYPE)
             except Exception:
                 pass
 
-        from .db import db_connect, snooze_task, iso_utc
+        from .db import db_connect, snooze_task, iso_utc, to_epoch
         conn = db_connect()
         c = conn.cursor()
-        from datetime import datetime, timedelta
-        start = now_local().replace(hour=0, minute=0, second=0, microsecond=0)
-        end = start + timedelta(days=7)
+        tz = chat_tz(update)
+        today = local_today(tz)
+        start_iso, end_iso = day_bounds(tz, today, 7)
         c.execute(
             """
               SELECT id, chat_id, title, context, due_at, priority, est_minutes
               FROM tasks
-              WHERE chat_id=? AND status='open' AND due_at IS NOT NULL
-                AND due_at >= ? AND due_at < ?
+              WHERE chat_id=? AND status='open'
+                AND due_epoch >= ? AND due_epoch < ?
               ORDER BY priority DESC, est_minutes ASC
             """,
-            (update.effective_chat.id, iso_utc(start), iso_utc(end))
+            (update.effective_chat.id, to_epoch(start_iso), to_epoch(end_iso))
         )
         rows = c.fetchall()
         conn.close()
@@ -1676,137 +1975,9 @@ async def cmd_rebalance_week(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await update.message.reply_text("Нет задач для ребалансировки.")
             return
 
-        def norm_title(s: str) -> str:
-            s = (s or "").lower().replace("ё","е").strip()
-            import re
-            s = re.sub(r"[^\w\s\-]+", "", s)
-            s = re.sub(r"\s+", " ", s)
-            return s
-
-        # Глобальная дедупликация: оставляем один экземпляр на нормализованное название
-        seen_titles = {}
-        unique_rows = []
-        for r in rows:
-            nt = norm_title(r["title"])
-            if nt not in seen_titles:
-                seen_titles[nt] = r
-                unique_rows.append(r)
-            else:
-                # Оставляем задачу с более высоким приоритетом
-                existing = seen_titles[nt]
-                if r["priority"] > existing["priority"]:
-                    seen_titles[nt] = r
-                    unique_rows = [x for x in unique_rows if x["id"] != existing["id"]]
-                    unique_rows.append(r)
-
-        # Разделяем на категории
-        frogs = []
-        stones = []
-        sand = []
-        for r in unique_rows:
-            t = (r["title"] or "").lower()
-            if "лягуш" in t:
-                frogs.append(r)
-            elif "камень" in t:
-                stones.append(r)
-            else:
-                sand.append(r)
-
-        # Сортируем по приоритету внутри категорий
-        frogs.sort(key=lambda x: (-x["priority"], x["est_minutes"] or 999))
-        stones.sort(key=lambda x: (-x["priority"], x["est_minutes"] or 999))
-        sand.sort(key=lambda x: (-x["priority"], x["est_minutes"] or 999))
-
-        # Разделяем задачи на крупные (90+ минут) и обычные
-        large_tasks = []
-        normal_frogs = []
-        normal_stones = []
-        normal_sand = []
-        
-        for r in frogs:
-            if (r.get("est_minutes") or 0) >= 90:
-                large_tasks.append(r)
-            else:
-                normal_frogs.append(r)
-        
-        for r in stones:
-            if (r.get("est_minutes") or 0) >= 90:
-                large_tasks.append(r)
-            else:
-                normal_stones.append(r)
-        
-        for r in sand:
-            if (r.get("est_minutes") or 0) >= 90:
-                large_tasks.append(r)
-            else:
-                normal_sand.append(r)
-        
-        # Распределяем по дням недели с учётом доступного времени
-        days = [start + timedelta(days=i) for i in range(7)]
-        day_slots = {d.date(): {"frog": [], "stones": [], "sand": [], "used_minutes": 0} for d in days}
-        
-        # Крупные задачи (90+ минут) только на воскресенье
-        sunday_date = None
-        for day in days:
-            if day.weekday() == 6:  # Воскресенье
-                sunday_date = day.date()
-                break
-        
-        if sunday_date:
-            for large in large_tasks:
-                est_min = large.get("est_minutes", 90) or 90
-                available_minutes = get_available_time_minutes(sunday_date)
-                if day_slots[sunday_date]["used_minutes"] + est_min <= available_minutes:
-                    day_slots[sunday_date]["sand"].append(large)
-                    day_slots[sunday_date]["used_minutes"] += est_min
-
-        # Распределяем обычные лягушки (по одной на день, до 60 минут)
-        frog_idx = 0
-        for day in days:
-            if frog_idx >= len(normal_frogs):
-                break
-            day_date = day.date()
-            available_minutes = get_available_time_minutes(day_date)
-            frog = normal_frogs[frog_idx]
-            est_min = frog.get("est_minutes", 30) or 30
-            if est_min <= 60 and day_slots[day_date]["used_minutes"] + est_min <= available_minutes:
-                day_slots[day_date]["frog"].append(frog)
-                day_slots[day_date]["used_minutes"] += est_min
-                frog_idx += 1
-
-        # Распределяем камни (по 2 на день, до 45 минут каждый)
-        stone_idx = 0
-        for day in days:
-            day_date = day.date()
-            available_minutes = get_available_time_minutes(day_date)
-            for _ in range(max_stones):
-                if stone_idx >= len(normal_stones):
-                    break
-                stone = normal_stones[stone_idx]
-                est_min = stone.get("est_minutes", 30) or 30
-                if est_min <= 45 and day_slots[day_date]["used_minutes"] + est_min <= available_minutes:
-                    day_slots[day_date]["stones"].append(stone)
-                    day_slots[day_date]["used_minutes"] += est_min
-                    stone_idx += 1
-                else:
-                    break
-
-        # Распределяем песок (до max_sand на день, до 30 минут каждый)
-        sand_idx = 0
-        for day in days:
-            day_date = day.date()
-            available_minutes = get_available_time_minutes(day_date)
-            for _ in range(max_sand):
-                if sand_idx >= len(normal_sand):
-                    break
-                s = normal_sand[sand_idx]
-                est_min = s.get("est_minutes", 30) or 30
-                if est_min <= 30 and day_slots[day_date]["used_minutes"] + est_min <= available_minutes:
-                    day_slots[day_date]["sand"].append(s)
-                    day_slots[day_date]["used_minutes"] += est_min
-                    sand_idx += 1
-                else:
-                    break
+        unique_rows, large_tasks, day_slots, unplaced_tasks = _rebalance_week_slots(
+            rows, local_slot(tz, today, 0, 0), max_stones=max_stones, max_sand=max_sand
+        )
 
         # Обновляем даты задач с правильными временными слотами
         moved = 0
@@ -1820,7 +1991,7 @@ async def cmd_rebalance_week(update: Update, context: ContextTypes.DEFAULT_TYPE)
                     hour, minute = 9, 0
                 else:  # Пн-Сб
                     hour, minute = 19, 30
-                nd_local = datetime.combine(day_date, datetime.min.time()).replace(tzinfo=TZINFO).replace(hour=hour, minute=minute)
+                nd_local = local_slot(tz, day_date, hour, minute)
                 if snooze_task(r["chat_id"], r["id"], iso_utc(nd_local)):
                     moved += 1
             
@@ -1830,7 +2001,7 @@ async def cmd_rebalance_week(update: Update, context: ContextTypes.DEFAULT_TYPE)
                     hour, minute = 14, 0
                 else:  # Пн-Сб
                     hour, minute = 20, 0
-                nd_local = datetime.combine(day_date, datetime.min.time()).replace(tzinfo=TZINFO).replace(hour=hour, minute=minute)
+                nd_local = local_slot(tz, day_date, hour, minute)
                 if snooze_task(r["chat_id"], r["id"], iso_utc(nd_local)):
                     moved += 1
             
@@ -1841,14 +2012,13 @@ async def cmd_rebalance_week(update: Update, context: ContextTypes.DEFAULT_TYPE)
                     hour, minute = 10, 0
                 else:  # Пн-Сб
                     hour, minute = 20, 30
-                nd_local = datetime.combine(day_date, datetime.min.time()).replace(tzinfo=TZINFO).replace(hour=hour, minute=minute)
+                nd_local = local_slot(tz, day_date, hour, minute)
                 if snooze_task(r["chat_id"], r["id"], iso_utc(nd_local)):
                     moved += 1
         
         # Подсчитываем статистику
         total_large = len(large_tasks)
         placed_large = sum(len(slots["sand"]) for slots in day_slots.values() if any((r.get("est_minutes") or 0) >= 90 for r in slots["sand"]))
-        unplaced_tasks = len(normal_frogs) - frog_idx + len(normal_stones) - stone_idx + len(normal_sand) - sand_idx
         
         deduped = len(rows) - len(unique_rows)
         msg_parts = [
@@ -1864,7 +2034,7 @@ async def cmd_rebalance_week(update: Update, context: ContextTypes.DEFAULT_TYPE)
         # Статистика по дням
         weekday_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
         for day_date, slots in sorted(day_slots.items()):
-            if any(slots.values()[:-1]):  # Если есть задачи (кроме used_minutes)
+            if slots["frog"] or slots["stones"] or slots["sand"]:
                 weekday_name = weekday_names[day_date.weekday()]
                 used_hours = slots["used_minutes"] / 60
                 available_hours = get_available_time_minutes(day_date) / 60
@@ -1877,7 +2047,7 @@ async def cmd_rebalance_week(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 async def cmd_ai_rebalance(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """AI-ребалансировка задач с учётом целей, проектов и приоритетов.
-    Использование: /ai_rebalance [max_sand]
+    Использование: /ai_rebalance [max_sand] [fresh] — fresh перечитывает Goals/Projects из таблицы
     """
     if not ensure_allowed(update): return
     if not OPENAI_API_KEY:
@@ -1887,19 +2057,21 @@ async def cmd_ai_rebalance(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("🤖 Анализирую задачи с помощью AI...")
     
     try:
-        try:
-        if context.args:
-            try:
-                max_sand = int(context.args[0])
-            except Exception:
-                pass
+        max_sand = 3
+        args = [a.lower() for a in (context.args or [])]
+        if args and args[0].isdigit():
+            max_sand = int(args[0])
         
         from .integrations.ai_planner import analyze_and_rebalance_with_ai
+        from .integrations.planning_context import invalidate_goals
+        sheet_id = _integration_id(update, "sheets_id")
+        if "fresh" in args:
+            invalidate_goals(sheet_id)
         from .db import snooze_task, iso_utc
-        from datetime import datetime, timedelta
+        tz = chat_tz(update)
         
         # Получаем рекомендации от AI
-        ai_result = analyze_and_rebalance_with_ai(update.effective_chat.id, max_sand)
+        ai_result = analyze_and_rebalance_with_ai(update.effective_chat.id, max_sand, sheet_id)
         
         moved = 0
         postponed = 0
@@ -1921,13 +2093,13 @@ async def cmd_ai_rebalance(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         conn.close()
                         
                         if task_row:
-                            t = (task_row["title"] or "").lower()
-                            if "лягуш" in t:
-                                nd_local = datetime.combine(new_date, datetime.min.time()).replace(tzinfo=TZINFO).replace(hour=9, minute=30)
-                            elif "камень" in t:
-                                nd_local = datetime.combine(new_date, datetime.min.time()).replace(tzinfo=TZINFO).replace(hour=14, minute=30)
+                            kind = task_kind(task_row["title"])
+                            if kind == "frog":
+                                nd_local = local_slot(tz, new_date, 9, 30)
+                            elif kind == "stone":
+                                nd_local = local_slot(tz, new_date, 14, 30)
                             else:
-                                nd_local = datetime.combine(new_date, datetime.min.time()).replace(tzinfo=TZINFO).replace(hour=20, minute=30)
+                                nd_local = local_slot(tz, new_date, 20, 30)
                             
                             if snooze_task(update.effective_chat.id, task_id, iso_utc(nd_local)):
                                 postponed += 1
@@ -1946,19 +2118,19 @@ async def cmd_ai_rebalance(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     # Обновляем лягушку
                     if day_plan.get("frog"):
                         task_id = day_plan["frog"]
-                        nd_local = datetime.combine(target_date, datetime.min.time()).replace(tzinfo=TZINFO).replace(hour=9, minute=30)
+                        nd_local = local_slot(tz, target_date, 9, 30)
                         if snooze_task(update.effective_chat.id, task_id, iso_utc(nd_local)):
                             moved += 1
                     
                     # Обновляем камни
                     for stone_id in day_plan.get("stones", []):
-                        nd_local = datetime.combine(target_date, datetime.min.time()).replace(tzinfo=TZINFO).replace(hour=14, minute=30)
+                        nd_local = local_slot(tz, target_date, 14, 30)
                         if snooze_task(update.effective_chat.id, stone_id, iso_utc(nd_local)):
                             moved += 1
                     
                     # Обновляем песок
                     for sand_id in day_plan.get("sand", []):
-                        nd_local = datetime.combine(target_date, datetime.min.time()).replace(tzinfo=TZINFO).replace(hour=20, minute=30)
+                        nd_local = local_slot(tz, target_date, 20, 30)
                         if snooze_task(update.effective_chat.id, sand_id, iso_utc(nd_local)):
                             moved += 1
                 except Exception as e:
@@ -0,0 +1,238 @@
+"""
+Инструментирование горячих путей: счётчики и гистограммы латентности
+в формате Prometheus (text exposition 0.0.4) + крошечный локальный HTTP-эндпоинт /metrics.
+
+Использование:
+    @timed("db_query", op="add_task")
+    def add_task(...): ...
+
+Гистограмма будет называться dailypilot_db_query_seconds{op="add_task"},
+ошибки считаются в dailypilot_db_query_errors_total{op="add_task"}.
+"""
+import os
+import time
+import bisect
+import logging
+import functools
+import threading
+import inspect
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "dailypilot_"
+METRICS_ADDR = os.getenv("METRICS_ADDR", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # 0 — не поднимать HTTP-эндпоинт
+
+# Границы корзин (секунды): от быстрых SQL до долгих вызовов LLM/Sheets
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    """Накопительная гистограмма с фиксированными корзинами"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # последняя — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Оценка квантиля линейной интерполяцией внутри корзины (как histogram_quantile)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i >= len(self.buckets):
+                    return self.buckets[-1]
+                upper = self.buckets[i]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+class Registry:
+    """Потокобезопасное хранилище метрик: имя -> {labels -> значение}"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._help = {}
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+    def observe(self, name, value, help_text="", **labels):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            h = series.get(self._key(labels))
+            if h is None:
+                h = series[self._key(labels)] = Histogram()
+            h.observe(value)
+            if help_text:
+                self._help.setdefault(name, help_text)
+
+    def inc(self, name, amount=1, help_text="", **labels):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = self._key(labels)
+            series[key] = series.get(key, 0) + amount
+            if help_text:
+                self._help.setdefault(name, help_text)
+
+    def set_gauge(self, name, value, help_text="", **labels):
+        with self._lock:
+            self._gauges.setdefault(name, {})[self._key(labels)] = value
+            if help_text:
+                self._help.setdefault(name, help_text)
+
+    def counter_value(self, name, **labels):
+        with self._lock:
+            return self._counters.get(name, {}).get(self._key(labels), 0)
+
+    def summary(self, name):
+        """[(labels, count, p50, p95, p99)] по гистограмме name"""
+        with self._lock:
+            out = []
+            for key, h in self._histograms.get(name, {}).items():
+                out.append((dict(key), h.count, h.quantile(0.5), h.quantile(0.95), h.quantile(0.99)))
+            return out
+
+    def render(self):
+        """Текст в формате Prometheus"""
+        def fmt_labels(key, extra=None):
+            items = list(key) + (list(extra.items()) if extra else [])
+            if not items:
+                return ""
+            esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full = PREFIX + name
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} counter")
+                for key, v in sorted(series.items()):
+                    lines.append(f"{full}{fmt_labels(key)} {v}")
+            for name, series in sorted(self._gauges.items()):
+                full = PREFIX + name
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} gauge")
+                for key, v in sorted(series.items()):
+                    lines.append(f"{full}{fmt_labels(key)} {v}")
+            for name, series in sorted(self._histograms.items()):
+                full = PREFIX + name
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} histogram")
+                for key, h in sorted(series.items()):
+                    cumulative = 0
+                    for bound, n in zip(h.buckets, h.counts):
+                        cumulative += n
+                        lines.append(f"{full}_bucket{fmt_labels(key, {'le': repr(bound)})} {cumulative}")
+                    lines.append(f"{full}_bucket{fmt_labels(key, {'le': '+Inf'})} {h.count}")
+                    lines.append(f"{full}_sum{fmt_labels(key)} {h.sum}")
+                    lines.append(f"{full}_count{fmt_labels(key)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+def _record(metric, started, failed, labels):
+    elapsed = time.perf_counter() - started
+    registry.observe(f"{metric}_seconds", elapsed, **labels)
+    if failed:
+        registry.inc(f"{metric}_errors_total", **labels)
+
+def timed(metric, **labels):
+    """Декоратор: латентность вызова в гистограмму <metric>_seconds, исключения — в <metric>_errors_total.
+    Работает и для обычных функций, и для корутин."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                failed = True
+                try:
+                    result = await fn(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    _record(metric, started, failed, labels)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = fn(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                _record(metric, started, failed, labels)
+        return wrapper
+    return decorator
+
+def instrument_application(app):
+    """Оборачивает колбэки всех зарегистрированных хендлеров telegram.ext в таймер handler_seconds"""
+    for handlers in app.handlers.values():
+        for h in handlers:
+            if getattr(h.callback, "__instrumented__", False):
+                continue
+            wrapped = timed("handler", handler=h.callback.__name__)(h.callback)
+            wrapped.__instrumented__ = True
+            h.callback = wrapped
+
+def format_latency_summary(metric="handler_seconds", label="handler", top=5):
+    """Строки для /health: самые медленные серии по p95"""
+    rows = [r for r in registry.summary(metric) if r[1]]
+    rows.sort(key=lambda r: r[3] or 0, reverse=True)
+    lines = []
+    for labels, count, p50, p95, p99 in rows[:top]:
+        lines.append(f"{labels.get(label, '?')}: p50 {p50*1000:.0f}мс • p95 {p95*1000:.0f}мс • p99 {p99*1000:.0f}мс (n={count})")
+    return lines
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics http: " + format % args)
+
+def start_metrics_server(addr=None, port=None):
+    """Поднимает HTTP /metrics в daemon-потоке. Возвращает сервер или None."""
+    addr = METRICS_ADDR if addr is None else addr
+    port = METRICS_PORT if port is None else port
+    if not port:
+        logger.info("Metrics endpoint disabled (METRICS_PORT=0)")
+        return None
+    try:
+        server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+    except OSError as e:
+        logger.error(f"Failed to start metrics endpoint on {addr}:{port}: {e}")
+        return None
+    th = threading.Thread(target=server.serve_forever, daemon=True)
+    th.start()
+    logger.info(f"Metrics endpoint on http://{addr}:{server.server_address[1]}/metrics")
+    return server
@@ -1,49 +1,211 @@
 import os
-from notion_client import Client
-from datetime import datetime
-from ..config import TZINFO
+import asyncio
+import hashlib
+import json
+import logging
+import random
+from notion_client import AsyncClient
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+from ..instrumentation import timed, registry
+
+logger = logging.getLogger(__name__)
 
 NOTION_TOKEN = os.getenv("NOTION_API_TOKEN","")
 DB_WEEK = os.getenv("NOTION_DB_WEEK_TASKS","")
 DB_DAYS = os.getenv("NOTION_DB_DAYS","")
 DB_MOT = os.getenv("NOTION_DB_MOTIVATION","")
 
+# Лимиты Notion API: ~3 запроса в секунду на интеграцию
+NOTION_RPS = float(os.getenv("NOTION_RPS", "3"))
+NOTION_CONCURRENCY = int(os.getenv("NOTION_CONCURRENCY", "3"))
+NOTION_MAX_RETRIES = int(os.getenv("NOTION_MAX_RETRIES", "5"))
+
+# Кэш страниц: database_id -> {ключ строки: {"page_id": ..., "digest": ...}}
+_page_cache = {}
+
 def _cli():
     if not NOTION_TOKEN:
         raise RuntimeError("NOTION_API_TOKEN не задан")
-    return Client(auth=NOTION_TOKEN)
+    return AsyncClient(auth=NOTION_TOKEN)
 
-def push_week_tasks(tasks_rows):
-    """tasks_rows: список dict с полями Direction, Task, Outcome, Deadline, Status, Progress_%."""
-    if not DB_WEEK:
-        raise RuntimeError("NOTION_DB_WEEK_TASKS не задан")
+class _RateLimiter:
+    """Равномерно разносит старты запросов: не чаще rps в секунду"""
+
+    def __init__(self, rps):
+        self.interval = 1.0 / rps if rps > 0 else 0.0
+        self._lock = asyncio.Lock()
+        self._next = 0.0
+
+    async def wait(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+                now = self._next
+            self._next = now + self.interval
+
+def _retryable(e):
+    if isinstance(e, RequestTimeoutError):
+        return True
+    if isinstance(e, HTTPResponseError):
+        return e.status == 429 or e.status >= 500
+    return False
+
+async def _call(limiter, sem, fn, **kwargs):
+    """Вызов Notion API с лимитом скорости, ограничением параллелизма и ретраями"""
+    delay = 1.0
+    for attempt in range(NOTION_MAX_RETRIES + 1):
+        async with sem:
+            await limiter.wait()
+            try:
+                return await fn(**kwargs)
+            except Exception as e:
+                if attempt >= NOTION_MAX_RETRIES or not _retryable(e):
+                    raise
+                retry_after = None
+                headers = getattr(e, "headers", None)
+                if headers is not None:
+                    try:
+                        retry_after = float(headers.get("Retry-After"))
+                    except (TypeError, ValueError):
+                        retry_after = None
+                wait_s = retry_after if retry_after is not None else delay + random.uniform(0, delay / 2)
+                registry.inc("notion_retries_total", status=str(getattr(e, "status", "timeout")))
+                logger.warning(f"Notion request failed ({e}), retry {attempt + 1}/{NOTION_MAX_RETRIES} in {wait_s:.1f}s")
+        await asyncio.sleep(wait_s)
+        delay = min(delay * 2, 30.0)
+
+def _norm(s):
+    return " ".join(str(s or "").strip().lower().replace("ё", "е").split())
+
+def _plain(prop):
+    """Текст из title/rich_text свойства страницы Notion"""
+    if not prop:
+        return ""
+    items = prop.get("title") or prop.get("rich_text") or []
+    return "".join(i.get("plain_text") or i.get("text", {}).get("content", "") for i in items)
+
+def _week_key(r):
+    return f'{_norm(r.get("Direction"))}|{_norm(r.get("Task"))}'
+
+def _week_page_key(props):
+    direction = ((props.get("Direction") or {}).get("select") or {}).get("name", "")
+    return f'{_norm(direction)}|{_norm(_plain(props.get("Task")))}'
+
+def _days_key(r):
+    return str(r.get("Date") or "")[:10]
+
+def _days_page_key(props):
+    return (((props.get("Date") or {}).get("date") or {}).get("start") or "")[:10]
+
+def _week_properties(r):
+    return {
+        "Direction": {"select": {"name": r["Direction"]}},
+        "Task": {"title": [{"text": {"content": r["Task"]}}]},
+        "Outcome": {"rich_text": [{"text": {"content": r.get("Outcome","")}}]},
+        "Deadline": {"date": {"start": r.get("Deadline")}},
+        "Status": {"select": {"name": r.get("Status","planned")}},
+        "Progress_%": {"number": float(r.get("Progress_%",0) or 0)}
+    }
+
+def _days_properties(r):
+    return {
+        "Date": {"date": {"start": r["Date"]}},
+        "Day": {"select": {"name": r["Day"]}},
+        "Frog": {"title": [{"text": {"content": r.get("Frog","")}}]},
+        "Stone1": {"rich_text": [{"text": {"content": r.get("Stone1","")}}]},
+        "Stone2": {"rich_text": [{"text": {"content": r.get("Stone2","")}}]},
+    }
+
+def _digest(properties):
+    return hashlib.sha1(json.dumps(properties, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+async def _load_existing(n, limiter, sem, database_id, page_key):
+    """Один проход по базе: ключ строки -> page_id (с сохранением известных digest)"""
+    known = _page_cache.get(database_id, {})
+    existing = {}
+    cursor = None
+    while True:
+        kwargs = {"database_id": database_id, "page_size": 100}
+        if cursor:
+            kwargs["start_cursor"] = cursor
+        resp = await _call(limiter, sem, n.databases.query, **kwargs)
+        for page in resp.get("results", []):
+            if page.get("archived"):
+                continue
+            key = page_key(page.get("properties") or {})
+            if not key or key in existing:
+                continue
+            prev = known.get(key)
+            digest = prev["digest"] if prev and prev["page_id"] == page["id"] else None
+            existing[key] = {"page_id": page["id"], "digest": digest}
+        if not resp.get("has_more"):
+            break
+        cursor = resp.get("next_cursor")
+    _page_cache[database_id] = existing
+    return existing
+
+async def _upsert_rows(database_id, rows, row_key, page_key, build_properties):
+    """Идемпотентная синхронизация: существующие страницы обновляются, новые создаются.
+    Возвращает счётчики created/updated/skipped/failed."""
+    stats = {"created": 0, "updated": 0, "skipped": 0, "failed": 0}
+    if not rows:
+        return stats
+    limiter = _RateLimiter(NOTION_RPS)
+    sem = asyncio.Semaphore(max(1, NOTION_CONCURRENCY))
     n = _cli()
-    created = 0
-    for r in tasks_rows:
-        n.pages.create(parent={"database_id": DB_WEEK}, properties={
-            "Direction": {"select": {"name": r["Direction"]}},
-            "Task": {"title": [{"text": {"content": r["Task"]}}]},
-            "Outcome": {"rich_text": [{"text": {"content": r.get("Outcome","")}}]},
-            "Deadline": {"date": {"start": r.get("Deadline")}},
-            "Status": {"select": {"name": r.get("Status","planned")}},
-            "Progress_%": {"number": float(r.get("Progress_%",0))}
-        })
-        created += 1
-    return created
-
-def push_days(days_rows):
-    """days_rows: список dict с полями Date, Day, Frog, Stone1, Stone2 etc."""
-    if not DB_DAYS:
+    try:
+        existing = await _load_existing(n, limiter, sem, database_id, page_key)
+
+        # Последняя строка с тем же ключом побеждает — как при повторной синхронизации
+        by_key = {}
+        for r in rows:
+            key = row_key(r)
+            if key:
+                by_key[key] = r
+
+        async def one(key, r):
+            props = build_properties(r)
+            digest = _digest(props)
+            cached = existing.get(key)
+            try:
+                if cached:
+                    if cached["digest"] == digest:
+                        stats["skipped"] += 1
+                        return
+                    await _call(limiter, sem, n.pages.update, page_id=cached["page_id"], properties=props)
+                    cached["digest"] = digest
+                    stats["updated"] += 1
+                else:
+                    page = await _call(limiter, sem, n.pages.create, parent={"database_id": database_id}, properties=props)
+                    existing[key] = {"page_id": page["id"], "digest": digest}
+                    stats["created"] += 1
+            except Exception as e:
+                stats["failed"] += 1
+                logger.error(f"Notion upsert failed for {key!r}: {e}", exc_info=True)
+
+        await asyncio.gather(*(one(k, r) for k, r in by_key.items()))
+    finally:
+        await n.aclose()
+    logger.info(f"Notion sync {database_id}: {stats}")
+    return stats
+
+@timed("integration_call", op="notion_push_week")
+async def push_week_tasks(tasks_rows, database_id=None):
+    """tasks_rows: список dict с полями Direction, Task, Outcome, Deadline, Status, Progress_%.
+    Ключ строки — (Direction, Task). database_id — база чата (по умолчанию NOTION_DB_WEEK_TASKS)."""
+    database_id = database_id or DB_WEEK
+    if not database_id:
+        raise RuntimeError("NOTION_DB_WEEK_TASKS не задан")
+    rows = [r for r in tasks_rows if (r.get("Task") or "").strip()]
+    return await _upsert_rows(database_id, rows, _week_key, _week_page_key, _week_properties)
+
+@timed("integration_call", op="notion_push_days")
+async def push_days(days_rows, database_id=None):
+    """days_rows: список dict с полями Date, Day, Frog, Stone1, Stone2 etc.
+    Ключ строки — Date. database_id — база чата (по умолчанию NOTION_DB_DAYS)."""
+    database_id = database_id or DB_DAYS
+    if not database_id:
         raise RuntimeError("NOTION_DB_DAYS не задан")
-    n = _cli()
-    created = 0
-    for r in days_rows:
-        n.pages.create(parent={"database_id": DB_DAYS}, properties={
-            "Date": {"date": {"start": r["Date"]}},
-            "Day": {"select": {"name": r["Day"]}},
-            "Frog": {"title": [{"text": {"content": r.get("Frog","")}}]},
-            "Stone1": {"rich_text": [{"text": {"content": r.get("Stone1","")}}]},
-            "Stone2": {"rich_text": [{"text": {"content": r.get("Stone2","")}}]},
-        })
-        created += 1
-    return created
+    return await _upsert_rows(database_id, days_rows, _days_key, _days_page_key, _days_properties)
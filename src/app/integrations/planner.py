@@ -1,28 +1,16 @@
-import os
 from datetime import datetime, timedelta
 import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
-from ..config import TZINFO
-from ..db import add_task, iso_utc
+from ..config import TZINFO, ALLOWED_USER_ID
+from ..db import add_tasks_bulk, iso_utc
 from ..handlers import compute_priority, estimate_minutes, now_local
-from ..integrations.sheets import SCOPES
-
-SPREADSHEET_ID = os.getenv("GOOGLE_SHEETS_SPREADSHEET_ID", "")
-GCP_CREDS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "")
-
-def _gc():
-    creds = Credentials.from_service_account_file(GCP_CREDS, scopes=SCOPES)
-    return gspread.authorize(creds)
-
-def _open():
-    if not SPREADSHEET_ID or not GCP_CREDS:
-        raise RuntimeError("Sheets: нет SPREADSHEET_ID или GOOGLE_APPLICATION_CREDENTIALS")
-    return _gc().open_by_key(SPREADSHEET_ID)
-
-def _week_bounds():
-    now = datetime.now(TZINFO)
-    start = now - timedelta(days=now.weekday())
+from ..integrations.sheets import _open_sheet
+from ..tenants import tenant_tz
+from ..tzcalendar import local_today
+
+def _week_bounds(tz):
+    """Понедельник и воскресенье текущей недели — местные даты в поясе tz"""
+    today = local_today(tz)
+    start = today - timedelta(days=today.weekday())
     end = start + timedelta(days=6)
     return start, end
 
@@ -58,20 +46,24 @@ def _score_project(row, goals_df):
     ctx_b = {"ai":1.0,"horien":1.0,"energy":0.7,"system":0.6}.get(ctx,0.6)
     return goal_weight*0.6 + soon*0.3 + ctx_b*0.1
 
-def generate_week_from_goals():
+def generate_week_from_goals(chat_id=None, spreadsheet_id=None):
     """
+    Таблица чата spreadsheet_id (None — общая из env, только для администратора),
+    задачи создаются в чате chat_id (по умолчанию ALLOWED_USER_ID):
     1) Читаем Goals/Projects в Sheets
     2) Фильтруем active проекты
     3) Ранжируем и распределяем Weekly_Slots по дням недели
     4) Пишем Week_Tasks и Days обратно в Sheets
     5) Создаём задачи в БД бота с дедлайнами этой недели
     """
-    sh = _open()
+    chat_id = chat_id or ALLOWED_USER_ID
+    tz = tenant_tz(chat_id)
+    sh = _open_sheet(spreadsheet_id)
     goals_df, proj_df = _load_tables(sh)
     if proj_df.empty:
         raise RuntimeError("Пустой лист Projects")
 
-    start, end = _week_bounds()
+    start, end = _week_bounds(tz)
     days_names = ["Пн","Вт","Ср","Чт","Пт","Сб","Вс"]
 
     # 1) фильтр активных
@@ -145,24 +137,19 @@ def generate_week_from_goals():
     ws_d.clear()
     ws_d.update([df_days.columns.tolist()] + df_days.values.tolist())
 
-    # 8) Создаём задачи в БД бота на эту неделю (дедлайны по датам дней для frog/stone)
-    added = 0
+    # 8) Создаём задачи в БД бота на эту неделю (дедлайны по датам дней для frog/stone) — одной транзакцией
+    added_at = iso_utc(now_local())
+    new_rows = []
     for d in days:
-        due_base = d["Date"].replace(hour=21, minute=0, second=0, microsecond=0)  # вечерний "должно быть сделано"
-        # Frog
-        if d["Frog"]:
-            title = f'Лягушка: {d["Frog"]["Title"]}'
-            est = estimate_minutes(title)
-            pr = compute_priority(title, due_base, est)
-            add_task(0, title, "", d["Frog"]["Context"], iso_utc(due_base), iso_utc(now_local()), pr, est, "planner")
-            added += 1
-        # Stones
-        for st in d["Stones"]:
-            title = f'Камень: {st["Title"]}'
+        day = d["Date"]
+        due_base = tz.localize(datetime(day.year, day.month, day.day, 21, 0))  # вечерний "должно быть сделано", по поясу чата
+        slots = ([(f'Лягушка: {d["Frog"]["Title"]}', d["Frog"]["Context"])] if d["Frog"] else []) + \
+                [(f'Камень: {st["Title"]}', st["Context"]) for st in d["Stones"]]
+        for title, context in slots:
             est = estimate_minutes(title)
             pr = compute_priority(title, due_base, est)
-            add_task(0, title, "", st["Context"], iso_utc(due_base), iso_utc(now_local()), pr, est, "planner")
-            added += 1
+            new_rows.append((chat_id, title, "", context, iso_utc(due_base), added_at, pr, est, "planner"))
+    added = len(add_tasks_bulk(new_rows))
 
     return len(df_week), len(df_days), added
 
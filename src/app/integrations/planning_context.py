@@ -0,0 +1,160 @@
+"""
+Контекст для AI-планировщика (/ai_rebalance).
+
+- Goals/Projects из Sheets кэшируются снимком на AI_CONTEXT_TTL_MIN минут, отдельно
+  для каждой таблицы (invalidate_goals(sheet_id) — сбросить раньше, например после правки).
+  Это и есть основная экономия: чтение двух листов Sheets — сетевые запросы, а открытые
+  задачи берутся из локальной БД и форматируются заново при каждом вызове.
+- Данные в промпте ограничены бюджетом AI_CONTEXT_TOKEN_BUDGET: цели — по весу,
+  проекты — по дедлайну, задачи — по приоритету; что не влезло, отбрасывается
+  с конца списка, а не срезом первых N.
+- Для каждого промпта записывается дайджест и оценка токенов (last_prompt, метрика).
+"""
+import time
+import hashlib
+import logging
+import threading
+from ..config import AI_CONTEXT_TTL_MIN, AI_CONTEXT_TOKEN_BUDGET
+from ..instrumentation import registry
+
+logger = logging.getLogger(__name__)
+
+# Грубая оценка для смешанного русского/английского текста без токенизатора
+CHARS_PER_TOKEN = 3
+MAX_GOALS = 10
+MAX_PROJECTS = 15
+
+PROMPT_TEMPLATE = """Ты — AI-ассистент по планированию и тайм-менеджменту. Проанализируй текущую ситуацию и дай рекомендации по распределению задач.
+
+ГЛОБАЛЬНЫЕ ЦЕЛИ:
+{goals_text}
+
+АКТИВНЫЕ ПРОЕКТЫ:
+{projects_text}
+
+ТЕКУЩИЕ ОТКРЫТЫЕ ЗАДАЧИ:
+{open_tasks_text}
+
+СТАТИСТИКА:
+- Выполнено за последнюю неделю: {done_recent} задач
+- Открытых задач сейчас: {open_count}
+
+ТВОЯ ЗАДАЧА:
+1. Проанализируй, какие задачи критичны для достижения целей и проектов
+2. Определи, какие задачи можно перенести на более поздний срок
+3. Распредели задачи на следующие 7 дней с учётом:
+   - Максимум 1 "лягушка" (важная задача) в день в 09:30
+   - Максимум 2 "камня" (средние задачи) в день в 14:30
+   - До {max_sand} "песка" (мелкие задачи) в день в 20:30
+4. Если задача не критична и не успевается — предложи перенести её на следующую неделю или позже
+
+В ответе дай JSON:
+{{
+    "critical_tasks": [{{"id": 123, "reason": "критично для проекта X"}}],
+    "can_postpone": [{{"id": 456, "new_date": "2025-11-10", "reason": "не критично, можно отложить"}}],
+    "distribution": [
+        {{"date": "2025-11-06", "frog": 123, "stones": [456, 789], "sand": [101, 102]}},
+        ...
+    ],
+    "recommendations": ["рекомендация 1", "рекомендация 2"]
+}}
+
+Отвечай только JSON, без дополнительного текста."""
+
+_lock = threading.Lock()
+_goals = {}            # sheet_id -> (loaded_at, goals, projects); None — общая таблица из env
+_last_prompt = {}      # chat_id -> {"digest", "tokens", "dropped", "at"}
+
+def approx_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def goals_snapshot(sheet_id, loader):
+    """(goals, projects) таблицы sheet_id из кэша или через loader(sheet_id) —
+    обычно ai_planner.get_goals_and_projects"""
+    with _lock:
+        cached = _goals.get(sheet_id)
+        if cached and time.monotonic() - cached[0] < AI_CONTEXT_TTL_MIN * 60:
+            return cached[1], cached[2]
+    goals, projects = loader(sheet_id)
+    # Пустой ответ — скорее ошибка чтения таблицы, его не кэшируем
+    if goals or projects:
+        with _lock:
+            _goals[sheet_id] = (time.monotonic(), goals, projects)
+    return goals, projects
+
+def invalidate_goals(sheet_id=None):
+    """Сбросить снимок Goals/Projects таблицы sheet_id — следующий запрос перечитает её"""
+    with _lock:
+        _goals.pop(sheet_id, None)
+
+def _weight(g):
+    try:
+        return float(g.get("Weight") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def goal_lines(goals):
+    ranked = sorted(goals, key=_weight, reverse=True)[:MAX_GOALS]
+    return [f"- {g.get('Goal_Level', '')}: {g.get('Goal_Objective', '')} (вес: {g.get('Weight', 0)})" for g in ranked]
+
+def project_lines(projects):
+    # Ближайшие дедлайны первыми, без дедлайна — в конце
+    ranked = sorted(projects, key=lambda p: (not p.get("Deadline"), str(p.get("Deadline") or "")))[:MAX_PROJECTS]
+    return [f"- {p.get('Title', '')} [{p.get('Context', '')}] (дедлайн: {p.get('Deadline') or 'N/A'})" for p in ranked]
+
+def task_lines(open_tasks):
+    """Строки задач в порядке open_tasks"""
+    return [f"#{t['id']}: {t['title']} [{t['context']}] — приоритет {int(t['priority'] or 0)}, "
+            f"~{t['est_minutes'] or 0}м, дедлайн: {t['due_at'][:10] if t['due_at'] else 'нет'}"
+            for t in open_tasks]
+
+def fit_budget(lines, budget):
+    """Первые строки, укладывающиеся в budget токенов, и число отброшенных"""
+    kept, used = [], 0
+    for line in lines:
+        cost = approx_tokens(line) + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    return kept, len(lines) - len(kept)
+
+def build_prompt(chat_id, goals, projects, open_tasks, done_recent, max_sand, budget=None):
+    """Промпт /ai_rebalance. open_tasks — по убыванию приоритета.
+    Бюджет делится по порядку: цели, проекты, затем всё оставшееся — задачам."""
+    budget = AI_CONTEXT_TOKEN_BUDGET if budget is None else budget
+    goals_kept, goals_dropped = fit_budget(goal_lines(goals), budget)
+    budget -= approx_tokens("\n".join(goals_kept))
+    projects_kept, projects_dropped = fit_budget(project_lines(projects), budget)
+    budget -= approx_tokens("\n".join(projects_kept))
+    tasks_kept, tasks_dropped = fit_budget(task_lines(open_tasks), max(budget, 0))
+    if tasks_dropped:
+        tasks_kept.append(f"… и ещё {tasks_dropped} задач с меньшим приоритетом")
+
+    prompt = PROMPT_TEMPLATE.format(
+        goals_text="\n".join(goals_kept),
+        projects_text="\n".join(projects_kept),
+        open_tasks_text="\n".join(tasks_kept),
+        done_recent=done_recent,
+        open_count=len(open_tasks),
+        max_sand=max_sand,
+    )
+    record_prompt(chat_id, prompt, goals_dropped + projects_dropped + tasks_dropped)
+    return prompt
+
+def record_prompt(chat_id, prompt, dropped=0):
+    """Дайджест и размер промпта: в лог, метрику и last_prompt(chat_id)"""
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+    tokens = approx_tokens(prompt)
+    with _lock:
+        repeated = _last_prompt.get(chat_id, {}).get("digest") == digest
+        _last_prompt[chat_id] = {"digest": digest, "tokens": tokens, "dropped": dropped, "at": time.time()}
+    registry.set_gauge("ai_prompt_tokens", tokens, help_text="approximate size of the last AI prompt, tokens", op="ai_rebalance")
+    logger.info(f"AI rebalance prompt {digest}: ~{tokens} tokens, {dropped} lines over budget"
+                + (", same as previous" if repeated else ""))
+    return digest
+
+def last_prompt(chat_id):
+    """Сведения о последнем промпте чата или None"""
+    with _lock:
+        return dict(_last_prompt[chat_id]) if chat_id in _last_prompt else None
@@ -8,6 +8,7 @@ from datetime import datetime, timedelta
 from ..db import db_connect
 from ..config import ALLOWED_USER_ID
 from ..config import TZINFO
+from ..instrumentation import timed
 
 logger = logging.getLogger(__name__)
 
@@ -21,27 +22,33 @@ SHEET_MOTIVATION = "Motivation"
 SHEET_REFLECTIONS = "Reflections"
 
 def _client():
-    if not SPREADSHEET_ID or not GCP_CREDS:
-        raise RuntimeError("GOOGLE_SHEETS_SPREADSHEET_ID или GOOGLE_APPLICATION_CREDENTIALS не заданы")
+    if not GCP_CREDS:
+        raise RuntimeError("GOOGLE_APPLICATION_CREDENTIALS не задан")
     creds = Credentials.from_service_account_file(GCP_CREDS, scopes=SCOPES)
     return gspread.authorize(creds)
 
-def _open_sheet():
+def _open_sheet(spreadsheet_id=None):
+    """Таблица чата (tenants.sheets_id) или общая из GOOGLE_SHEETS_SPREADSHEET_ID"""
+    spreadsheet_id = spreadsheet_id or SPREADSHEET_ID
+    if not spreadsheet_id:
+        raise RuntimeError("GOOGLE_SHEETS_SPREADSHEET_ID не задан")
     gc = _client()
-    return gc.open_by_key(SPREADSHEET_ID)
+    return gc.open_by_key(spreadsheet_id)
 
-def export_week_from_bot_to_sheets():
+@timed("integration_call", op="sheets_export_week")
+def export_week_from_bot_to_sheets(chat_id=None, spreadsheet_id=None):
     """Формирует Week_Tasks + Days из задач бота и пишет в Google Sheets.
        Фикс: wk_rows как список словарей; дедупликация по (Direction, Task)."""
-    sh = _open_sheet()
+    sh = _open_sheet(spreadsheet_id)
+    chat_id = chat_id or ALLOWED_USER_ID
 
-    # --- Берём открытые задачи из БД бота ---
+    # --- Берём открытые задачи чата из БД бота ---
     conn = db_connect()
     c = conn.cursor()
     c.execute("""
       SELECT id,title,description,context,due_at,priority,est_minutes
-      FROM tasks WHERE status='open'
-    """)
+      FROM tasks WHERE status='open' AND chat_id=?
+    """, (chat_id,))
     rows = c.fetchall()
     conn.close()
 
@@ -143,11 +150,14 @@ def _norm_title(s: str) -> str:
         s = s.replace(k, v)
     return s
 
-def import_week_from_sheets_to_bot(force_new: bool = False):
+@timed("integration_call", op="sheets_import_week")
+def import_week_from_sheets_to_bot(force_new: bool = False, chat_id=None, spreadsheet_id=None):
     """Читает Week_Tasks и добавляет задачи в БД, пишет обратно Bot_ID и статус.
     force_new=True — создавать новые задачи даже при совпадении title+Direction в БД.
+    chat_id — чей это план (по умолчанию ALLOWED_USER_ID).
     """
-    sh = _open_sheet()
+    sh = _open_sheet(spreadsheet_id)
+    chat_id = chat_id or ALLOWED_USER_ID
     ws = sh.worksheet(SHEET_WEEK_TASKS)
 
     header = ws.row_values(1)
@@ -165,20 +175,24 @@ def import_week_from_sheets_to_bot(force_new: bool = False):
     rows = ws.get_all_values()[1:]
     if not rows: return 0
 
-    from ..db import add_task, iso_utc, db_connect
+    from ..db import add_tasks_bulk, iso_utc, find_tasks_by_title
     from ..handlers import compute_priority, estimate_minutes, parse_human_dt, now_local
-
-    conn = db_connect()
-    c = conn.cursor()
-    # Учитываем только задачи текущего пользователя
-    c.execute("SELECT id,title,context FROM tasks WHERE status='open' AND chat_id=? ORDER BY id DESC LIMIT 200;", (ALLOWED_USER_ID,))
-    open_rows = c.fetchall()
-    conn.close()
+    from ..keywords import task_kind
+    from ..tenants import tenant_tz
 
     def _norm_title(s): return (s or "").strip().lower().replace("ё","е")
-    cache = {(_norm_title(r["title"]), (r["context"] or "").lower()): r["id"] for r in open_rows}
 
-    added, writeback, nowl = 0, [], now_local()
+    def _existing_id(title, direction):
+        """Открытая задача чата с тем же названием и направлением — кандидаты из полнотекстового индекса"""
+        key = (_norm_title(title), direction.lower())
+        for r in find_tasks_by_title(chat_id, title):
+            if (_norm_title(r["title"]), (r["context"] or "").lower()) == key:
+                return r["id"]
+        return None
+
+    writeback, new_rows, new_cells, pending = [], [], [], {}
+    tz = tenant_tz(chat_id)
+    added_at = iso_utc(now_local())
 
     for r_idx, row in enumerate(rows, start=2):
         status = (row[col.get("Status",0)-1] or "").strip().lower()
@@ -193,10 +207,14 @@ def import_week_from_sheets_to_bot(force_new: bool = False):
         direction = (row[col.get("Direction",0)-1] or "System").strip()
         outcome = (row[col.get("Outcome",0)-1] or "").strip()
         deadline_val = (row[col.get("Deadline",0)-1] or "").strip()
+        # Повтор строки, уже стоящей в очереди на вставку, получит тот же id
         key = (_norm_title(title), direction.lower())
+        if not force_new and key in pending:
+            new_cells.append((r_idx, row, pending[key]))
+            continue
+        existing_id = None if force_new else _existing_id(title, direction)
         # Если уже есть в БД и не форсируем — записываем Bot_ID/Status/Notes обратно и идём дальше
-        if (not force_new) and key in cache:
-            existing_id = cache[key]
+        if existing_id is not None:
             if "Bot_ID" in col and not (row[col["Bot_ID"]-1] or "").strip():
                 writeback.append({"range": rowcol_to_a1(r_idx, col["Bot_ID"]), "values": [[str(existing_id)]]})
             if "Status" in col:
@@ -211,39 +229,29 @@ def import_week_from_sheets_to_bot(force_new: bool = False):
                     writeback.append({"range": rowcol_to_a1(r_idx, col["Notes"]), "values": [[new_notes]]})
             continue
 
-        due_dt = parse_human_dt(deadline_val) if deadline_val else None
+        due_dt = parse_human_dt(deadline_val, tz) if deadline_val else None
         # Если в дате нет времени (00:00), расставим разумные слоты по типу задачи
         if due_dt is not None:
             try:
-                local_dt = due_dt.astimezone(TZINFO)
+                local_dt = due_dt.astimezone(tz)
                 if local_dt.hour == 0 and local_dt.minute == 0:
-                    lt = title.lower()
-                    if "лягуш" in lt:
-                        local_dt = local_dt.replace(hour=9, minute=0, second=0, microsecond=0)
-                    elif "камень" in lt:
-                        local_dt = local_dt.replace(hour=14, minute=0, second=0, microsecond=0)
-                    else:
-                        local_dt = local_dt.replace(hour=20, minute=0, second=0, microsecond=0)
-                    due_dt = local_dt
+                    h, m = {"frog": (9, 0), "stone": (14, 0)}.get(task_kind(title), (20, 0))
+                    due_dt = tz.localize(datetime(local_dt.year, local_dt.month, local_dt.day, h, m))
             except Exception:
                 pass
         est = estimate_minutes(title)
         pr = compute_priority(title, due_dt, est)
 
-        new_id = add_task(
-            ALLOWED_USER_ID,
-            title,
-            outcome,
-            direction,
-            iso_utc(due_dt) if due_dt else None,
-            iso_utc(nowl),
-            pr,
-            est,
-            "sheets"
-        )
-        added += 1
-        cache[key] = new_id
+        pending[key] = len(new_rows)
+        new_cells.append((r_idx, row, len(new_rows)))
+        new_rows.append((chat_id, title, outcome, direction, iso_utc(due_dt) if due_dt else None,
+                         added_at, pr, est, "sheets"))
 
+    # Все новые задачи — одной транзакцией; id нужны для записи Bot_ID обратно в лист
+    new_ids = add_tasks_bulk(new_rows)
+    added = len(new_ids)
+    for r_idx, row, pos in new_cells:
+        new_id = new_ids[pos]
         writeback.append({"range": rowcol_to_a1(r_idx, col["Bot_ID"]), "values": [[str(new_id)]]})
         writeback.append({"range": rowcol_to_a1(r_idx, col["Status"]), "values": [["in_progress"]]})
         # Дополнительно пишем task_id в Notes, если пусто или нет task_id=
@@ -263,10 +271,11 @@ def import_week_from_sheets_to_bot(force_new: bool = False):
     logger.info(f"Added {added} tasks from Week_Tasks")
     return added
 
-def append_reflection(main_task: str, skip_what: str, focus_trap: str, user_label: str, bot_id: str = ""):
+@timed("integration_call", op="sheets_append_reflection")
+def append_reflection(main_task: str, skip_what: str, focus_trap: str, user_label: str, bot_id: str = "", spreadsheet_id=None):
     """Добавляет строку в лист Reflections: Date, Main_Task, Skip_What, Focus_Trap, Bot_ID, User.
        Создаёт лист и заголовок при отсутствии."""
-    sh = _open_sheet()
+    sh = _open_sheet(spreadsheet_id)
     try:
         ws = sh.worksheet(SHEET_REFLECTIONS)
     except Exception:
@@ -292,9 +301,10 @@ def append_reflection(main_task: str, skip_what: str, focus_trap: str, user_labe
     date_str = datetime.now(TZINFO).strftime("%Y-%m-%d")
     ws.append_row([date_str, main_task or "", skip_what or "", focus_trap or "", bot_id or "", user_label or ""], value_input_option="USER_ENTERED")
 
-def get_week_tasks_done_last_7d():
+@timed("integration_call", op="sheets_done_last_7d")
+def get_week_tasks_done_last_7d(spreadsheet_id=None):
     """Возвращает задачи из Week_Tasks со статусом 'done' за 7 дней: [{Task, Direction, Outcome, Progress_%}]"""
-    sh = _open_sheet()
+    sh = _open_sheet(spreadsheet_id)
     try:
         ws = sh.worksheet(SHEET_WEEK_TASKS)
     except Exception:
@@ -326,9 +336,10 @@ def get_week_tasks_done_last_7d():
         })
     return out
 
-def get_reflections_last_7d():
+@timed("integration_call", op="sheets_reflections_last_7d")
+def get_reflections_last_7d(spreadsheet_id=None):
     """Возвращает записи из Reflections за 7 дней: [{Date, Main_Task, Skip_What, Focus_Trap}]"""
-    sh = _open_sheet()
+    sh = _open_sheet(spreadsheet_id)
     try:
         ws = sh.worksheet(SHEET_REFLECTIONS)
     except Exception:
@@ -357,11 +368,12 @@ def get_reflections_last_7d():
         })
     return out
 
-def get_week_tasks_last_14d():
+@timed("integration_call", op="sheets_week_last_14d")
+def get_week_tasks_last_14d(spreadsheet_id=None):
     """Возвращает задачи из Week_Tasks за последние 14 дней с полями:
        Task, Direction, Deadline, Status, Time_Estimate, Done_At
        Включает задачи, у которых Deadline или Done_At попадает в последние 14 дней."""
-    sh = _open_sheet()
+    sh = _open_sheet(spreadsheet_id)
     try:
         ws = sh.worksheet(SHEET_WEEK_TASKS)
     except Exception:
@@ -415,9 +427,10 @@ def get_week_tasks_last_14d():
     
     return out
 
-def get_active_week_tasks():
+@timed("integration_call", op="sheets_active_week")
+def get_active_week_tasks(spreadsheet_id=None):
     """Возвращает активные задачи из Week_Tasks (статусы: planned, in_progress)"""
-    sh = _open_sheet()
+    sh = _open_sheet(spreadsheet_id)
     try:
         ws = sh.worksheet(SHEET_WEEK_TASKS)
     except Exception:
@@ -0,0 +1,188 @@
+"""
+Журнал изменений задач (task_events) и восстановление на момент времени.
+
+Триггеры на tasks (см. db.create_journal_triggers) пишут каждое изменение строки
+в task_events. Восстановление = ближайший бэкап до нужного момента + проигрывание
+событий журнала поверх него. Сжатие журнала удаляет события, которые уже есть
+во всех хранимых бэкапах.
+
+Использование:
+    python -m src.app.journal restore "2025-11-05 14:30" /tmp/restored.db
+    python -m src.app.journal compact
+"""
+import os
+import sys
+import json
+import sqlite3
+import logging
+from datetime import timezone
+from .config import TZINFO
+from .db import (db_connect, TASK_COLUMNS, create_journal_triggers, drop_journal_triggers,
+                 migrate_closed_at, create_archive_table)
+from .backup import list_backups, open_backup_copy
+
+logger = logging.getLogger(__name__)
+
+def journal_ts(dt):
+    """Момент времени в формате колонки task_events.at (UTC, миллисекунды)"""
+    if dt.tzinfo is None:
+        dt = TZINFO.localize(dt)
+    dt = dt.astimezone(timezone.utc)
+    return f"{dt:%Y-%m-%dT%H:%M:%S}.{dt.microsecond // 1000:03d}"
+
+def fetch_events(after_id=0, until_ts=None, batch=1000):
+    """События журнала с id > after_id (и at <= until_ts), порциями по batch"""
+    conn = None
+    try:
+        conn = db_connect()
+        c = conn.cursor()
+        if until_ts:
+            c.execute("""
+              SELECT id, task_id, op, at, row_json FROM task_events
+              WHERE id > ? AND at <= ?
+              ORDER BY id
+            """, (after_id, until_ts))
+        else:
+            c.execute("""
+              SELECT id, task_id, op, at, row_json FROM task_events
+              WHERE id > ?
+              ORDER BY id
+            """, (after_id,))
+        while True:
+            rows = c.fetchmany(batch)
+            if not rows:
+                break
+            for r in rows:
+                yield r
+    finally:
+        if conn:
+            conn.close()
+
+def replay_events(conn, events):
+    """Применяет события к tasks в conn (триггеры журнала на время проигрывания снимаются,
+    сами события копируются в task_events как есть). Возвращает число применённых событий."""
+    c = conn.cursor()
+    cols = ",".join(TASK_COLUMNS)
+    marks = ",".join("?" for _ in TASK_COLUMNS)
+    # UPSERT, а не REPLACE: так срабатывают UPDATE-триггеры (например, task_stats_daily)
+    updates = ",".join(f"{col}=excluded.{col}" for col in TASK_COLUMNS if col != "id")
+    archive_sql = (f"INSERT INTO tasks_archive({cols},archived_at) VALUES ({marks},?) "
+                   f"ON CONFLICT(id) DO UPDATE SET {updates},archived_at=excluded.archived_at;")
+    applied = 0
+    drop_journal_triggers(c)
+    try:
+        for ev in events:
+            if ev["op"] == "D":
+                c.execute("DELETE FROM tasks WHERE id=?;", (ev["task_id"],))
+            elif ev["op"] == "A":
+                # Перенос в архив: сначала строка архива, потом удаление из tasks
+                row = json.loads(ev["row_json"])
+                c.execute(archive_sql, [row.get(col) for col in TASK_COLUMNS] + [ev["at"]])
+                c.execute("DELETE FROM tasks WHERE id=?;", (ev["task_id"],))
+            else:
+                row = json.loads(ev["row_json"])
+                c.execute(f"INSERT INTO tasks({cols}) VALUES ({marks}) ON CONFLICT(id) DO UPDATE SET {updates};",
+                          [row.get(col) for col in TASK_COLUMNS])
+            c.execute("INSERT OR IGNORE INTO task_events(id, task_id, op, at, row_json) VALUES (?,?,?,?,?);",
+                      (ev["id"], ev["task_id"], ev["op"], ev["at"], ev["row_json"]))
+            applied += 1
+        create_journal_triggers(c)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return applied
+
+def restore_to(target_dt, out_path):
+    """Собирает копию БД на момент target_dt в out_path.
+    Берёт ближайший бэкап не позже target_dt и проигрывает поверх него журнал."""
+    until = journal_ts(target_dt)
+    # created в манифесте — локальное время системы (datetime.now())
+    target_naive = target_dt.astimezone().replace(tzinfo=None) if target_dt.tzinfo else target_dt
+    candidates = [b for b in list_backups(limit=None) if b["created"] <= target_naive]
+    if not candidates:
+        raise RuntimeError(f"Нет бэкапа раньше {target_dt}")
+    base = candidates[0]
+
+    if os.path.exists(out_path):
+        os.remove(out_path)
+    open_backup_copy(base, out_path)
+
+    conn = sqlite3.connect(out_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        # Бэкап мог быть снят до появления журнала — создаём схему при необходимости
+        c = conn.cursor()
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS task_events(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            at TEXT NOT NULL,
+            row_json TEXT
+        );
+        """)
+        migrate_closed_at(c)
+        create_archive_table(c)
+        row = c.execute("SELECT MAX(id) FROM task_events;").fetchone()
+        after_id = row[0] or 0
+        # События, попавшие в бэкап, но произошедшие позже target, не откатить — предупреждаем
+        late = c.execute("SELECT COUNT(*) FROM task_events WHERE at > ?;", (until,)).fetchone()[0]
+        if late:
+            logger.warning(f"Backup {base['filename']} already contains {late} events after target")
+        applied = replay_events(conn, fetch_events(after_id, until))
+    finally:
+        conn.close()
+    logger.info(f"Restored {out_path} from {base['filename']} + {applied} events (until {until})")
+    return {"backup": base["filename"], "events": applied, "path": out_path}
+
+def compact_journal():
+    """Удаляет события, которые уже содержатся во всех хранимых бэкапах.
+    Возвращает число удалённых строк."""
+    positions = [b["journal_id"] for b in list_backups(limit=None) if b.get("journal_id") is not None]
+    if not positions:
+        return 0
+    upto = min(positions)
+    conn = None
+    try:
+        conn = db_connect()
+        c = conn.cursor()
+        c.execute("DELETE FROM task_events WHERE id <= ?;", (upto,))
+        removed = c.rowcount
+        conn.commit()
+        if removed:
+            logger.info(f"Journal compacted: removed {removed} events (id <= {upto})")
+        return removed
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Failed to compact journal: {e}", exc_info=True)
+        return 0
+    finally:
+        if conn:
+            conn.close()
+
+def main(argv=None):
+    import argparse
+    from dateutil.parser import parse as parse_dt
+    parser = argparse.ArgumentParser(prog="python -m src.app.journal")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_restore = sub.add_parser("restore", help="восстановить БД на момент времени (локальное время TZ)")
+    p_restore.add_argument("when")
+    p_restore.add_argument("out")
+    sub.add_parser("compact", help="сжать журнал")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.cmd == "restore":
+        when = parse_dt(args.when)
+        if when.tzinfo is None:
+            when = TZINFO.localize(when)
+        res = restore_to(when, args.out)
+        print(f"Restored {res['path']} from {res['backup']} + {res['events']} events")
+    elif args.cmd == "compact":
+        print(f"Removed {compact_journal()} events")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Классификатор задач по ключевым словам названия.
+
+Раньше каждый признак искался отдельным циклом `kw in t` (оценка длительности,
+бонус важности, лягушка/камень — в десятке мест). Здесь все группы из
+config.TASK_KEYWORDS собраны в один автомат Ахо–Корасик: название проходится один
+раз, и находятся все вхождения, в том числе перекрывающиеся («разработ» и «бот»).
+Результат кэшируется по названию.
+"""
+import logging
+from collections import deque
+from functools import lru_cache
+from typing import NamedTuple
+from .config import TASK_KEYWORDS
+
+logger = logging.getLogger(__name__)
+
+# Оценка длительности (минуты): первая сработавшая группа по порядку, иначе DEFAULT_MINUTES
+EST_GROUPS = (("est_high", 90), ("est_mid", 45), ("est_low", 15))
+DEFAULT_MINUTES = 30
+IMPORTANT_WEIGHT = 8.0   # за каждое ключевое слово из important
+FROG_BONUS = 12.0        # за frog_bonus
+
+class TaskFeatures(NamedTuple):
+    est_minutes: int
+    importance: float        # бонус важности для priority.importance_boost
+    important: frozenset     # найденные слова из important
+    kind: str                # "frog" | "stone" | "sand"
+
+def build_automaton(groups):
+    """{группа: [слова]} -> (goto, fail, out): переходы бора по символам, суффиксные ссылки
+    и выходы (группа, слово) каждого состояния, включая выходы по fail-цепочке"""
+    goto, out = [{}], [set()]
+    for group, words in groups.items():
+        for word in words:
+            state = 0
+            for ch in word.lower():
+                if ch not in goto[state]:
+                    goto.append({})
+                    out.append(set())
+                    goto[state][ch] = len(goto) - 1
+                state = goto[state][ch]
+            out[state].add((group, word))
+    # Суффиксные ссылки обходом в ширину: у состояния глубины d ссылка глубины < d уже готова
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for ch, nxt in goto[state].items():
+            queue.append(nxt)
+            f = fail[state]
+            while f and ch not in goto[f]:
+                f = fail[f]
+            fail[nxt] = goto[f].get(ch, 0) if state else 0
+            out[nxt] |= out[fail[nxt]]
+    return goto, fail, out
+
+_goto, _fail, _out = build_automaton(TASK_KEYWORDS)
+
+def find_keywords(text):
+    """Все (группа, слово) из TASK_KEYWORDS, встречающиеся в text подстрокой"""
+    found = set()
+    state = 0
+    for ch in (text or "").lower():
+        while state and ch not in _goto[state]:
+            state = _fail[state]
+        state = _goto[state].get(ch, 0)
+        found |= _out[state]
+    return found
+
+@lru_cache(maxsize=4096)
+def classify(title):
+    """Признаки задачи по названию за один проход"""
+    hits = {}
+    for group, word in find_keywords(title):
+        hits.setdefault(group, set()).add(word)
+    est = next((minutes for group, minutes in EST_GROUPS if group in hits), DEFAULT_MINUTES)
+    important = frozenset(hits.get("important", ()))
+    importance = IMPORTANT_WEIGHT * len(important) + (FROG_BONUS if "frog_bonus" in hits else 0.0)
+    kind = "frog" if "frog" in hits else "stone" if "stone" in hits else "sand"
+    return TaskFeatures(est, importance, important, kind)
+
+def task_kind(title):
+    """Тип задачи недели по названию: frog | stone | sand"""
+    return classify(title or "").kind
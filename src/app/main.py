@@ -4,21 +4,23 @@ from telegram.ext import (
 )
 from .config import TELEGRAM_BOT_TOKEN, LOG_LEVEL
 from .db import db_init
+from .instrumentation import instrument_application, start_metrics_server
+from .watchdog import attribute_handlers, start_loop_watchdog
 from .scheduler import start_reminder_loop, start_nudges_loop, start_weekend_scheduler, schedule_daily_plan
 from .handlers import (
     cmd_start, cmd_add, msg_voice, cmd_inbox, cmd_plan, cmd_plan_date,
-    cmd_done, cmd_snooze, cmd_week, cmd_export, cmd_unknown, cmd_stats, cmd_health,
+    cmd_done, cmd_snooze, cmd_week, cmd_search, cmd_export, cmd_unknown, cmd_stats, cmd_health, cmd_profile, cmd_tenant,
     cmd_push_week, cmd_pull_week, cmd_sync_notion, cmd_generate_week,
-    cmd_merge_inbox, cmd_commit_week, cmd_drop, cmd_writeback_ids, cmd_reflect, msg_text_any, cmd_ai_review, cmd_weekend, cmd_calendar_advice, cmd_can_take, callback_can_take, cmd_fix_times, cmd_roll_over, cmd_rebalance_week, cmd_ai_rebalance
+    cmd_merge_inbox, cmd_commit_week, cmd_drop, cmd_writeback_ids, cmd_reflect, msg_text_any, cmd_ai_review, cmd_weekend, cmd_calendar_advice, cmd_can_take, callback_can_take, callback_page, cmd_fix_times, cmd_roll_over, cmd_rebalance_week, cmd_ai_rebalance, cmd_reprioritize
 )
 
-def main():
-    logging.basicConfig(level=getattr(logging, LOG_LEVEL.upper(), logging.INFO),
-                        format="%(asctime)s %(levelname)s %(message)s")
-
-    db_init()
-
-    app = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+def build_application(token=TELEGRAM_BOT_TOKEN, request=None):
+    """Application со всеми хендлерами и инструментированием, без фоновых циклов.
+    request — подмена HTTP-транспорта Bot API (например, фейк для нагрузочных тестов)."""
+    builder = ApplicationBuilder().token(token)
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    app = builder.build()
 
     app.add_handler(CommandHandler("start", cmd_start))
     app.add_handler(CommandHandler("add", cmd_add))
@@ -29,9 +31,13 @@ def main():
     app.add_handler(CommandHandler("snooze", cmd_snooze))
     app.add_handler(CommandHandler("drop", cmd_drop))
     app.add_handler(CommandHandler("week", cmd_week))
+    app.add_handler(CommandHandler("search", cmd_search))
     app.add_handler(CommandHandler("export", cmd_export))
     app.add_handler(CommandHandler("stats", cmd_stats))
     app.add_handler(CommandHandler("health", cmd_health))
+    # Профиль идёт 30 с–2 мин: не блокируем обработку остальных апдейтов на это время
+    app.add_handler(CommandHandler("profile", cmd_profile, block=False))
+    app.add_handler(CommandHandler("tenant", cmd_tenant))
     app.add_handler(CommandHandler("push_week", cmd_push_week))
     app.add_handler(CommandHandler("pull_week", cmd_pull_week))
     app.add_handler(CommandHandler("sync_notion", cmd_sync_notion))
@@ -48,15 +54,32 @@ def main():
     app.add_handler(CommandHandler("roll_over", cmd_roll_over))
     app.add_handler(CommandHandler("rebalance_week", cmd_rebalance_week))
     app.add_handler(CommandHandler("ai_rebalance", cmd_ai_rebalance))
+    app.add_handler(CommandHandler("reprioritize", cmd_reprioritize))
     
     # Обработчик callback для кнопок /can_take
     app.add_handler(CallbackQueryHandler(callback_can_take, pattern="^can_take_"))
+    app.add_handler(CallbackQueryHandler(callback_page, pattern="^page:"))
 
     # Текстовый ответ для /reflect
     app.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), msg_text_any))
     app.add_handler(MessageHandler(filters.VOICE & (~filters.COMMAND), msg_voice))
     app.add_handler(MessageHandler(filters.COMMAND, cmd_unknown))
 
+    # Латентность всех хендлеров (отдаётся через /metrics)
+    instrument_application(app)
+    # Сторож event loop: лаг, остановки с атрибуцией к хендлеру
+    attribute_handlers(app)
+    return app
+
+def main():
+    logging.basicConfig(level=getattr(logging, LOG_LEVEL.upper(), logging.INFO),
+                        format="%(asctime)s %(levelname)s %(message)s")
+
+    db_init()
+
+    app = build_application()
+    start_metrics_server()
+
     # Уведомления о сроках
     start_reminder_loop(app)
     
@@ -72,6 +95,8 @@ def main():
     except Exception:
         logging.exception("Failed to start schedule_daily_plan")
 
+    start_loop_watchdog()
+
     app.run_polling()
 
 if __name__ == "__main__":
@@ -1,104 +1,142 @@
+import time
 import logging
-from datetime import datetime, timedelta
-from .db import db_connect
-from .config import TZINFO, DB_PATH
+import threading
+from datetime import datetime, timedelta, timezone
+from .db import ReadOnlyPool
+from .instrumentation import registry
+from .config import DB_PATH
 import os
 
 logger = logging.getLogger(__name__)
 
+def _since_day(days):
+    """Дата (UTC, YYYY-MM-DD), с которой считаем окно в task_stats_daily.
+    Свёртка хранит день по UTC, поэтому окно — целые UTC-сутки (за 7 дней это
+    7–8 суток), а не скользящие 7×24 ч и не сутки в поясе чата."""
+    return (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
+
 class Metrics:
-    """Сбор и отображение метрик бота"""
-    
-    def __init__(self):
-        self.conn = None
-    
-    def _get_connection(self):
-        """Получает соединение с БД"""
-        if not self.conn:
-            self.conn = db_connect()
-        return self.conn
-    
+    """Сбор и отображение метрик бота.
+    Все запросы идут в свёртку task_stats_daily, а не в tasks.
+    Чтения идут через собственный пул read-only соединений, поэтому
+    один экземпляр безопасно делить между хендлерами и потоками."""
+
+    def __init__(self, pool_size=4):
+        self.pool = ReadOnlyPool(size=pool_size)
+        self._timings = {}
+        self._timings_lock = threading.Lock()
+
+    def _query(self, name, sql, params=(), one=False):
+        """Выполняет запрос на пуловом соединении и учитывает его время"""
+        started = time.perf_counter()
+        try:
+            with self.pool.cursor() as c:
+                c.execute(sql, params)
+                return c.fetchone() if one else c.fetchall()
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._timings_lock:
+                t = self._timings.setdefault(name, {"count": 0, "total_s": 0.0, "max_s": 0.0})
+                t["count"] += 1
+                t["total_s"] += elapsed
+                t["max_s"] = max(t["max_s"], elapsed)
+            registry.observe("db_query_seconds", elapsed, op=f"metrics_{name}")
+            logger.debug(f"metrics query {name}: {elapsed * 1000:.1f} ms")
+
+    def query_timings(self):
+        """Снимок времени запросов: имя -> count/total_s/max_s"""
+        with self._timings_lock:
+            return {k: dict(v) for k, v in self._timings.items()}
+
+    def close(self):
+        self.pool.close()
+
     def get_stats(self, chat_id):
         """Возвращает статистику для пользователя"""
         try:
-            conn = self._get_connection()
-            c = conn.cursor()
-            
-            # Общая статистика
-            c.execute("""
-                SELECT 
-                    COUNT(*) as total_tasks,
-                    SUM(CASE WHEN status='done' THEN 1 ELSE 0 END) as done_tasks,
-                    SUM(CASE WHEN status='open' THEN 1 ELSE 0 END) as open_tasks,
-                    SUM(CASE WHEN status='open' AND due_at IS NOT NULL THEN 1 ELSE 0 END) as tasks_with_deadline,
-                    SUM(CASE WHEN status='done' AND source='voice' THEN 1 ELSE 0 END) as voice_tasks
-                FROM tasks
+            # Общая статистика и окно за 7 дней — один проход по свёртке чата
+            total_stats = self._query("stats_totals", """
+                SELECT
+                    COALESCE(SUM(cnt), 0) as total_tasks,
+                    COALESCE(SUM(CASE WHEN status='done' THEN cnt ELSE 0 END), 0) as done_tasks,
+                    COALESCE(SUM(CASE WHEN status='open' THEN cnt ELSE 0 END), 0) as open_tasks,
+                    COALESCE(SUM(CASE WHEN status='open' AND has_due THEN cnt ELSE 0 END), 0) as tasks_with_deadline,
+                    COALESCE(SUM(CASE WHEN status='done' AND source='voice' THEN cnt ELSE 0 END), 0) as voice_tasks,
+                    COALESCE(SUM(CASE WHEN day >= ? THEN cnt ELSE 0 END), 0) as tasks_added_week,
+                    COALESCE(SUM(CASE WHEN day >= ? AND status='done' THEN cnt ELSE 0 END), 0) as tasks_done_week
+                FROM task_stats_daily
                 WHERE chat_id=?
-            """, (chat_id,))
-            total_stats = c.fetchone()
-            
-            # Статистика за последние 7 дней
-            week_ago = (datetime.now(TZINFO) - timedelta(days=7)).isoformat()
-            c.execute("""
-                SELECT 
-                    COUNT(*) as tasks_added_week,
-                    SUM(CASE WHEN status='done' THEN 1 ELSE 0 END) as tasks_done_week
-                FROM tasks
-                WHERE chat_id=? AND added_at >= ?
-            """, (chat_id, week_ago))
-            week_stats = c.fetchone()
-            
+            """, (_since_day(7), _since_day(7), chat_id), one=True)
+
             # Топ контексты
-            c.execute("""
-                SELECT context, COUNT(*) as count
-                FROM tasks
+            top_contexts = self._query("stats_top_contexts", """
+                SELECT context, SUM(cnt) as count
+                FROM task_stats_daily
                 WHERE chat_id=? AND status='open'
                 GROUP BY context
+                HAVING SUM(cnt) > 0
                 ORDER BY count DESC
                 LIMIT 5
             """, (chat_id,))
-            top_contexts = c.fetchall()
-            
+
             # Размер БД
             db_size = os.path.getsize(DB_PATH) if os.path.exists(DB_PATH) else 0
-            
+
             return {
                 "total_tasks": total_stats["total_tasks"],
                 "done_tasks": total_stats["done_tasks"],
                 "open_tasks": total_stats["open_tasks"],
                 "tasks_with_deadline": total_stats["tasks_with_deadline"],
                 "voice_tasks": total_stats["voice_tasks"],
-                "tasks_added_week": week_stats["tasks_added_week"],
-                "tasks_done_week": week_stats["tasks_done_week"],
-                "top_contexts": [{"context": r["context"], "count": r["count"]} for r in top_contexts],
+                "tasks_added_week": total_stats["tasks_added_week"],
+                "tasks_done_week": total_stats["tasks_done_week"],
+                "top_contexts": [{"context": r["context"] or None, "count": r["count"]} for r in top_contexts],
                 "db_size_kb": round(db_size / 1024, 1)
             }
         except Exception as e:
             logger.error(f"Failed to get stats: {e}", exc_info=True)
             return None
-    
+
+    def get_context_stats(self, chat_id):
+        """Прогресс по контекстам: done/open/total"""
+        try:
+            rows = self._query("stats_contexts", """
+                SELECT context,
+                       SUM(CASE WHEN status='done' THEN cnt ELSE 0 END) as done_count,
+                       SUM(CASE WHEN status='open' THEN cnt ELSE 0 END) as open_count,
+                       SUM(cnt) as total_count
+                FROM task_stats_daily
+                WHERE chat_id=?
+                GROUP BY context
+                HAVING SUM(cnt) > 0
+                ORDER BY total_count DESC
+            """, (chat_id,))
+            return [{
+                "context": r["context"] or None,
+                "done_count": r["done_count"],
+                "open_count": r["open_count"],
+                "total_count": r["total_count"],
+            } for r in rows]
+        except Exception as e:
+            logger.error(f"Failed to get context stats: {e}", exc_info=True)
+            return []
+
     def get_productivity_score(self, chat_id, days=7):
         """Вычисляет productivity score за период"""
         try:
-            conn = self._get_connection()
-            c = conn.cursor()
-            
-            start_date = (datetime.now(TZINFO) - timedelta(days=days)).isoformat()
-            c.execute("""
-                SELECT 
-                    SUM(CASE WHEN status='done' THEN 1 ELSE 0 END) as done,
-                    SUM(CASE WHEN status='open' THEN 1 ELSE 0 END) as open
-                FROM tasks
-                WHERE chat_id=? AND added_at >= ?
-            """, (chat_id, start_date))
-            
-            result = c.fetchone()
+            result = self._query("productivity", """
+                SELECT
+                    SUM(CASE WHEN status='done' THEN cnt ELSE 0 END) as done,
+                    SUM(CASE WHEN status='open' THEN cnt ELSE 0 END) as open
+                FROM task_stats_daily
+                WHERE chat_id=? AND day >= ?
+            """, (chat_id, _since_day(days)), one=True)
             done = result["done"] or 0
             open = result["open"] or 0
-            
+
             if done + open == 0:
                 return 0
-            
+
             score = (done / (done + open)) * 100
             return round(score, 1)
         except Exception as e:
@@ -0,0 +1,91 @@
+"""
+Приоритет задачи и его периодический пересчёт.
+
+priority = 0.5 * срочность(срок, сейчас) + статическая часть (ключевые слова и длительность).
+Срочность меняется со временем, поэтому записанный при создании priority устаревает.
+refresh_priorities пересчитывает все открытые задачи одним UPDATE: статическая часть
+кэшируется в tasks.priority_base (считается в Python один раз, сбрасывается триггером
+при смене названия или оценки), а кривая срочности вычисляется SQLite сразу по всем
+due_epoch. Запускается из фонового цикла каждые PRIORITY_REFRESH_MIN минут и по /reprioritize.
+"""
+import logging
+from datetime import datetime, timezone
+from .config import TZINFO
+from .db import db_connect
+from .keywords import classify
+
+logger = logging.getLogger(__name__)
+
+# Шкала срочности: 100 при сроке «сейчас», вдвое меньше через 12 часов
+URGENCY_HALF_H = 12.0
+
+def urgency_score(due):
+    if not due: return 10.0
+    now = datetime.now(TZINFO)
+    delta_h = (due - now).total_seconds() / 3600.0
+    if delta_h <= 0: return 100.0
+    # 12-часовая шкала
+    val = 100.0 * (1.0 / (1.0 + delta_h / URGENCY_HALF_H))
+    return max(10.0, min(100.0, val))
+
+def importance_boost(title: str) -> float:
+    return classify(title).importance
+
+def estimate_minutes(title: str) -> int:
+    return classify(title).est_minutes
+
+def duration_bonus(minutes_: int) -> float:
+    if minutes_ <= 25: return +10.0
+    if minutes_ <= 50: return 0.0
+    return -10.0
+
+def base_score(title: str, est_min) -> float:
+    """Часть приоритета, не зависящая от времени"""
+    return 0.4*importance_boost(title or "") + 0.1*(50 + duration_bonus(30 if est_min is None else est_min))
+
+def compute_priority(title: str, due, est_min: int) -> float:
+    raw = 0.5*urgency_score(due) + base_score(title, est_min)
+    return max(0.0, min(100.0, raw))
+
+# urgency_score над колонкой due_epoch (:now — текущее время в секундах UTC)
+URGENCY_SQL = f"""
+  CASE WHEN due_epoch IS NULL THEN 10.0
+       WHEN due_epoch <= :now THEN 100.0
+       ELSE MAX(10.0, MIN(100.0, 100.0 / (1.0 + (due_epoch - :now) / {URGENCY_HALF_H * 3600.0})))
+  END"""
+
+def refresh_priorities(chat_id=None, now_utc=None):
+    """Пересчитывает priority открытых задач (всех или одного чата) одной транзакцией.
+    Возвращает число задач, у которых приоритет изменился."""
+    now_utc = now_utc or datetime.now(timezone.utc)
+    scope = " AND chat_id = :chat_id" if chat_id is not None else ""
+    params = {"now": int(now_utc.timestamp()), "chat_id": chat_id}
+    conn = None
+    try:
+        conn = db_connect()
+        c = conn.cursor()
+        # Кэш статической части: только новые задачи и задачи со сменившимся названием/оценкой
+        missing = c.execute(f"""
+          SELECT id, title, est_minutes FROM tasks
+          WHERE status='open' AND priority_base IS NULL{scope}
+        """, params).fetchall()
+        if missing:
+            c.executemany("UPDATE tasks SET priority_base=? WHERE id=?;",
+                          [(base_score(r["title"], r["est_minutes"]), r["id"]) for r in missing])
+        new_priority = f"MAX(0.0, MIN(100.0, 0.5 * ({URGENCY_SQL}) + priority_base))"
+        c.execute(f"""
+          UPDATE tasks SET priority = {new_priority}
+          WHERE status='open'{scope} AND priority IS NOT {new_priority}
+        """, params)
+        changed = c.rowcount
+        conn.commit()
+        logger.info(f"Refreshed priorities: {changed} changed, {len(missing)} base scores computed")
+        return changed
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Failed to refresh priorities: {e}", exc_info=True)
+        return 0
+    finally:
+        if conn:
+            conn.close()
@@ -0,0 +1,181 @@
+"""
+Встроенный профайлер для живой диагностики (/profile).
+
+Два режима:
+  sample   — сэмплирующий профайлер: отдельный поток раз в PROFILER_INTERVAL_MS
+             снимает стеки всех потоков процесса (sys._current_frames) и копит их
+             в collapsed-формате (совместим с flamegraph.pl / speedscope);
+  cprofile — cProfile на потоке event loop на ограниченное окно, результат — .pstats.
+
+В обоих режимах параллельно меряются остановки event loop (stalls).
+Команда доступна только при PROFILER_ENABLED=1.
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import tempfile
+import threading
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+PROFILER_MAX_SECONDS = int(os.getenv("PROFILER_MAX_SECONDS", "120"))
+# Тик, которым меряется задержка event loop, и порог, с которого она считается остановкой
+STALL_TICK_S = 0.02
+STALL_THRESHOLD_S = float(os.getenv("PROFILER_STALL_MS", "100")) / 1000
+
+_profile_lock = None
+
+def _frame_label(frame):
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def collapse_stack(frame, thread_name="", max_depth=128):
+    """Стек кадра в collapsed-строку: корень;...;лист"""
+    parts = []
+    while frame is not None and len(parts) < max_depth:
+        parts.append(_frame_label(frame))
+        frame = frame.f_back
+    if thread_name:
+        parts.append(thread_name)
+    return ";".join(reversed(parts))
+
+class SamplingProfiler:
+    """Сэмплер стеков всех потоков (кроме собственного) в фоне"""
+
+    def __init__(self, interval_s=None):
+        self.interval_s = (PROFILER_INTERVAL_MS / 1000) if interval_s is None else interval_s
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.is_set():
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                self.stacks[collapse_stack(frame, names.get(ident, str(ident)))] += 1
+            self.samples += 1
+            self._stop.wait(self.interval_s)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def collapsed(self):
+        """Текст в collapsed-формате: «стек количество» на строку"""
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+    def top_frames(self, limit=10):
+        """Самые частые листовые кадры (self time): [(кадр, доля)]"""
+        leaves = Counter()
+        for stack, n in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += n
+        total = sum(leaves.values()) or 1
+        return [(frame, n / total) for frame, n in leaves.most_common(limit)]
+
+async def measure_stalls(duration_s, tick_s=STALL_TICK_S, threshold_s=STALL_THRESHOLD_S):
+    """Спит тиками по tick_s и копит опоздания пробуждения больше threshold_s"""
+    loop = asyncio.get_running_loop()
+    stalls = []
+    deadline = loop.time() + duration_s
+    while loop.time() < deadline:
+        expected = loop.time() + tick_s
+        await asyncio.sleep(tick_s)
+        lag = loop.time() - expected
+        if lag >= threshold_s:
+            stalls.append(lag)
+    return stalls
+
+def _pstats_top(profile, limit=10):
+    import pstats
+    stats = pstats.Stats(profile)
+    rows = []
+    for (filename, lineno, func), (cc, nc, tt, ct, callers) in stats.stats.items():
+        rows.append((f"{func} ({os.path.basename(filename)}:{lineno})", ct))
+    rows.sort(key=lambda r: r[1], reverse=True)
+    return rows[:limit]
+
+async def profile_for(seconds, mode="sample"):
+    """Профилирует процесс seconds секунд. Возвращает dict:
+    path, filename, mode, samples, top [(кадр, доля или секунды)], stalls {count, max_s, total_s}.
+    Файл по path удаляет вызывающий."""
+    global _profile_lock
+    if mode not in ("sample", "cprofile"):
+        raise ValueError(f"Неизвестный режим профилирования: {mode}")
+    seconds = max(1, min(int(seconds), PROFILER_MAX_SECONDS))
+    if _profile_lock is None:
+        _profile_lock = asyncio.Lock()
+    if _profile_lock.locked():
+        raise RuntimeError("Профилирование уже идёт")
+
+    async with _profile_lock:
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        started = time.perf_counter()
+        if mode == "sample":
+            sampler = SamplingProfiler()
+            sampler.start()
+            try:
+                stalls = await measure_stalls(seconds)
+            finally:
+                sampler.stop()
+            filename = f"profile_{stamp}.collapsed.txt"
+            fd, path = tempfile.mkstemp(prefix="profile_", suffix=".txt")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(sampler.collapsed())
+            samples, top = sampler.samples, sampler.top_frames()
+        else:
+            import cProfile
+            prof = cProfile.Profile()
+            prof.enable()
+            try:
+                stalls = await measure_stalls(seconds)
+            finally:
+                prof.disable()
+            filename = f"profile_{stamp}.pstats"
+            fd, path = tempfile.mkstemp(prefix="profile_", suffix=".pstats")
+            os.close(fd)
+            prof.dump_stats(path)
+            samples, top = None, _pstats_top(prof)
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Profile {mode} for {elapsed:.1f}s: {len(stalls)} loop stalls, saved {path}")
+    return {
+        "path": path,
+        "filename": filename,
+        "mode": mode,
+        "seconds": seconds,
+        "samples": samples,
+        "top": top,
+        "stalls": {
+            "count": len(stalls),
+            "max_s": max(stalls) if stalls else 0.0,
+            "total_s": sum(stalls),
+        },
+    }
+
+def parse_duration(text, default=30):
+    """'30', '30s', '2m' -> секунды"""
+    if not text:
+        return default
+    t = text.strip().lower()
+    mult = 1
+    if t.endswith("m"):
+        mult, t = 60, t[:-1]
+    elif t.endswith("s"):
+        t = t[:-1]
+    return int(float(t) * mult)
@@ -0,0 +1,97 @@
+"""
+Перенос несделанных задач дня.
+
+rollover_day(chat_id, day) — один запрос за задачами дня, расчёт новых слотов в
+памяти и одна транзакция на запись. rollover_days делает то же для многих чатов
+сразу (ночной job): задачи всех чатов выбираются одним запросом.
+Результат — отчёт-словарь, из которого format_report строит сообщение и для
+ночного пинка, и для ручного /roll_over day.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from .db import open_due_in_windows, reschedule_tasks, iso_utc
+from .tzcalendar import day_bounds, local_today
+from .keywords import task_kind
+from . import tenants
+
+logger = logging.getLogger(__name__)
+
+# Задачи от стольких минут считаются крупными и уходят на воскресенье
+LARGE_TASK_MINUTES = 90
+
+def rollover_slot(tz, day, title, est_minutes):
+    """Новое время для несделанной задачи дня day: крупные — на ближайшее воскресенье 10:00,
+    остальные — на следующий день (в воскресенье весь день, в будни только вечер)"""
+    tomorrow = day + timedelta(days=1)
+    tomorrow_weekday = tomorrow.weekday()
+    kind = task_kind(title)
+    if est_minutes >= LARGE_TASK_MINUTES:
+        target, hm = tomorrow + timedelta(days=(6 - tomorrow_weekday) % 7), (10, 0)
+    elif tomorrow_weekday == 6:  # Воскресенье - весь день
+        target = tomorrow
+        hm = {"frog": (9, 0), "stone": (14, 0)}.get(kind, (10, 0))
+    else:  # Пн-Сб - только вечер
+        target = tomorrow
+        hm = {"frog": (19, 30), "stone": (20, 0)}.get(kind, (20, 30))
+    return tz.localize(datetime(target.year, target.month, target.day, *hm))
+
+def _plan(chat_id, tz, day, rows):
+    """Отчёт с рассчитанными переносами (ещё не применёнными)"""
+    moves = []
+    for r in rows:
+        est = r["est_minutes"] or 30
+        new_due = rollover_slot(tz, day, r["title"], est)
+        moves.append({"id": r["id"], "title": r["title"], "new_due": iso_utc(new_due),
+                      "large": est >= LARGE_TASK_MINUTES})
+    return {"chat_id": chat_id, "day": day.isoformat(), "moves": moves, "moved": 0, "large": 0, "regular": 0}
+
+def _apply(report):
+    """Записывает переносы одной транзакцией и заполняет счётчики.
+    Всё или ничего: если часть задач успела исчезнуть, не переносится ни одна
+    (следующий запуск пересчитает), так что счётчики всегда по применённым переносам."""
+    moves = report["moves"]
+    changed = reschedule_tasks(report["chat_id"], [(m["id"], m["new_due"]) for m in moves], strict=True)
+    if changed != len(moves):
+        logger.warning(f"Rollover for chat {report['chat_id']}: transaction failed, nothing moved")
+        report["moves"] = []
+        return report
+    report["moved"] = len(moves)
+    report["large"] = sum(1 for m in moves if m["large"])
+    report["regular"] = report["moved"] - report["large"]
+    return report
+
+def rollover_days(targets, dry_run=False):
+    """Перенос несделанного для многих чатов: targets — [(chat_id, tz, день)].
+    Один запрос на выборку и по транзакции на чат. Возвращает {chat_id: отчёт}."""
+    windows = [(chat_id,) + day_bounds(tz, day) for chat_id, tz, day in targets]
+    by_chat = {chat_id: [] for chat_id, _, _ in targets}
+    for row in open_due_in_windows(windows):
+        by_chat[row["chat_id"]].append(row)
+    reports = {}
+    for chat_id, tz, day in targets:
+        report = _plan(chat_id, tz, day, by_chat[chat_id])
+        reports[chat_id] = report if dry_run or not report["moves"] else _apply(report)
+    return reports
+
+def rollover_day(chat_id, day=None, tz=None, dry_run=False):
+    """Перенос несделанных задач дня day (по умолчанию — сегодня в поясе чата)"""
+    tz = tz or tenants.tenant_tz(chat_id)
+    day = day or local_today(tz)
+    return rollover_days([(chat_id, tz, day)], dry_run=dry_run)[chat_id]
+
+def rollover_tenants(due_tenants, now_utc=None):
+    """Ночной job: «сегодня» каждого тенанта — в его поясе"""
+    now_utc = now_utc or datetime.now(timezone.utc)
+    return rollover_days([(t["chat_id"], t["tz"], local_today(t["tz"], now_utc)) for t in due_tenants])
+
+def format_report(report, auto=False):
+    """Текст отчёта о переносе"""
+    if not report["moved"]:
+        return "🔄 Переносить нечего — несделанных задач на этот день нет."
+    prefix = "Автоматически перенесено" if auto else "Перенесено"
+    msg = f"🔄 {prefix} {report['moved']} несделанных задач"
+    if report["large"] > 0:
+        msg += f"\n• {report['large']} крупных задач ({LARGE_TASK_MINUTES}+ мин) → воскресенье"
+    if report["regular"] > 0:
+        msg += f"\n• {report['regular']} обычных задач → завтра"
+    return msg
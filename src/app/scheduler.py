@@ -1,297 +1,257 @@
+import asyncio
 import threading
 import time as time_mod
 import logging
 from datetime import datetime, timezone, timedelta
 from telegram.constants import ParseMode
 from telegram.error import TelegramError
-from .db import due_overdues
-from .config import TZINFO, ALLOWED_USER_ID
+from .db import due_overdues, iso_utc
 from .backup import create_backup
+from .journal import compact_journal
+from .archive import archive_closed_tasks
+from . import tenants
+from .tzcalendar import Timetable, day_bounds, local_today
+from .rollover import rollover_tenants, format_report
+from .priority import refresh_priorities
+from .config import PRIORITY_REFRESH_MIN
 
 logger = logging.getLogger(__name__)
 # Хранилище уже отправленных напоминаний (id задачи -> время)
 _sent_reminders = {}
-_weekend_manual_date = None
-_weekend_last_sent = None
+# Ручной /weekend: chat_id -> локальная дата запуска
+_weekend_manual_date = {}
+# Сколько минут после назначенного времени событие ещё считается «пора»
+SCHEDULE_GRACE_MIN = 5
+SEND_TIMEOUT_S = 30
+
+# Событие -> (поле расписания тенанта, день недели)
+NUDGE_EVENTS = {
+    "frog": ("frog_at", None),
+    "reflect": ("reflect_at", None),
+    "auto_rollover": ("rollover_at", None),
+    "commit_week": ("commit_week_at", None),
+}
+WEEKEND_EVENTS = {"weekend": ("weekend_at", 6)}
+PLAN_EVENTS = {"plan": ("plan_at", None)}
+
+def _send(app, loop, chat_id, text, **kwargs):
+    """Отправка из фонового потока: корутину исполняет event loop приложения"""
+    fut = asyncio.run_coroutine_threadsafe(app.bot.send_message(chat_id=chat_id, text=text, **kwargs), loop)
+    return fut.result(timeout=SEND_TIMEOUT_S)
+
+def _timetable(kinds):
+    return Timetable(kinds, grace=timedelta(minutes=SCHEDULE_GRACE_MIN))
 
 def backup_scheduler():
     """Отдельный поток для бэкапов БД каждый час"""
     def backup_loop():
         while True:
             try:
-                # Делаем бэкап каждый час
-                create_backup()
+                # Делаем бэкап каждый час, сжимаем журнал изменений и уносим старые закрытые задачи в архив
+                if create_backup():
+                    compact_journal()
+                archive_closed_tasks()
                 time_mod.sleep(3600)  # 1 час
             except Exception as e:
                 logger.error(f"Error in backup scheduler: {e}", exc_info=True)
                 time_mod.sleep(3600)
-    
+
     logger.info("Starting backup scheduler")
     th = threading.Thread(target=backup_loop, daemon=True)
     th.start()
 
-def start_reminder_loop(app):
+def start_reminder_loop(app, loop=None):
     # Запускаем бэкап-поток
     backup_scheduler()
-    
-    def loop():
+    loop = loop or asyncio.get_event_loop()
+
+    def reminder_loop():
         global _sent_reminders
-        
+        last_refresh = 0.0
+
         while True:
             try:
+                # Срочность зависит от времени — пересчитываем приоритеты открытых задач
+                if time_mod.time() - last_refresh >= PRIORITY_REFRESH_MIN * 60:
+                    last_refresh = time_mod.time()
+                    refresh_priorities()
+
                 now_utc_iso = datetime.now(timezone.utc).isoformat()
                 rows = due_overdues(now_utc_iso, limit=10)
-                
+
                 for row in rows:
                     tid, chat_id, title, due_iso = row["id"], row["chat_id"], row["title"], row["due_at"]
-                    
+                    tenant = tenants.get_tenant(chat_id)
+                    if not tenant or not tenant["active"]:
+                        continue
+
                     # Проверяем, не отправляли ли уже напоминание за последний час
                     last_sent = _sent_reminders.get(tid, 0)
                     if time_mod.time() - last_sent < 3600:  # 1 час
                         continue
-                    
+
                     try:
-                        app.bot.send_message(
-                            chat_id=chat_id,
-                            text=f"⏰ Срок: задача #{tid} — *{title}*",
-                            parse_mode=ParseMode.MARKDOWN
-                        )
+                        _send(app, loop, chat_id, f"⏰ Срок: задача #{tid} — *{title}*", parse_mode=ParseMode.MARKDOWN)
                         _sent_reminders[tid] = time_mod.time()
                         logger.info(f"Reminder sent for task #{tid}: {title}")
                     except TelegramError as e:
                         logger.warning(f"Failed to send reminder for task #{tid}: {e}")
                     except Exception as e:
                         logger.error(f"Unexpected error sending reminder for task #{tid}: {e}", exc_info=True)
-                
+
                 # Очистка старых записей (старше суток)
                 current_time = time_mod.time()
                 _sent_reminders = {tid: t for tid, t in _sent_reminders.items() if current_time - t < 86400}
-                
+
                 time_mod.sleep(60)
             except Exception as e:
                 logger.error(f"Error in reminder loop: {e}", exc_info=True)
                 time_mod.sleep(60)
-    
+
     logger.info("Starting reminder loop")
-    th = threading.Thread(target=loop, daemon=True)
+    th = threading.Thread(target=reminder_loop, daemon=True)
     th.start()
 
-def mark_weekend_manual_invoked():
-    from datetime import datetime
-    global _weekend_manual_date
-    _weekend_manual_date = datetime.now(TZINFO).date()
+def mark_weekend_manual_invoked(chat_id):
+    _weekend_manual_date[chat_id] = datetime.now(tenants.tenant_tz(chat_id)).date()
 
-def start_weekend_scheduler(app):
-    """По воскресеньям в 22:00 отправляет weekend-отчёт, если не запускали вручную до 21:30."""
-    def loop():
-        global _weekend_last_sent
-        from datetime import datetime, time
+def _has_sheets(tenant):
+    """Чужим чатам без своей таблицы нельзя ходить в общую из env"""
+    return bool(tenant["sheets_id"]) or tenants.is_admin(tenant["chat_id"])
+
+def start_weekend_scheduler(app, loop=None):
+    """По воскресеньям в weekend_at тенанта отправляет weekend-отчёт, если его не запускали вручную."""
+    loop = loop or asyncio.get_event_loop()
+
+    timetable = _timetable(WEEKEND_EVENTS)
+
+    def weekend_loop():
         while True:
             try:
-                now = datetime.now(TZINFO)
-                if now.weekday() == 6:  # Sunday
-                    today = now.date()
-                    # если ещё не отправляли
-                    if _weekend_last_sent != today:
-                        # если не было ручного запуска (или дата не сегодняшняя) и время >= 22:00
-                        if not (_weekend_manual_date == today) and (now.hour >= 22):
-                            # Сформировать краткий отчёт (облегчённый, без GPT при сбое)
-                            try:
-                                from .integrations.sheets import get_week_tasks_done_last_7d, get_reflections_last_7d
-                                tasks = get_week_tasks_done_last_7d()
-                                refl = get_reflections_last_7d()
-                                by_ctx = {}
-                                for t in tasks:
-                                    ctx = (t.get("Direction") or "").strip()
-                                    by_ctx[ctx] = by_ctx.get(ctx, 0) + 1
-                                ctx_lines = [f"- {k}: {v}" for k, v in sorted(by_ctx.items(), key=lambda x: (-x[1], x[0]))] or ["(no data)"]
-                                out = ["📅 Weekend summary", "\n".join(ctx_lines)]
-                                app.bot.send_message(chat_id=ALLOWED_USER_ID, text="\n".join(out))
-                            except Exception:
-                                pass
-                            _weekend_last_sent = today
-                time_mod.sleep(60)
-            except Exception:
-                time.sleep(60)
-    th = threading.Thread(target=loop, daemon=True)
+                for t, _ in timetable.due(tenants.active_tenants()):
+                    if _weekend_manual_date.get(t["chat_id"]) == local_today(t["tz"]) or not _has_sheets(t):
+                        continue
+                    # Краткий отчёт (облегчённый, без GPT)
+                    try:
+                        from .integrations.sheets import get_week_tasks_done_last_7d
+                        tasks = get_week_tasks_done_last_7d(t["sheets_id"])
+                        by_ctx = {}
+                        for task in tasks:
+                            ctx = (task.get("Direction") or "").strip()
+                            by_ctx[ctx] = by_ctx.get(ctx, 0) + 1
+                        ctx_lines = [f"- {k}: {v}" for k, v in sorted(by_ctx.items(), key=lambda x: (-x[1], x[0]))] or ["(no data)"]
+                        out = ["📅 Weekend summary", "\n".join(ctx_lines)]
+                        _send(app, loop, t["chat_id"], "\n".join(out))
+                    except Exception as e:
+                        logger.warning(f"Weekend summary failed for chat {t['chat_id']}: {e}")
+            except Exception as e:
+                logger.error(f"Error in weekend scheduler: {e}", exc_info=True)
+            time_mod.sleep(60)
+    th = threading.Thread(target=weekend_loop, daemon=True)
     th.start()
 
-def start_nudges_loop(app):
-    """Напоминания в определённое время дня (лягушка утром, рефлексия вечером)"""
+def start_nudges_loop(app, loop=None):
+    """Напоминания в определённое время дня (лягушка утром, рефлексия вечером), автоперенос
+    и авто-commit_week — по расписанию и часовому поясу каждого тенанта"""
     logger.info("Starting nudges loop")
-    
-    def loop():
-        from datetime import datetime
-        
-        sent_today = {"frog": False, "reflect": False, "commit_week": False, "auto_rollover": False}
+    loop = loop or asyncio.get_event_loop()
+
+    timetable = _timetable(NUDGE_EVENTS)
+
+    def nudges_loop():
         while True:
-            now = datetime.now(TZINFO)
             try:
-                # Лягушка (08:00)
-                if now.hour == 8 and now.minute == 0 and not sent_today["frog"]:
-                    app.bot.send_message(chat_id=ALLOWED_USER_ID, text="🐸 Напомнить: отметь лягушку дня (/plan)")
-                    sent_today["frog"] = True
-                    logger.info("Frog nudge sent")
-                
-                # Рефлексия (21:00)
-                if now.hour == 21 and now.minute == 0 and not sent_today["reflect"]:
-                    app.bot.send_message(chat_id=ALLOWED_USER_ID, text="🪞 Рефлексия 5 минут: используй /reflect для ежедневной рефлексии.")
-                    sent_today["reflect"] = True
-                    logger.info("Reflection nudge sent")
-                
-                # Автоматический перенос несделанных задач (22:00)
-                if now.hour == 22 and now.minute == 0 and not sent_today.get("auto_rollover", False):
+                rollover_due = []
+                for t, kind in timetable.due(tenants.active_tenants()):
+                    chat_id = t["chat_id"]
+
+                    # Лягушка
+                    if kind == "frog":
+                        _send(app, loop, chat_id, "🐸 Напомнить: отметь лягушку дня (/plan)")
+                        logger.info(f"Frog nudge sent to {chat_id}")
+
+                    # Рефлексия
+                    elif kind == "reflect":
+                        _send(app, loop, chat_id, "🪞 Рефлексия 5 минут: используй /reflect для ежедневной рефлексии.")
+                        logger.info(f"Reflection nudge sent to {chat_id}")
+
+                    # Автоматический перенос несделанных задач — собираем, выберем одним запросом
+                    elif kind == "auto_rollover":
+                        rollover_due.append(t)
+
+                    # Авто-обновление commit_week
+                    elif kind == "commit_week" and _has_sheets(t):
+                        try:
+                            from .integrations.sheets import import_week_from_sheets_to_bot
+                            added = import_week_from_sheets_to_bot(chat_id=chat_id, spreadsheet_id=t["sheets_id"])
+                            _send(app, loop, chat_id, f"✅ Авто-синхронизация: добавлено задач из Week_Tasks: {added}")
+                            logger.info(f"Auto commit_week for {chat_id}: added {added} tasks")
+                        except Exception as e:
+                            logger.error(f"Error in auto commit_week for {chat_id}: {e}", exc_info=True)
+
+                if rollover_due:
                     try:
-                        from .db import db_connect, snooze_task, iso_utc
-                        from datetime import timedelta
-                        conn = db_connect()
-                        c = conn.cursor()
-                        # Задачи, которые должны были быть сделаны сегодня, но не сделаны
-                        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-                        today_end = today_start + timedelta(days=1)
-                        c.execute("""
-                            SELECT id, chat_id, title, due_at
-                            FROM tasks
-                            WHERE chat_id=? AND status='open' AND due_at IS NOT NULL
-                                AND due_at >= ? AND due_at < ?
-                        """, (ALLOWED_USER_ID, iso_utc(today_start), iso_utc(today_end)))
-                        undone_today = c.fetchall()
-                        conn.close()
-                        
-                        moved_count = 0
-                        large_moved = 0
-                        # Переносим на завтра с умным распределением времени
-                        tomorrow = (now + timedelta(days=1)).date()
-                        tomorrow_weekday = tomorrow.weekday()
-                        
-                        # Находим следующее воскресенье для крупных задач
-                        days_until_sunday = (6 - tomorrow_weekday) % 7
-                        if days_until_sunday == 0 and tomorrow_weekday != 6:
-                            days_until_sunday = 7
-                        sunday_date = tomorrow + timedelta(days=days_until_sunday)
-                        
-                        for task in undone_today:
-                            try:
-                                from datetime import datetime as dt
-                                from .db import db_connect
-                                # Получаем время выполнения задачи
-                                conn = db_connect()
-                                c = conn.cursor()
-                                c.execute("SELECT est_minutes FROM tasks WHERE id=? AND chat_id=?", (task["id"], task["chat_id"]))
-                                task_row = c.fetchone()
-                                conn.close()
-                                
-                                est_minutes = (task_row["est_minutes"] if task_row else 30) or 30
-                                t = (task["title"] or "").lower()
-                                
-                                # Крупные задачи (90+ минут) переносим на воскресенье
-                                if est_minutes >= 90:
-                                    new_dt = dt.combine(sunday_date, dt.min.time()).replace(tzinfo=TZINFO).replace(hour=10, minute=0)
-                                    if snooze_task(task["chat_id"], task["id"], iso_utc(new_dt)):
-                                        moved_count += 1
-                                        large_moved += 1
-                                    continue
-                                
-                                # Обычные задачи переносим на завтра с учётом дня недели
-                                if tomorrow_weekday == 6:  # Воскресенье - весь день
-                                    if "лягуш" in t:
-                                        new_dt = dt.combine(tomorrow, dt.min.time()).replace(tzinfo=TZINFO).replace(hour=9, minute=0)
-                                    elif "камень" in t:
-                                        new_dt = dt.combine(tomorrow, dt.min.time()).replace(tzinfo=TZINFO).replace(hour=14, minute=0)
-                                    else:
-                                        new_dt = dt.combine(tomorrow, dt.min.time()).replace(tzinfo=TZINFO).replace(hour=10, minute=0)
-                                else:  # Пн-Сб - только вечер
-                                    if "лягуш" in t:
-                                        new_dt = dt.combine(tomorrow, dt.min.time()).replace(tzinfo=TZINFO).replace(hour=19, minute=30)
-                                    elif "камень" in t:
-                                        new_dt = dt.combine(tomorrow, dt.min.time()).replace(tzinfo=TZINFO).replace(hour=20, minute=0)
-                                    else:
-                                        new_dt = dt.combine(tomorrow, dt.min.time()).replace(tzinfo=TZINFO).replace(hour=20, minute=30)
-                                
-                                if snooze_task(task["chat_id"], task["id"], iso_utc(new_dt)):
-                                    moved_count += 1
-                            except Exception:
-                                continue
-                        
-                        if moved_count > 0:
-                            msg = f"🔄 Автоматически перенесено {moved_count} несделанных задач"
-                            if large_moved > 0:
-                                msg += f"\n• {large_moved} крупных задач (90+ мин) → воскресенье"
-                            if moved_count - large_moved > 0:
-                                msg += f"\n• {moved_count - large_moved} обычных задач → завтра"
-                            app.bot.send_message(chat_id=ALLOWED_USER_ID, text=msg)
-                            logger.info(f"Auto-rolled over {moved_count} tasks ({large_moved} large to Sunday)")
+                        for chat_id, report in rollover_tenants(rollover_due).items():
+                            if report["moved"]:
+                                _send(app, loop, chat_id, format_report(report, auto=True))
+                                logger.info(f"Auto-rolled over {report['moved']} tasks for {chat_id} ({report['large']} large to Sunday)")
                     except Exception as e:
                         logger.error(f"Error in auto rollover: {e}", exc_info=True)
-                    sent_today["auto_rollover"] = True
-                
-                # Авто-обновление commit_week (03:00)
-                if now.hour == 3 and now.minute == 0 and not sent_today["commit_week"]:
-                    try:
-                        from .integrations.sheets import import_week_from_sheets_to_bot
-                        added = import_week_from_sheets_to_bot()
-                        app.bot.send_message(
-                            chat_id=ALLOWED_USER_ID,
-                            text=f"✅ Авто-синхронизация: добавлено задач из Week_Tasks: {added}"
-                        )
-                        logger.info(f"Auto commit_week: added {added} tasks")
-                    except Exception as e:
-                        logger.error(f"Error in auto commit_week: {e}", exc_info=True)
-                    sent_today["commit_week"] = True
-                
-                # Сброс флагов в полночь
-                if now.hour == 0 and now.minute == 0:
-                    sent_today = {"frog": False, "reflect": False, "commit_week": False, "auto_rollover": False}
-                    logger.info("Nudges reset for new day")
+
             except Exception as e:
                 logger.error(f"Error in nudges loop: {e}", exc_info=True)
             time_mod.sleep(60)
-    
-    th = threading.Thread(target=loop, daemon=True)
-    th.start()
 
-import asyncio
+    th = threading.Thread(target=nudges_loop, daemon=True)
+    th.start()
 
-async def schedule_daily_plan(app):
-    """Ежедневная отправка плана в 08:00 по TZINFO через asyncio."""
-    from .db import list_today, iso_utc, db_connect
+def build_daily_plan(chat_id, tenant_tz):
+    """Текст ежедневного плана (эквивалент логики /plan)"""
+    from .db import list_today, db_connect
     from .handlers import _pick_plan
+    now = datetime.now(tenant_tz)
+    start_iso, end_iso = day_bounds(tenant_tz, now.date())
+    rows = list_today(chat_id, iso_utc(now), start_iso, end_iso)
+    if not rows:
+        # fallback к открытым топ задачам
+        conn = db_connect()
+        rows = conn.cursor().execute(
+            "SELECT id,title,context,due_at,priority,est_minutes FROM tasks WHERE chat_id=? AND status='open' ORDER BY priority DESC LIMIT 10",
+            (chat_id,)
+        ).fetchall()
+        conn.close()
+
+    frog, stones, sand = _pick_plan(rows, now.date(), tenant_tz)
+    lines = ["📅 *План на сегодня*"]
+    if frog:
+        lines.append("\n🐸 *ЛЯГУШКА*")
+        lines += [f"#{r['id']} {r['title']} — [{r['context']}]" for r in frog]
+    if stones:
+        lines.append("\n◼︎ *КАМНИ*")
+        lines += [f"#{r['id']} {r['title']} — [{r['context']}]" for r in stones[:3]]
+    if sand:
+        lines.append("\n▫︎ *ПЕСОК*")
+        lines += [f"#{r['id']} {r['title']} — [{r['context']}]" for r in sand[:3]]
+    return "\n".join(lines)
+
+async def schedule_daily_plan(app, tick_s=30):
+    """Ежедневная отправка плана каждому тенанту в его plan_at (по его часовому поясу).
+    Спит до ближайшего срабатывания, но не дольше tick_s — чтобы подхватывать новые настройки."""
+    timetable = _timetable(PLAN_EVENTS)
     while True:
         try:
-            now = datetime.now(TZINFO)
-            target = now.replace(hour=8, minute=0, second=0, microsecond=0)
-            if target <= now:
-                target = target + timedelta(days=1)
-            await asyncio.sleep((target - now).total_seconds())
-
-            # Сбор плана (эквивалент логики /plan)
-            start = target.replace(hour=0, minute=0, second=0, microsecond=0)
-            end = start + timedelta(days=1)
-            rows = list_today(ALLOWED_USER_ID, iso_utc(target), iso_utc(start), iso_utc(end))
-            if not rows:
-                # fallback к открытым топ задачам
-                conn = db_connect()
-                rows = conn.cursor().execute(
-                    "SELECT id,title,context,due_at,priority,est_minutes FROM tasks WHERE chat_id=? AND status='open' ORDER BY priority DESC LIMIT 10",
-                    (ALLOWED_USER_ID,)
-                ).fetchall()
-                conn.close()
-
-            frog, stones, sand = _pick_plan(rows)
-            lines = ["📅 *План на сегодня*"]
-            if frog:
-                lines.append("\n🐸 *ЛЯГУШКА*")
-                lines += [f"#{r['id']} {r['title']} — [{r['context']}]" for r in frog]
-            if stones:
-                lines.append("\n◼︎ *КАМНИ*")
-                lines += [f"#{r['id']} {r['title']} — [{r['context']}]" for r in stones[:3]]
-            if sand:
-                lines.append("\n▫︎ *ПЕСОК*")
-                lines += [f"#{r['id']} {r['title']} — [{r['context']}]" for r in sand[:3]]
-
-            msg = await app.bot.send_message(chat_id=ALLOWED_USER_ID, text="\n".join(lines), parse_mode=ParseMode.MARKDOWN)
-            logger.info(f"[INFO] Daily plan sent at {datetime.now(TZINFO).strftime('%H:%M')}, message_id={msg.message_id}")
+            for t, _ in timetable.due(tenants.active_tenants()):
+                try:
+                    text = build_daily_plan(t["chat_id"], t["tz"])
+                    msg = await app.bot.send_message(chat_id=t["chat_id"], text=text, parse_mode=ParseMode.MARKDOWN)
+                    logger.info(f"[INFO] Daily plan sent to {t['chat_id']}, message_id={msg.message_id}")
+                except Exception:
+                    logger.exception(f"[ERROR] Daily plan failed for {t['chat_id']}")
         except Exception:
-            logger.exception("[ERROR] Daily plan failed")
+            logger.exception("[ERROR] Daily plan scheduler failed")
             # продолжим цикл, не падаем
-            await asyncio.sleep(60)
+        sleep_s = tick_s
+        next_fire = timetable.next_fire()
+        if next_fire is not None:
+            sleep_s = min(tick_s, max(0.5, (next_fire - datetime.now(timezone.utc)).total_seconds()))
+        await asyncio.sleep(sleep_s)
@@ -0,0 +1,171 @@
+"""
+Тенанты: один процесс обслуживает много чатов.
+
+Настройки чата (часовой пояс, расписание, ID таблиц Sheets/Notion, лимиты) лежат
+в таблице tenants и кэшируются в памяти целиком: одна выборка на TENANT_CACHE_TTL,
+поэтому планировщики перебирают тенантов без запроса к БД на каждого.
+ALLOWED_USER_ID остаётся администратором и первым тенантом.
+"""
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+import pytz
+from .config import ALLOWED_USER_ID, LOCAL_TZ
+from .db import db_connect
+
+logger = logging.getLogger(__name__)
+
+TENANT_CACHE_TTL = float(os.getenv("TENANT_CACHE_TTL", "60"))
+
+# Поля, которые можно менять через set_tenant / /tenant set
+TENANT_FIELDS = [
+    "timezone", "plan_at", "frog_at", "reflect_at", "rollover_at", "commit_week_at", "weekend_at",
+    "sheets_id", "notion_week_db", "notion_days_db", "max_open_tasks", "active",
+]
+_TIME_FIELDS = {"plan_at", "frog_at", "reflect_at", "rollover_at", "commit_week_at", "weekend_at"}
+
+_lock = threading.RLock()
+_cache = {}        # chat_id -> dict настроек
+_loaded_at = 0.0
+
+def _load():
+    """Перечитывает всех тенантов одним запросом"""
+    global _cache, _loaded_at
+    conn = None
+    try:
+        conn = db_connect()
+        rows = conn.execute("SELECT * FROM tenants;").fetchall()
+        cache = {}
+        for r in rows:
+            t = dict(r)
+            try:
+                t["tz"] = pytz.timezone(t["timezone"])
+            except pytz.UnknownTimeZoneError:
+                logger.warning(f"Unknown timezone {t['timezone']!r} for tenant {t['chat_id']}, using {LOCAL_TZ}")
+                t["tz"] = pytz.timezone(LOCAL_TZ)
+            cache[t["chat_id"]] = t
+        _cache, _loaded_at = cache, time.monotonic()
+    except Exception as e:
+        # Старый кэш лучше, чем никакого
+        logger.error(f"Failed to load tenants: {e}", exc_info=True)
+    finally:
+        if conn:
+            conn.close()
+
+def _ensure_fresh():
+    with _lock:
+        if not _loaded_at or time.monotonic() - _loaded_at > TENANT_CACHE_TTL:
+            _load()
+
+def invalidate():
+    """Сбросить кэш (после изменения настроек)"""
+    global _loaded_at
+    with _lock:
+        _loaded_at = 0.0
+
+def get_tenant(chat_id):
+    """Настройки чата или None"""
+    _ensure_fresh()
+    return _cache.get(chat_id)
+
+def get_all_tenants():
+    """Все тенанты, включая отключённых"""
+    _ensure_fresh()
+    return list(_cache.values())
+
+def active_tenants():
+    """Все активные тенанты (из кэша)"""
+    _ensure_fresh()
+    return [t for t in _cache.values() if t["active"]]
+
+def is_allowed(user_id, chat_id=None):
+    """Администратор — всегда; остальные — если их чат (или личка) активный тенант"""
+    if user_id == ALLOWED_USER_ID:
+        return True
+    t = get_tenant(chat_id if chat_id is not None else user_id)
+    return bool(t and t["active"])
+
+def is_admin(user_id):
+    return user_id == ALLOWED_USER_ID
+
+def tenant_tz(chat_id):
+    """Часовой пояс чата (по умолчанию — TZ установки)"""
+    t = get_tenant(chat_id)
+    return t["tz"] if t else pytz.timezone(LOCAL_TZ)
+
+def integration_id(chat_id, field):
+    """ID таблицы Sheets / базы Notion чата (sheets_id, notion_week_db, notion_days_db).
+    None — использовать глобальные из env; это разрешено только администратору,
+    чтобы чужой чат не читал и не писал в его таблицы."""
+    t = get_tenant(chat_id)
+    value = t.get(field) if t else None
+    if value or is_admin(chat_id):
+        return value
+    raise RuntimeError(f"Для этого чата не задан {field} (/tenant set {chat_id} {field} <id>)")
+
+def _validate(field, value):
+    if field not in TENANT_FIELDS:
+        raise ValueError(f"Неизвестное поле: {field}")
+    if field == "timezone":
+        pytz.timezone(value)  # UnknownTimeZoneError — наследник KeyError
+    elif field in _TIME_FIELDS:
+        datetime.strptime(value, "%H:%M")
+    elif field in ("max_open_tasks", "active"):
+        return None if value in (None, "", "none") else int(value)
+    return value
+
+def add_tenant(chat_id, tz_name=LOCAL_TZ, **fields):
+    """Создаёт (или реактивирует) тенанта. Возвращает его настройки."""
+    _validate("timezone", tz_name)
+    conn = db_connect()
+    try:
+        conn.execute("""
+          INSERT INTO tenants(chat_id, timezone, created_at) VALUES (?, ?, ?)
+          ON CONFLICT(chat_id) DO UPDATE SET active=1, timezone=excluded.timezone;
+        """, (chat_id, tz_name, datetime.now(timezone.utc).isoformat()))
+        conn.commit()
+    finally:
+        conn.close()
+    for field, value in fields.items():
+        set_tenant(chat_id, field, value)
+    invalidate()
+    return get_tenant(chat_id)
+
+def set_tenant(chat_id, field, value):
+    """Меняет одно поле настроек. Возвращает True, если тенант найден."""
+    try:
+        value = _validate(field, value)
+    except (ValueError, KeyError) as e:
+        raise ValueError(f"Некорректное значение {field}={value!r}: {e}")
+    conn = db_connect()
+    try:
+        c = conn.cursor()
+        c.execute(f"UPDATE tenants SET {field}=? WHERE chat_id=?;", (value, chat_id))
+        conn.commit()
+        updated = c.rowcount > 0
+    finally:
+        conn.close()
+    invalidate()
+    return updated
+
+def deactivate_tenant(chat_id):
+    return set_tenant(chat_id, "active", 0)
+
+def open_tasks_limit_reached(chat_id):
+    """True, если у чата задан max_open_tasks и он исчерпан"""
+    t = get_tenant(chat_id)
+    if not t or not t["max_open_tasks"]:
+        return False
+    conn = None
+    try:
+        conn = db_connect()
+        n = conn.execute("SELECT COUNT(*) FROM tasks WHERE chat_id=? AND status='open';", (chat_id,)).fetchone()[0]
+        return n >= t["max_open_tasks"]
+    except Exception as e:
+        logger.error(f"Failed to check open tasks limit: {e}", exc_info=True)
+        return False
+    finally:
+        if conn:
+            conn.close()
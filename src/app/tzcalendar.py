@@ -0,0 +1,128 @@
+"""
+Календарь с часовыми поясами: границы дней/недель в UTC и ближайшие срабатывания
+событий по местному времени.
+
+Границы считаются через localize (корректно на переходах DST, в отличие от
+now.replace(hour=0) на aware-datetime) и кэшируются по (пояс, дата), так что
+запрос «сегодня» в поясе чата — это поиск в кэше, а не арифметика на каждый вызов.
+Timetable держит для каждого (чат, событие) готовое UTC-время следующего
+срабатывания и пересчитывает его только после срабатывания или смены настроек.
+"""
+import logging
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone
+import pytz
+
+logger = logging.getLogger(__name__)
+
+_zone = lru_cache(maxsize=None)(pytz.timezone)
+
+def _zone_name(tz):
+    return tz if isinstance(tz, str) else tz.zone
+
+def _iso(dt):
+    return dt.astimezone(timezone.utc).isoformat()
+
+@lru_cache(maxsize=4096)
+def local_at(zone_name, day, hhmm="00:00"):
+    """Местное время HH:MM даты day в поясе zone_name -> aware datetime (UTC)"""
+    h, m = (int(x) for x in hhmm.split(":"))
+    tz = _zone(zone_name)
+    local = tz.normalize(tz.localize(datetime(day.year, day.month, day.day, h, m)))
+    return local.astimezone(timezone.utc)
+
+@lru_cache(maxsize=4096)
+def _range_bounds(zone_name, first_day, days):
+    start = local_at(zone_name, first_day)
+    end = local_at(zone_name, first_day + timedelta(days=days))
+    return _iso(start), _iso(end)
+
+def local_today(tz, now_utc=None):
+    """Текущая местная дата в поясе tz"""
+    now_utc = now_utc or datetime.now(timezone.utc)
+    return now_utc.astimezone(_zone(_zone_name(tz))).date()
+
+def day_bounds(tz, day=None, days=1):
+    """(start_iso, end_iso) в UTC для days местных суток начиная с day (по умолчанию — сегодня)"""
+    name = _zone_name(tz)
+    return _range_bounds(name, day or local_today(name), days)
+
+def week_bounds(tz, day=None):
+    """(start_iso, end_iso) в UTC календарной недели (пн–вс), в которую попадает day"""
+    name = _zone_name(tz)
+    day = day or local_today(name)
+    return _range_bounds(name, day - timedelta(days=day.weekday()), 7)
+
+def next_occurrence(tz, hhmm, after_utc, weekday=None):
+    """Ближайшее строго после after_utc местное время HH:MM (в день недели weekday, если задан), в UTC"""
+    name = _zone_name(tz)
+    day = after_utc.astimezone(_zone(name)).date()
+    for _ in range(9):
+        if weekday is None or day.weekday() == weekday:
+            at = local_at(name, day, hhmm)
+            if at > after_utc:
+                return at
+        day += timedelta(days=1)
+    raise ValueError(f"No occurrence of {hhmm} in {name}")  # сюда не попадаем
+
+@lru_cache(maxsize=256)
+def _offsets_for_year(zone_name, year):
+    tz = _zone(zone_name)
+    return frozenset(
+        int(tz.utcoffset(datetime(y, m, 15)).total_seconds())
+        for y in (year - 1, year, year + 1) for m in range(1, 13)
+    )
+
+def utc_offsets(tz, year=None):
+    """Смещения пояса от UTC (в секундах), действующие около года year — обычно зимнее и летнее"""
+    return _offsets_for_year(_zone_name(tz), year or datetime.now(timezone.utc).year)
+
+class Timetable:
+    """Срабатывания событий тенантов.
+
+    kinds: {событие: (поле тенанта с HH:MM, день недели или None)}.
+    due(tenants, now) возвращает [(тенант, событие)], чьё время наступило не раньше
+    чем grace назад, и сразу переводит их на следующее срабатывание. Пропущенные
+    дольше grace (например, пока процесс стоял) не догоняются.
+    """
+
+    def __init__(self, kinds, grace=timedelta(minutes=5)):
+        self.kinds = kinds
+        self.grace = grace
+        self._next = {}  # (chat_id, событие) -> (UTC срабатывания, (пояс, HH:MM))
+
+    def _schedule(self, key, spec, after_utc, weekday):
+        at = next_occurrence(spec[0], spec[1], after_utc, weekday)
+        self._next[key] = (at, spec)
+        return at
+
+    def due(self, tenants, now_utc=None):
+        now_utc = now_utc or datetime.now(timezone.utc)
+        fired, seen = [], set()
+        for t in tenants:
+            for kind, (field, weekday) in self.kinds.items():
+                key = (t["chat_id"], kind)
+                seen.add(key)
+                spec = (t["tz"].zone, t[field])
+                entry = self._next.get(key)
+                if entry is None or entry[1] != spec:
+                    try:
+                        at = self._schedule(key, spec, now_utc - self.grace, weekday)
+                    except Exception as e:
+                        logger.warning(f"Bad schedule {spec} for {key}: {e}")
+                        continue
+                else:
+                    at = entry[0]
+                if at > now_utc:
+                    continue
+                if now_utc - at < self.grace:
+                    fired.append((t, kind))
+                self._schedule(key, spec, max(at, now_utc - self.grace), weekday)
+        # Отключённые тенанты больше не планируются
+        for key in self._next.keys() - seen:
+            del self._next[key]
+        return fired
+
+    def next_fire(self):
+        """Ближайшее запланированное срабатывание (UTC) или None"""
+        return min((at for at, _ in self._next.values()), default=None)
@@ -0,0 +1,162 @@
+"""
+Сторож event loop: измеряет задержку цикла и ловит блокирующие колбэки.
+
+Отдельный поток раз в LOOP_WATCHDOG_INTERVAL_MS ставит в loop «пинг» через
+call_soon_threadsafe и ждёт ответа. Задержка ответа — лаг цикла (гистограмма
+loop_lag_seconds). Если ответа нет дольше LOOP_STALL_MS, цикл считается
+остановленным: сторож прямо во время остановки снимает стек потока loop и
+запоминает, какой хендлер исполнялся, а по окончании пишет предупреждение
+и увеличивает loop_stalls_total{handler=...}.
+
+Дополнительно при LOOP_DEBUG=1 включается debug-режим asyncio с
+slow_callback_duration = SLOW_CALLBACK_MS; его предупреждения считаются
+в slow_callbacks_total.
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import functools
+import threading
+from .instrumentation import registry
+
+logger = logging.getLogger(__name__)
+
+LOOP_WATCHDOG_INTERVAL_MS = float(os.getenv("LOOP_WATCHDOG_INTERVAL_MS", "500"))
+LOOP_STALL_MS = float(os.getenv("LOOP_STALL_MS", "250"))
+SLOW_CALLBACK_MS = float(os.getenv("SLOW_CALLBACK_MS", "100"))
+LOOP_DEBUG = os.getenv("LOOP_DEBUG", "0") == "1"
+
+# asyncio.Task -> имя хендлера, который в нём исполняется
+_active_handlers = {}
+_watchdog = None
+
+def attribute_handlers(app):
+    """Оборачивает колбэки хендлеров так, чтобы сторож знал, какой из них исполняется"""
+    for handlers in app.handlers.values():
+        for h in handlers:
+            if getattr(h.callback, "__attributed__", False):
+                continue
+            h.callback = _attributed(h.callback, getattr(h.callback, "__name__", "handler"))
+
+def _attributed(fn, name):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        task = asyncio.current_task()
+        _active_handlers[task] = name
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            _active_handlers.pop(task, None)
+    wrapper.__attributed__ = True
+    return wrapper
+
+class _SlowCallbackCounter(logging.Handler):
+    """Считает предупреждения asyncio «Executing <Handle ...> took N seconds»"""
+
+    def emit(self, record):
+        msg = record.getMessage()
+        if msg.startswith("Executing") and " took " in msg:
+            registry.inc("slow_callbacks_total", help_text="asyncio callbacks slower than SLOW_CALLBACK_MS")
+
+class LoopWatchdog:
+    """Поток, измеряющий лаг event loop и атрибутирующий остановки"""
+
+    def __init__(self, loop, interval_s=None, stall_s=None):
+        self.loop = loop
+        self.interval_s = (LOOP_WATCHDOG_INTERVAL_MS / 1000) if interval_s is None else interval_s
+        self.stall_s = (LOOP_STALL_MS / 1000) if stall_s is None else stall_s
+        self.loop_thread_id = threading.get_ident()
+        self.stalls = 0
+        self.max_lag_s = 0.0
+        self.last_stall = None  # {"at", "lag_s", "handler", "frame"}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _culprit(self):
+        """Кто держит loop прямо сейчас: (хендлер, верхний кадр стека)"""
+        handler = None
+        try:
+            task = asyncio.current_task(self.loop)
+            handler = _active_handlers.get(task) if task else None
+        except RuntimeError:
+            pass
+        frame = sys._current_frames().get(self.loop_thread_id)
+        where = None
+        if frame is not None:
+            code = frame.f_code
+            where = f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+        return handler, where
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.loop.is_running():
+                if self.loop.is_closed():
+                    return
+                self._stop.wait(self.interval_s)
+                continue
+            pong = threading.Event()
+            sent = time.perf_counter()
+            try:
+                self.loop.call_soon_threadsafe(pong.set)
+            except RuntimeError:
+                return  # loop закрыт
+            culprit = None
+            if not pong.wait(self.stall_s):
+                culprit = self._culprit()
+                while not pong.wait(self.interval_s):
+                    if self._stop.is_set() or self.loop.is_closed():
+                        return
+            lag = time.perf_counter() - sent
+            self._record(lag, culprit)
+            self._stop.wait(max(0.0, self.interval_s - lag))
+
+    def _record(self, lag, culprit):
+        registry.observe("loop_lag_seconds", lag, help_text="event loop scheduling lag")
+        self.max_lag_s = max(self.max_lag_s, lag)
+        if culprit is None:
+            return
+        handler, where = culprit
+        self.stalls += 1
+        self.last_stall = {"at": time.time(), "lag_s": lag, "handler": handler, "frame": where}
+        registry.inc("loop_stalls_total", help_text="event loop stalls longer than LOOP_STALL_MS",
+                     handler=handler or "unknown")
+        logger.warning(f"Event loop blocked for {lag * 1000:.0f} ms (handler={handler or 'unknown'}, at {where})")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+def start_loop_watchdog(loop=None):
+    """Запускает сторожа для loop (по умолчанию — текущего потока). Вызывать из потока loop."""
+    global _watchdog
+    loop = loop or asyncio.get_event_loop()
+    if LOOP_DEBUG:
+        loop.set_debug(True)
+        loop.slow_callback_duration = SLOW_CALLBACK_MS / 1000
+        logging.getLogger("asyncio").addHandler(_SlowCallbackCounter())
+        logger.info(f"asyncio debug mode on, slow callback threshold {SLOW_CALLBACK_MS:.0f} ms")
+    _watchdog = LoopWatchdog(loop)
+    _watchdog.start()
+    return _watchdog
+
+def watchdog_summary():
+    """Счётчики для /health или None, если сторож не запущен"""
+    if _watchdog is None:
+        return None
+    lag_p95 = None
+    for labels, count, p50, p95, p99 in registry.summary("loop_lag_seconds"):
+        lag_p95 = p95
+    return {
+        "stalls": _watchdog.stalls,
+        "max_lag_s": _watchdog.max_lag_s,
+        "lag_p95_s": lag_p95,
+        "slow_callbacks": registry.counter_value("slow_callbacks_total"),
+        "last_stall": _watchdog.last_stall,
+    }
@@ -0,0 +1,42 @@
+"""
+Общая база тестов, работающих с БД.
+
+DBTestCase — временный каталог, DB_PATH модуля db (и модулей из db_path_modules)
+указывает на БД внутри него, схема создаётся db_init(); всё убирается после теста.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+from src.app import db
+from src.app.db import db_init, add_task, iso_utc
+
+
+class DBTestCase(unittest.TestCase):
+    """Тест на временной БД"""
+
+    db_path_modules = ()   # модули со своей копией DB_PATH
+    init_db = True         # False — тест сам решает, когда вызвать db_init()
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, ignore_errors=True)
+        self.temp_db = os.path.join(self.temp_dir, "daily_pilot.db")
+        for module in (db, *self.db_path_modules):
+            self.patch_object(module, "DB_PATH", self.temp_db)
+        if self.init_db:
+            db_init()
+
+    def patch_object(self, target, attr, value):
+        """mock.patch.object на время теста"""
+        patcher = mock.patch.object(target, attr, value)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def _add_task(self, chat_id, title, due=None, est=30, priority=50, description="", added=None):
+        """Задача с разумными значениями по умолчанию; due и added — datetime с поясом"""
+        added = added or datetime.now(timezone.utc)
+        return add_task(chat_id, title, description, "AI", iso_utc(due) if due else None,
+                        iso_utc(added), priority, est, "text")
@@ -0,0 +1,246 @@
+"""
+Подставные реализации внешних сервисов для тестов, бенчмарков и нагрузочных прогонов.
+
+FakeSpreadsheet / FakeWorksheet — минимальное in-memory подмножество API gspread,
+которое использует src.app.integrations.sheets.
+FakeTelegramRequest — транспорт Bot API для python-telegram-bot: записывает отправки,
+умеет задержку и периодические 429.
+FakeOpenAI — клиент с chat.completions / audio.transcriptions, отвечает заготовками.
+FakeNotionClient — асинхронный клиент Notion (databases.query, pages.create/update) в памяти.
+"""
+import json
+import time
+import uuid
+import asyncio
+from types import SimpleNamespace
+from gspread.utils import a1_to_rowcol
+from telegram.request import BaseRequest
+
+
+class FakeWorksheet:
+    """Лист в памяти: список строк (list[list[str]])"""
+
+    def __init__(self, title, rows=None):
+        self.title = title
+        self.rows = [list(r) for r in (rows or [])]
+        self.calls = 0
+
+    def _ensure(self, row, col):
+        while len(self.rows) < row:
+            self.rows.append([])
+        r = self.rows[row - 1]
+        while len(r) < col:
+            r.append("")
+        return r
+
+    def row_values(self, row):
+        self.calls += 1
+        return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def get_all_values(self):
+        self.calls += 1
+        return [list(r) for r in self.rows]
+
+    def get_all_records(self):
+        self.calls += 1
+        if not self.rows:
+            return []
+        header = self.rows[0]
+        out = []
+        for r in self.rows[1:]:
+            out.append({h: (r[i] if i < len(r) else "") for i, h in enumerate(header)})
+        return out
+
+    def clear(self):
+        self.calls += 1
+        self.rows = []
+
+    def update(self, values=None, range_name=None, **kwargs):
+        """Как в gspread 6: update(values, range_name); поддерживает и старый порядок (range, values)"""
+        self.calls += 1
+        if isinstance(values, str):
+            values, range_name = range_name, values
+        row, col = a1_to_rowcol(range_name.split(":")[0]) if range_name else (1, 1)
+        for i, vals in enumerate(values or []):
+            for j, v in enumerate(vals):
+                self._ensure(row + i, col + j)[col + j - 1] = v
+
+    def update_cell(self, row, col, value):
+        self.calls += 1
+        self._ensure(row, col)[col - 1] = value
+
+    def batch_update(self, data, **kwargs):
+        self.calls += 1
+        for item in data:
+            self.update(item["values"], item["range"])
+
+    def append_row(self, values, **kwargs):
+        self.calls += 1
+        self.rows.append(list(values))
+
+    def append_rows(self, values, **kwargs):
+        self.calls += 1
+        self.rows.extend(list(v) for v in values)
+
+
+class FakeSpreadsheet:
+    """Таблица в памяти: имя листа -> FakeWorksheet"""
+
+    def __init__(self, sheets=None):
+        self._sheets = {}
+        for name in sheets or []:
+            self._sheets[name] = FakeWorksheet(name)
+
+    def worksheet(self, title):
+        if title not in self._sheets:
+            import gspread
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self._sheets[title]
+
+    def add_worksheet(self, title, rows=100, cols=26, **kwargs):
+        ws = self._sheets[title] = FakeWorksheet(title)
+        return ws
+
+    def worksheets(self):
+        return list(self._sheets.values())
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Bot API без сети: каждый метод отвечает успешно, отправки копятся в sent"""
+
+    BOT_USER = {"id": 1000001, "is_bot": True, "first_name": "DailyPilot", "username": "dailypilot_fake_bot"}
+
+    def __init__(self, latency_s=0.0, rate_limit_every=0, retry_after=1):
+        self.latency_s = latency_s
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.sent = []  # [(метод, параметры)]
+        self.requests = 0
+        self.rate_limited = 0
+        self._message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _message(self, params):
+        self._message_id += 1
+        return {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id") or 0), "type": "private"},
+            "from": self.BOT_USER,
+            "text": params.get("text") or params.get("caption") or "",
+        }
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.requests += 1
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        if endpoint != "getMe" and self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+            self.rate_limited += 1
+            body = {"ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after}}
+            return 429, json.dumps(body).encode("utf-8")
+
+        if endpoint == "getMe":
+            result = self.BOT_USER
+        elif endpoint in ("sendMessage", "sendDocument", "editMessageText"):
+            self.sent.append((endpoint, params))
+            result = self._message(params)
+        elif endpoint == "getUpdates":
+            result = []
+        else:
+            self.sent.append((endpoint, params))
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+
+class FakeOpenAI:
+    """OpenAI-клиент с заготовленными ответами. reply — строка или функция(messages) -> строка."""
+
+    def __init__(self, latency_s=0.0, reply=None, transcript="Позвонить клиенту завтра в 10"):
+        self.latency_s = latency_s
+        self.reply = reply
+        self.transcript = transcript
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat))
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self._transcribe))
+
+    def _default_reply(self, messages):
+        text = (messages[-1].get("content") or "") if messages else ""
+        return json.dumps({"title": text[:60], "description": "", "due": "", "context": "AI"}, ensure_ascii=False)
+
+    def _chat(self, model=None, messages=None, **kwargs):
+        self.calls += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if callable(self.reply):
+            content = self.reply(messages or [])
+        else:
+            content = self.reply or self._default_reply(messages or [])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    def _transcribe(self, **kwargs):
+        self.calls += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return self.transcript
+
+
+class FakeNotionClient:
+    """Асинхронный клиент Notion в памяти: database_id -> {page_id: страница}"""
+
+    def __init__(self, latency_s=0.0):
+        self.latency_s = latency_s
+        self.databases_store = {}
+        self.requests = 0
+        self.databases = SimpleNamespace(query=self._query)
+        self.pages = SimpleNamespace(create=self._create, update=self._update)
+
+    async def _tick(self):
+        self.requests += 1
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+
+    async def _query(self, database_id, page_size=100, start_cursor=None, **kwargs):
+        await self._tick()
+        pages = list(self.databases_store.get(database_id, {}).values())
+        start = int(start_cursor or 0)
+        chunk = pages[start:start + page_size]
+        has_more = start + page_size < len(pages)
+        return {"results": chunk, "has_more": has_more, "next_cursor": str(start + page_size) if has_more else None}
+
+    async def _create(self, parent, properties, **kwargs):
+        await self._tick()
+        page = {"id": str(uuid.uuid4()), "archived": False, "properties": _notion_readback(properties)}
+        self.databases_store.setdefault(parent["database_id"], {})[page["id"]] = page
+        return page
+
+    async def _update(self, page_id, properties, **kwargs):
+        await self._tick()
+        for pages in self.databases_store.values():
+            if page_id in pages:
+                pages[page_id]["properties"] = _notion_readback(properties)
+                return pages[page_id]
+        raise KeyError(page_id)
+
+    async def aclose(self):
+        pass
+
+
+def _notion_readback(properties):
+    """Свойства в том виде, в каком их возвращает API (title/rich_text с plain_text)"""
+    out = {}
+    for name, prop in properties.items():
+        prop = json.loads(json.dumps(prop))
+        for kind in ("title", "rich_text"):
+            for item in prop.get(kind, []) or []:
+                item["plain_text"] = item.get("text", {}).get("content", "")
+        out[name] = prop
+    return out
@@ -0,0 +1,99 @@
+import unittest
+import os
+import time
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+from src.app import backup, archive
+from src.app.db import mark_done, drop_task, iso_utc, db_connect, rebuild_task_stats
+from src.app.archive import archive_closed_tasks
+from src.app.export import export_tasks
+from src.app.journal import restore_to
+from tests.base import DBTestCase
+
+class TestArchive(DBTestCase):
+
+    db_path_modules = (backup,)
+
+    def setUp(self):
+        """Временная БД и каталог бэкапов"""
+        super().setUp()
+        self.patch_object(backup, "_manifest", None)
+
+    def _add(self, title):
+        return self._add_task(123, title)
+
+    def _ids(self, table):
+        conn = db_connect()
+        rows = conn.execute(f"SELECT id FROM {table} ORDER BY id").fetchall()
+        conn.close()
+        return [r["id"] for r in rows]
+
+    def _stats(self):
+        conn = db_connect()
+        rows = conn.execute("SELECT status, SUM(cnt) FROM task_stats_daily GROUP BY status HAVING SUM(cnt) > 0 ORDER BY status").fetchall()
+        conn.close()
+        return [tuple(r) for r in rows]
+
+    def test_moves_only_old_closed_tasks(self):
+        """В архив уходят только done/dropped, закрытые раньше порога"""
+        done, dropped, fresh, live = (self._add(t) for t in ("Сделано", "Брошено", "Только что", "Открыто"))
+        mark_done(123, done)
+        drop_task(123, dropped)
+        mark_done(123, fresh)
+        later = datetime.now(timezone.utc) + timedelta(days=31)
+        conn = db_connect()
+        conn.execute("UPDATE tasks SET closed_at=? WHERE id=?", (iso_utc(later - timedelta(days=1)), fresh))
+        conn.commit()
+        conn.close()
+
+        self.assertEqual(archive_closed_tasks(30, now_utc=later), 2)
+        self.assertEqual(self._ids("tasks"), [fresh, live])
+        self.assertEqual(self._ids("tasks_archive"), [done, dropped])
+        self.assertEqual(self._ids("tasks_all"), [done, dropped, fresh, live])
+        self.assertEqual(archive_closed_tasks(30, now_utc=later), 0)
+
+    def test_batches_and_stats_unchanged(self):
+        """Перенос идёт порциями, свёртка статистики и экспорт видят архив"""
+        ids = [self._add(f"Задача {i}") for i in range(5)]
+        for tid in ids:
+            mark_done(123, tid)
+        before = self._stats()
+
+        with mock.patch.object(archive, "_archive_batch", wraps=archive._archive_batch) as b:
+            moved = archive_closed_tasks(30, batch=2, now_utc=datetime.now(timezone.utc) + timedelta(days=31))
+        self.assertEqual(moved, 5)
+        self.assertEqual(b.call_count, 3)
+        self.assertEqual(self._ids("tasks"), [])
+        self.assertEqual(self._stats(), before)
+
+        conn = db_connect()
+        rebuild_task_stats(conn.cursor())
+        conn.commit()
+        conn.close()
+        self.assertEqual(self._stats(), before)
+
+        f, _, count = export_tasks(123)
+        f.close()
+        self.assertEqual(count, 5)
+
+    def test_restore_replays_archival(self):
+        """Восстановление из журнала переносит задачу в архив, а не теряет её"""
+        tid = self._add("Старая")
+        mark_done(123, tid)
+        backup.create_backup()
+        time.sleep(0.01)
+        archive_closed_tasks(30, now_utc=datetime.now(timezone.utc) + timedelta(days=31))
+        time.sleep(0.01)
+
+        out = os.path.join(self.temp_dir, "restored.db")
+        restore_to(datetime.now(timezone.utc), out)
+        conn = sqlite3.connect(out)
+        hot = conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+        cold = conn.execute("SELECT id, status FROM tasks_archive").fetchall()
+        conn.close()
+        self.assertEqual(hot, 0)
+        self.assertEqual(cold, [(tid, "done")])
+
+if __name__ == "__main__":
+    unittest.main()
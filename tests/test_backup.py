@@ -0,0 +1,82 @@
+import unittest
+import os
+import gzip
+import shutil
+import sqlite3
+from datetime import datetime, timezone, timedelta
+from unittest import mock
+from src.app import backup
+from src.app.db import add_task, iso_utc
+from tests.base import DBTestCase
+
+class TestBackup(DBTestCase):
+
+    db_path_modules = (backup,)
+    
+    def setUp(self):
+        """Временная БД и каталог бэкапов"""
+        super().setUp()
+        self.patch_object(backup, "_manifest", None)
+        add_task(123, "Task", "", "AI", None, iso_utc(datetime.now(timezone.utc)), 50, 30, "text")
+    
+    def test_backup_is_valid_sqlite(self):
+        """Бэкап проходит integrity_check и содержит данные"""
+        path = backup.create_backup()
+        self.assertIsNotNone(path)
+        self.assertTrue(backup.verify_backup(path))
+        conn = sqlite3.connect(path)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0], 1)
+        conn.close()
+    
+    def test_skip_when_unchanged(self):
+        """Без изменений БД повторный бэкап не создаётся"""
+        first = backup.create_backup()
+        second = backup.create_backup()
+        self.assertEqual(first, second)
+        self.assertEqual(len(backup.list_backups()), 1)
+    
+    def test_backup_after_change(self):
+        """После записи в БД маркер меняется"""
+        before = backup._db_change_marker()
+        add_task(123, "Task 2", "", "AI", None, iso_utc(datetime.now(timezone.utc)), 50, 30, "text")
+        self.assertNotEqual(before, backup._db_change_marker())
+    
+    def test_gzip_compression(self):
+        """Сжатый бэкап распаковывается в валидную БД"""
+        with mock.patch.object(backup, "BACKUP_COMPRESSION", "gzip"):
+            path = backup.create_backup(force=True)
+        self.assertTrue(path.endswith(".db.gz"))
+        raw = os.path.join(self.temp_dir, "restored.db")
+        with gzip.open(path, "rb") as src, open(raw, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        self.assertTrue(backup.verify_backup(raw))
+    
+    def test_manifest_records_checksum(self):
+        """Манифест хранит размер и sha256 бэкапа"""
+        path = backup.create_backup()
+        latest = backup.list_backups(1)[0]
+        self.assertEqual(latest["path"], path)
+        self.assertEqual(latest["size"], os.path.getsize(path))
+        self.assertEqual(latest["sha256"], backup._sha256(path))
+        self.assertEqual(backup.backup_summary()["count"], 1)
+    
+    def test_gfs_retention(self):
+        """GFS: все за последние часы, по одному на день и на неделю"""
+        now = datetime(2025, 3, 31, 12, 0)
+        entries = []
+        for h in range(0, 24 * 40, 6):
+            created = now - timedelta(hours=h)
+            entries.append({"filename": f"b{h}", "created": created.isoformat(), "size": 1})
+        keep = backup.select_retained(entries, now=now, hourly=24, daily=7, weekly=4)
+        # 24 часа: 0, 6, 12, 18, 24
+        for h in (0, 6, 12, 18, 24):
+            self.assertIn(f"b{h}", keep)
+        # старше 4 недель ничего не остаётся
+        self.assertFalse(any(int(f[1:]) > 24 * 29 for f in keep))
+        # не больше одного бэкапа на день вне часового окна
+        days = [datetime.fromisoformat(e["created"]).date() for e in entries
+                if e["filename"] in keep and now - datetime.fromisoformat(e["created"]) > timedelta(hours=24)]
+        self.assertEqual(len(days), len(set(days)))
+
+if __name__ == '__main__':
+    unittest.main()
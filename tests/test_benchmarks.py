@@ -0,0 +1,29 @@
+import unittest
+import os
+import tempfile
+from benchmarks.run import run_benchmarks, compare, save_baseline, load_baseline, BENCHMARKS, SKIPPED
+
+class TestBenchmarkRunner(unittest.TestCase):
+
+    def test_all_benchmarks_run_small(self):
+        """Каждый бенчмарк отрабатывает на маленьком наборе"""
+        results = run_benchmarks(sizes=(20,), repeat=1)
+        self.assertEqual(set(results), {f"{name}@20" for name in BENCHMARKS})
+        self.assertTrue(all(v > 0 for v in results.values()))
+
+    def test_capped_sizes_reported(self):
+        """Размер больше max_n не молча пропускается, а попадает в SKIPPED с причиной"""
+        run_benchmarks(sizes=(10 ** 9,), only={"dedupe_rows"}, repeat=1)
+        self.assertIn("O(n²)", SKIPPED["dedupe_rows@1000000000"])
+
+    def test_regression_detection(self):
+        """Рост больше порога — регрессия, baseline переживает сохранение"""
+        baseline = {"a@100": 1.0, "b@100": 1.0}
+        current = {"a@100": 1.2, "b@100": 1.5, "c@100": 9.0}
+        regressions = compare(current, baseline, threshold=0.25)
+        self.assertEqual([r[0] for r in regressions], ["b@100"])
+
+        path = os.path.join(tempfile.mkdtemp(), "baseline.json")
+        save_baseline(baseline, path)
+        self.assertEqual(load_baseline(path), baseline)
+        os.remove(path)
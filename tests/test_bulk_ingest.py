@@ -0,0 +1,80 @@
+import unittest
+import sqlite3
+from datetime import datetime, timezone
+from unittest import mock
+from src.app import db
+from src.app.db import add_task, add_tasks_bulk, iso_utc, db_connect
+from src.app.integrations import sheets, planner
+from tests.base import DBTestCase
+from tests.fakes import FakeSpreadsheet
+
+class TestBulkIngest(DBTestCase):
+
+    def setUp(self):
+        """Временная БД"""
+        super().setUp()
+        self.now = iso_utc(datetime.now(timezone.utc))
+
+    def _rows(self, sql, params=()):
+        conn = db_connect()
+        rows = conn.execute(sql, params).fetchall()
+        conn.close()
+        return rows
+
+    def test_ids_in_order_single_connection(self):
+        """id возвращаются в порядке строк, вся вставка — одно соединение и одна транзакция"""
+        add_task(1, "Было раньше", "", "AI", None, self.now, 10, 30, "text")
+        rows = [(1, f"Задача {i}", "", "AI", None, self.now, i, 15, "sheets") for i in range(5)]
+        with mock.patch.object(db, "db_connect", wraps=db.db_connect) as connect:
+            ids = add_tasks_bulk(rows)
+        self.assertEqual(connect.call_count, 1)
+        self.assertEqual(len(ids), 5)
+        got = {r["id"]: (r["title"], r["status"]) for r in self._rows("SELECT id, title, status FROM tasks")}
+        self.assertEqual([got[i] for i in ids], [(f"Задача {i}", "open") for i in range(5)])
+        self.assertEqual(add_tasks_bulk([]), [])
+
+    def test_all_or_nothing(self):
+        """Ошибка в одной строке откатывает всю пачку"""
+        rows = [(1, "Хорошая", "", "AI", None, self.now, 1, 15, "sheets"),
+                (1, None, "", "AI", None, self.now, 1, 15, "sheets")]
+        with self.assertRaises(sqlite3.IntegrityError):
+            add_tasks_bulk(rows)
+        self.assertEqual(self._rows("SELECT COUNT(*) AS n FROM tasks")[0]["n"], 0)
+
+    def test_sheets_import_one_transaction(self):
+        """Импорт Week_Tasks: все новые строки одной вставкой, повторы строки получают тот же id"""
+        fake = FakeSpreadsheet([sheets.SHEET_WEEK_TASKS])
+        ws = fake.worksheet(sheets.SHEET_WEEK_TASKS)
+        ws.rows = [["Direction", "Task", "Outcome", "Deadline", "Status", "Bot_ID", "Notes"],
+                   ["Работа", "Отчёт", "", "", "planned", "", ""],
+                   ["Работа", "Звонок", "", "", "planned", "", ""],
+                   ["Работа", "отчет", "", "", "planned", "", ""],
+                   ["Дом", "Уборка", "", "", "done", "", ""]]
+        with mock.patch.object(sheets, "_open_sheet", return_value=fake), \
+             mock.patch.object(db, "add_tasks_bulk", wraps=db.add_tasks_bulk) as bulk:
+            self.assertEqual(sheets.import_week_from_sheets_to_bot(chat_id=7), 2)
+        self.assertEqual(bulk.call_count, 1)
+        bot_ids = [r[5] for r in ws.rows[1:4]]
+        self.assertEqual(bot_ids[0], bot_ids[2])
+        titles = {str(r["id"]): r["title"] for r in self._rows("SELECT id, title FROM tasks WHERE chat_id=7")}
+        self.assertEqual([titles[i] for i in bot_ids[:2]], ["Отчёт", "Звонок"])
+        self.assertEqual(ws.rows[4][5], "")
+
+    def test_generate_week_tasks_belong_to_chat(self):
+        """Задачи недели из целей создаются одной вставкой в чате, который её запросил"""
+        fake = FakeSpreadsheet(["Goals", "Projects", "Week_Tasks", "Days"])
+        fake.worksheet("Goals").rows = [["Level", "Objective", "Weight"], ["Год", "Рост", "2"]]
+        fake.worksheet("Projects").rows = [
+            ["Project_ID", "Title", "Context", "Status", "Goal_Level", "Goal_Objective", "Deadline", "Weekly_Slots"],
+            ["P1", "Бот", "AI", "active", "Год", "Рост", "", "3"]]
+        with mock.patch.object(planner, "_open_sheet", return_value=fake) as opened, \
+             mock.patch.object(planner, "add_tasks_bulk", wraps=db.add_tasks_bulk) as bulk:
+            _, _, added = planner.generate_week_from_goals(42, "sheet-42")
+        opened.assert_called_once_with("sheet-42")
+        self.assertEqual(bulk.call_count, 1)
+        self.assertEqual(added, 3)
+        chats = [r["chat_id"] for r in self._rows("SELECT chat_id FROM tasks WHERE source='planner'")]
+        self.assertEqual(chats, [42, 42, 42])
+
+if __name__ == "__main__":
+    unittest.main()
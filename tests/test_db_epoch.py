@@ -0,0 +1,104 @@
+import unittest
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from src.app.db import (
+    db_init, db_connect, add_task, snooze_task, iso_utc, to_epoch, list_today, due_overdues,
+    list_overdue, list_midnight_due, reschedule_tasks,
+)
+from src.app.tzcalendar import utc_offsets
+from tests.base import DBTestCase
+import pytz
+
+class TestEpochColumns(DBTestCase):
+
+    init_db = False
+
+    def test_migration_of_legacy_db(self):
+        """Старая БД без эпох получает колонки, значения учитывают смещение в ISO"""
+        conn = sqlite3.connect(self.temp_db)
+        conn.execute("""CREATE TABLE tasks(id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER NOT NULL,
+            title TEXT NOT NULL, description TEXT, context TEXT, due_at TEXT, added_at TEXT, status TEXT,
+            priority REAL, est_minutes INTEGER, source TEXT)""")
+        conn.execute("CREATE INDEX idx_due_at ON tasks(due_at)")
+        conn.execute("INSERT INTO tasks(chat_id,title,due_at,added_at,status) VALUES (1,'a','2025-03-05T12:00:00+03:00','2025-03-01T00:00:00+00:00','open')")
+        conn.commit()
+        conn.close()
+
+        db_init()
+        db_init()  # повторный запуск ничего не ломает
+        conn = db_connect()
+        row = conn.execute("SELECT due_epoch, added_epoch FROM tasks").fetchone()
+        indexes = {r["name"] for r in conn.execute("PRAGMA index_list(tasks)").fetchall()}
+        conn.close()
+        self.assertEqual(row["due_epoch"], int(datetime(2025, 3, 5, 9, 0, tzinfo=timezone.utc).timestamp()))
+        self.assertEqual(row["added_epoch"], int(datetime(2025, 3, 1, tzinfo=timezone.utc).timestamp()))
+        self.assertIn("idx_tasks_chat_status_due", indexes)
+        self.assertNotIn("idx_due_at", indexes)
+
+    def test_epoch_follows_writes(self):
+        """due_epoch обновляется при переносе без участия кода"""
+        db_init()
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        tid = add_task(1, "a", "", "AI", iso_utc(now), iso_utc(now), 50, 30, "text")
+        snooze_task(1, tid, iso_utc(now + timedelta(hours=5)))
+        conn = db_connect()
+        self.assertEqual(conn.execute("SELECT due_epoch FROM tasks").fetchone()[0], to_epoch(now + timedelta(hours=5)))
+        conn.close()
+
+    def test_range_queries_ignore_offset_format(self):
+        """Срок, записанный с местным смещением, попадает в правильный день"""
+        db_init()
+        conn = db_connect()
+        # 00:30 6 марта по Москве = 21:30 5 марта UTC: лексикографически «6 марта»
+        conn.execute("INSERT INTO tasks(chat_id,title,due_at,status,priority) VALUES (1,'late','2025-03-06T00:30:00+03:00','open',1)")
+        conn.commit()
+        conn.close()
+        day5 = ("2025-03-05T00:00:00+00:00", "2025-03-06T00:00:00+00:00")
+        rows = list_today(1, "2025-03-01T00:00:00+00:00", *day5)
+        self.assertEqual([r["title"] for r in rows], ["late"])
+        self.assertEqual(len(due_overdues("2025-03-05T21:30:00+00:00")), 1)
+        self.assertEqual(len(due_overdues("2025-03-05T21:29:00+00:00")), 0)
+
+    def test_range_query_uses_composite_index(self):
+        """Диапазон по сроку идёт по индексу (chat_id, status, due_epoch)"""
+        db_init()
+        conn = db_connect()
+        plan = conn.execute("""EXPLAIN QUERY PLAN SELECT id FROM tasks
+            WHERE chat_id=? AND status='open' AND due_epoch >= ? AND due_epoch < ?""", (1, 0, 10)).fetchall()
+        conn.close()
+        self.assertIn("idx_tasks_chat_status_due", " ".join(r["detail"] for r in plan))
+
+class TestChatScopedSelections(DBTestCase):
+
+    def _add(self, chat_id, title, due):
+        return self._add_task(chat_id, title, due)
+
+    def test_overdue_only_for_chat(self):
+        """Просроченные выбираются только для своего чата"""
+        now = datetime.now(timezone.utc)
+        mine = self._add(1, "мой", now - timedelta(hours=1))
+        self._add(1, "будущий", now + timedelta(hours=1))
+        self._add(2, "чужой", now - timedelta(hours=1))
+        self.assertEqual([r["id"] for r in list_overdue(1, iso_utc(now))], [mine])
+
+    def test_midnight_candidates_across_dst(self):
+        """Полночь по Берлину находится и зимой, и летом"""
+        tz = pytz.timezone("Europe/Berlin")
+        winter = self._add(1, "зима", tz.localize(datetime(2025, 1, 10)))
+        summer = self._add(1, "лето", tz.localize(datetime(2025, 7, 10)))
+        self._add(1, "день", tz.localize(datetime(2025, 7, 10, 12, 0)))
+        self._add(2, "чужая", tz.localize(datetime(2025, 7, 10)))
+        rows = list_midnight_due(1, utc_offsets(tz, 2025))
+        self.assertEqual(sorted(r["id"] for r in rows), sorted([winter, summer]))
+
+    def test_reschedule_single_transaction(self):
+        """Пакетный перенос меняет только задачи своего чата"""
+        now = datetime.now(timezone.utc)
+        a = self._add(1, "a", now)
+        b = self._add(2, "b", now)
+        later = iso_utc(now + timedelta(days=1))
+        self.assertEqual(reschedule_tasks(1, [(a, later), (b, later)]), 1)
+        self.assertEqual(reschedule_tasks(1, []), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+import csv
+import io
+import gzip
+import json
+from datetime import datetime, date, timezone
+import pytz
+from src.app.db import add_task, mark_done, iso_utc
+from src.app.export import export_tasks
+from src.app.handlers import export_bounds
+from tests.base import DBTestCase
+
+class TestExport(DBTestCase):
+    
+    def setUp(self):
+        """Временная БД с задачами двух чатов"""
+        super().setUp()
+        now = iso_utc(datetime.now(timezone.utc))
+        self.t1 = add_task(123, "Task 1", "desc, with comma", "AI", None, now, 80, 15, "text")
+        self.t2 = add_task(123, "Task 2", "", "AI", None, now, 60, 45, "voice")
+        add_task(456, "Other chat", "", "AI", None, now, 60, 45, "text")
+        mark_done(123, self.t2)
+    
+    def test_csv_only_own_chat(self):
+        """CSV содержит только задачи своего чата"""
+        f, name, count = export_tasks(123, chunk=1)
+        rows = list(csv.DictReader(io.TextIOWrapper(f, encoding="utf-8", newline="")))
+        self.assertEqual(name, "daily_pilot_export.csv")
+        self.assertEqual(count, 2)
+        self.assertEqual([r["title"] for r in rows], ["Task 1", "Task 2"])
+        self.assertEqual(rows[0]["description"], "desc, with comma")
+    
+    def test_jsonl_gzip_with_status(self):
+        """JSONL + gzip + фильтр по статусу"""
+        f, name, count = export_tasks(123, fmt="jsonl", compress=True, status="done")
+        self.assertEqual(name, "daily_pilot_export.jsonl.gz")
+        lines = gzip.decompress(f.read()).decode("utf-8").splitlines()
+        self.assertEqual(count, 1)
+        self.assertEqual(json.loads(lines[0])["id"], self.t2)
+
+    def test_date_bounds_in_chat_zone(self):
+        """Даты /export — местные сутки чата с верным смещением (не LMT)"""
+        moscow = pytz.timezone("Europe/Moscow")
+        since, until = export_bounds(moscow, [date(2025, 3, 1), date(2025, 3, 2)])
+        self.assertEqual(datetime.fromisoformat(since), datetime(2025, 2, 28, 21, 0, tzinfo=timezone.utc))
+        self.assertEqual(datetime.fromisoformat(until), datetime(2025, 3, 2, 21, 0, tzinfo=timezone.utc))
+        self.assertEqual(export_bounds(moscow, []), (None, None))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import asyncio
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer
+from src.app.instrumentation import (
+    Histogram, Registry, timed, registry, start_metrics_server, format_latency_summary, _MetricsHandler,
+)
+
+class TestHistogram(unittest.TestCase):
+
+    def test_quantile_interpolation(self):
+        """Квантиль оценивается внутри корзины"""
+        h = Histogram(buckets=(0.1, 0.2, 0.4))
+        for v in (0.05, 0.15, 0.15, 0.3):
+            h.observe(v)
+        self.assertEqual(h.count, 4)
+        self.assertAlmostEqual(h.quantile(0.5), 0.15)
+        self.assertLessEqual(h.quantile(0.99), 0.4)
+        self.assertIsNone(Histogram().quantile(0.5))
+
+    def test_render_prometheus(self):
+        """Кумулятивные корзины, _sum/_count и счётчики в текстовом формате"""
+        r = Registry()
+        r.observe("x_seconds", 0.003, op="a")
+        r.observe("x_seconds", 2.0, op="a")
+        r.inc("x_errors_total", op="a")
+        text = r.render()
+        self.assertIn('# TYPE dailypilot_x_seconds histogram', text)
+        self.assertIn('dailypilot_x_seconds_bucket{op="a",le="0.005"} 1', text)
+        self.assertIn('dailypilot_x_seconds_bucket{op="a",le="+Inf"} 2', text)
+        self.assertIn('dailypilot_x_seconds_count{op="a"} 2', text)
+        self.assertIn('dailypilot_x_errors_total{op="a"} 1', text)
+
+class TestTimed(unittest.TestCase):
+
+    def test_sync_and_async(self):
+        """Декоратор меряет обычные функции и корутины, ошибки считает отдельно"""
+        @timed("test_call", op="sync_ok")
+        def ok():
+            return 42
+
+        @timed("test_call", op="async_fail")
+        async def fail():
+            raise ValueError("boom")
+
+        self.assertEqual(ok(), 42)
+        self.assertEqual(ok.__name__, "ok")
+        with self.assertRaises(ValueError):
+            asyncio.run(fail())
+
+        counts = {labels["op"]: n for labels, n, *_ in registry.summary("test_call_seconds")}
+        self.assertGreaterEqual(counts["sync_ok"], 1)
+        self.assertGreaterEqual(counts["async_fail"], 1)
+        self.assertGreaterEqual(registry.counter_value("test_call_errors_total", op="async_fail"), 1)
+        self.assertTrue(any(l.startswith("sync_ok:") for l in format_latency_summary("test_call_seconds", "op")))
+
+    def test_http_endpoint(self):
+        """GET /metrics отдаёт текст реестра; METRICS_PORT=0 отключает эндпоинт"""
+        self.assertIsNone(start_metrics_server("127.0.0.1", 0))
+        registry.inc("test_http_total")
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            port = server.server_address[1]
+            body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5).read().decode()
+            self.assertIn("dailypilot_test_http_total 1", body)
+        finally:
+            server.shutdown()
+            server.server_close()
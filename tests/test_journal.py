@@ -0,0 +1,64 @@
+import unittest
+import os
+import time
+import sqlite3
+from datetime import datetime, timezone
+from src.app import backup
+from src.app.db import mark_done, db_connect
+from src.app.journal import restore_to, compact_journal
+from tests.base import DBTestCase
+
+class TestJournal(DBTestCase):
+
+    db_path_modules = (backup,)
+    
+    def setUp(self):
+        """Временная БД и каталог бэкапов"""
+        super().setUp()
+        self.patch_object(backup, "_manifest", None)
+    
+    def _add(self, title):
+        return self._add_task(123, title)
+    
+    def _events(self):
+        conn = db_connect()
+        rows = conn.execute("SELECT task_id, op FROM task_events ORDER BY id").fetchall()
+        conn.close()
+        return [(r["task_id"], r["op"]) for r in rows]
+    
+    def test_triggers_write_events(self):
+        """Вставка и обновление попадают в журнал"""
+        tid = self._add("Task")
+        mark_done(123, tid)
+        self.assertEqual(self._events(), [(tid, "I"), (tid, "U")])
+    
+    def test_point_in_time_restore(self):
+        """Бэкап + журнал восстанавливают состояние на заданный момент"""
+        t1 = self._add("Before backup")
+        backup.create_backup()
+        time.sleep(0.01)
+        mark_done(123, t1)
+        t2 = self._add("After backup")
+        time.sleep(0.01)
+        target = datetime.now(timezone.utc)
+        time.sleep(0.01)
+        self._add("Too late")
+        
+        out = os.path.join(self.temp_dir, "restored.db")
+        res = restore_to(target, out)
+        self.assertEqual(res["events"], 2)
+        conn = sqlite3.connect(out)
+        rows = conn.execute("SELECT id, status FROM tasks ORDER BY id").fetchall()
+        conn.close()
+        self.assertEqual(rows, [(t1, "done"), (t2, "open")])
+    
+    def test_compact_keeps_events_after_backup(self):
+        """Сжатие удаляет только события, уже лежащие в бэкапах"""
+        self._add("One")
+        backup.create_backup()
+        t2 = self._add("Two")
+        self.assertEqual(compact_journal(), 1)
+        self.assertEqual(self._events(), [(t2, "I")])
+
+if __name__ == '__main__':
+    unittest.main()
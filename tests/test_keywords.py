@@ -0,0 +1,57 @@
+import unittest
+import random
+from src.app import keywords
+from src.app.config import TASK_KEYWORDS
+from src.app.keywords import build_automaton, find_keywords, classify, task_kind
+
+class TestKeywords(unittest.TestCase):
+
+    def _naive(self, text):
+        t = text.lower()
+        return {(g, w) for g, words in TASK_KEYWORDS.items() for w in words if w in t}
+
+    def test_matches_naive_scan(self):
+        """Автомат находит ровно то же, что циклы `kw in t`, включая перекрытия"""
+        self.assertIn(("est_high", "разработ"), find_keywords("Разработать бота"))
+        self.assertIn(("important", "бот"), find_keywords("Разработать бота"))
+        alphabet = "".join(sorted({ch for words in TASK_KEYWORDS.values() for w in words for ch in w})) + " ."
+        rnd = random.Random(7)
+        words = [w for ws in TASK_KEYWORDS.values() for w in ws]
+        for _ in range(500):
+            parts = [rnd.choice(words) if rnd.random() < 0.3 else "".join(rnd.choices(alphabet, k=rnd.randint(1, 6)))
+                     for _ in range(rnd.randint(0, 6))]
+            text = "".join(parts).upper() if rnd.random() < 0.3 else "".join(parts)
+            self.assertEqual(find_keywords(text), self._naive(text), text)
+
+    def test_suffix_links(self):
+        """Слово внутри другого и совпадения после неудачного продолжения"""
+        groups = {"a": ["he", "she", "his", "hers"], "b": ["ushe"]}
+        goto, fail, out = build_automaton(groups)
+        state, found = 0, set()
+        for ch in "ushers":
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            found |= out[state]
+        self.assertEqual(found, {("a", "she"), ("a", "he"), ("a", "hers"), ("b", "ushe")})
+
+    def test_features(self):
+        """Все признаки задачи — из одного прохода"""
+        f = classify("Лягушка: разработать бот для клиента")
+        self.assertEqual(f.est_minutes, 90)
+        self.assertEqual(f.important, frozenset({"бот", "клиент"}))
+        self.assertEqual(f.importance, 2 * 8.0 + 12.0)
+        self.assertEqual(f.kind, "frog")
+        self.assertEqual(task_kind("Камень недели"), "stone")
+        self.assertEqual(task_kind(None), "sand")
+        self.assertEqual(classify("Погулять").est_minutes, 30)
+
+    def test_memoized(self):
+        """Повторная классификация того же названия берётся из кэша"""
+        keywords.classify.cache_clear()
+        classify("Оплата счёта")
+        classify("Оплата счёта")
+        self.assertEqual(keywords.classify.cache_info().hits, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import asyncio
+from unittest import mock
+from src.app.integrations import notion
+from tests.fakes import FakeNotionClient, FakeOpenAI
+from benchmarks.loadgen import run_load, make_updates
+
+class TestFakes(unittest.TestCase):
+
+    def test_notion_sync_idempotent_on_fake(self):
+        """Повторная синхронизация в фейковый Notion не плодит страниц"""
+        fake = FakeNotionClient()
+        rows = [{"Direction": "AI", "Task": f"Задача {i}", "Status": "planned"} for i in range(5)]
+        with mock.patch.object(notion, "_cli", return_value=fake), \
+                mock.patch.object(notion, "DB_WEEK", "db-week"), \
+                mock.patch.object(notion, "NOTION_RPS", 0), \
+                mock.patch.dict(notion._page_cache, clear=True):
+            first = asyncio.run(notion.push_week_tasks(rows))
+            second = asyncio.run(notion.push_week_tasks(rows))
+        self.assertEqual(first["created"], 5)
+        self.assertEqual(second["created"], 0)
+        self.assertEqual(second["skipped"], 5)
+        self.assertEqual(len(fake.databases_store["db-week"]), 5)
+
+    def test_fake_openai_canned_json(self):
+        """FakeOpenAI отвечает JSON-заготовкой по тексту пользователя"""
+        client = FakeOpenAI()
+        r = client.chat.completions.create(model="x", messages=[{"role": "user", "content": "Позвонить"}])
+        self.assertIn('"title": "Позвонить"', r.choices[0].message.content)
+
+class TestLoadGenerator(unittest.TestCase):
+
+    def test_updates_mix(self):
+        """Команды в апдейтах размечены bot_command"""
+        updates = make_updates(50, user_id=7, seed=1)
+        self.assertEqual(len(updates), 50)
+        commands = [u for u in updates if u["message"]["text"].startswith("/")]
+        self.assertTrue(commands)
+        self.assertTrue(all(u["message"]["entities"][0]["type"] == "bot_command" for u in commands))
+
+    def test_run_load_through_handlers(self):
+        """Апдейты проходят через настоящие хендлеры, ответы уходят в фейковый Bot API"""
+        report = asyncio.run(run_load(updates=40, concurrency=5, rate_limit_every=25, seed_tasks=20))
+        self.assertEqual(report["updates"], 40)
+        self.assertGreater(report["bot_api_sent"], 0)
+        self.assertGreater(report["bot_api_rate_limited"], 0)
+        self.assertGreater(report["throughput"], 0)
+        self.assertIn("/add", report["by_command"])
+        self.assertLessEqual(report["latency"]["p50"], report["latency"]["max"])
@@ -0,0 +1,92 @@
+import unittest
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from src.app import db
+from src.app.db import add_task, mark_done, snooze_task, drop_task, iso_utc, db_connect
+from src.app.metrics import Metrics
+from tests.base import DBTestCase
+
+class TestStatsRollup(DBTestCase):
+    
+    def setUp(self):
+        """Временная БД"""
+        super().setUp()
+        self.metrics = Metrics()
+    
+    def tearDown(self):
+        self.metrics.close()
+    
+    def _rollup(self):
+        conn = db_connect()
+        rows = conn.execute("""
+            SELECT chat_id, day, context, status, source, has_due, cnt, minutes
+            FROM task_stats_daily WHERE cnt != 0 ORDER BY 1,2,3,4,5,6
+        """).fetchall()
+        conn.close()
+        return [tuple(r) for r in rows]
+    
+    def test_rollup_matches_full_rebuild(self):
+        """Инкрементальная свёртка совпадает с полным пересчётом"""
+        now = datetime.now(timezone.utc)
+        t1 = add_task(123, "Task 1", "", "AI", None, iso_utc(now), 80, 15, "voice")
+        t2 = add_task(123, "Task 2", "", "Дом", None, iso_utc(now - timedelta(days=10)), 60, 45, "text")
+        t3 = add_task(123, "Task 3", "", None, None, iso_utc(now), 60, 30, "text")
+        mark_done(123, t1)
+        snooze_task(123, t2, iso_utc(now + timedelta(days=1)))
+        drop_task(123, t3)
+        incremental = self._rollup()
+        
+        conn = db_connect()
+        db.rebuild_task_stats(conn.cursor())
+        conn.commit()
+        conn.close()
+        self.assertEqual(incremental, self._rollup())
+    
+    def test_stats_from_rollup(self):
+        """get_stats и productivity читают свёртку"""
+        now = datetime.now(timezone.utc)
+        t1 = add_task(123, "Task 1", "", "AI", None, iso_utc(now), 80, 15, "voice")
+        add_task(123, "Task 2", "", "AI", iso_utc(now), iso_utc(now), 60, 45, "text")
+        add_task(123, "Old", "", "Дом", None, iso_utc(now - timedelta(days=30)), 60, 45, "text")
+        add_task(456, "Other chat", "", "AI", None, iso_utc(now), 60, 45, "text")
+        mark_done(123, t1)
+        
+        stats = self.metrics.get_stats(123)
+        self.assertEqual(stats["total_tasks"], 3)
+        self.assertEqual(stats["done_tasks"], 1)
+        self.assertEqual(stats["open_tasks"], 2)
+        self.assertEqual(stats["tasks_with_deadline"], 1)
+        self.assertEqual(stats["voice_tasks"], 1)
+        self.assertEqual(stats["tasks_added_week"], 2)
+        self.assertEqual(stats["tasks_done_week"], 1)
+        self.assertEqual(self.metrics.get_productivity_score(123), 50.0)
+        ctx = {r["context"]: r for r in self.metrics.get_context_stats(123)}
+        self.assertEqual(ctx["AI"]["total_count"], 2)
+        self.assertEqual(ctx["Дом"]["open_count"], 1)
+    
+    def test_concurrent_reads(self):
+        """Один экземпляр Metrics безопасно читается из нескольких потоков"""
+        add_task(123, "Task", "", "AI", None, iso_utc(datetime.now(timezone.utc)), 50, 30, "text")
+        with ThreadPoolExecutor(max_workers=8) as ex:
+            results = list(ex.map(lambda _: self.metrics.get_stats(123)["total_tasks"], range(50)))
+        self.assertEqual(results, [1] * 50)
+        self.assertLessEqual(self.metrics.pool._created, self.metrics.pool.size)
+        self.assertEqual(self.metrics.query_timings()["stats_totals"]["count"], 50)
+    
+    def test_reconnect_after_error(self):
+        """Соединение с ошибкой БД выбрасывается из пула"""
+        with self.assertRaises(sqlite3.DatabaseError):
+            with self.metrics.pool.cursor() as c:
+                c.execute("SELECT * FROM no_such_table")
+        self.assertEqual(self.metrics.pool._created, 0)
+        self.assertIsNotNone(self.metrics.get_stats(123))
+    
+    def test_pool_is_read_only(self):
+        """Пул не позволяет писать в БД"""
+        with self.assertRaises(sqlite3.DatabaseError):
+            with self.metrics.pool.cursor() as c:
+                c.execute("DELETE FROM tasks")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+import asyncio
+from unittest import mock
+import httpx
+from notion_client.errors import HTTPResponseError
+from src.app.integrations import notion
+from tests.fakes import FakeNotionClient
+
+def _http_error(status, headers=None):
+    return HTTPResponseError(httpx.Response(status, headers=headers or {}))
+
+class _Flaky:
+    """Вызов API, который сначала отвечает ошибками из errors, потом успехом"""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def __call__(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"ok": True, **kwargs}
+
+class TestNotionCall(unittest.TestCase):
+
+    def _run(self, fn, sleep):
+        async def go():
+            limiter = notion._RateLimiter(0)
+            return await notion._call(limiter, asyncio.Semaphore(1), fn, page_id="p1")
+        with mock.patch.object(notion.asyncio, "sleep", sleep), \
+             mock.patch.object(notion.random, "uniform", return_value=0.0):
+            return asyncio.run(go())
+
+    def test_retry_after_respected(self):
+        """429 с Retry-After: ждём столько, сколько просит Notion, затем успех"""
+        fn, sleep = _Flaky([_http_error(429, {"Retry-After": "3"})]), mock.AsyncMock()
+        self.assertEqual(self._run(fn, sleep), {"ok": True, "page_id": "p1"})
+        self.assertEqual(fn.calls, 2)
+        self.assertEqual([c.args[0] for c in sleep.await_args_list], [3.0])
+
+    def test_backoff_on_server_errors(self):
+        """5xx без Retry-After — экспоненциальная пауза"""
+        fn, sleep = _Flaky([_http_error(502), _http_error(503)]), mock.AsyncMock()
+        self._run(fn, sleep)
+        self.assertEqual([c.args[0] for c in sleep.await_args_list], [1.0, 2.0])
+
+    def test_client_error_not_retried(self):
+        """4xx (кроме 429) и исчерпанные попытки пробрасываются"""
+        fn = _Flaky([_http_error(400)])
+        with self.assertRaises(HTTPResponseError):
+            self._run(fn, mock.AsyncMock())
+        self.assertEqual(fn.calls, 1)
+
+        fn = _Flaky([_http_error(429)] * 3)
+        with mock.patch.object(notion, "NOTION_MAX_RETRIES", 2), self.assertRaises(HTTPResponseError):
+            self._run(fn, mock.AsyncMock())
+        self.assertEqual(fn.calls, 3)
+
+    def test_rate_limiter_spacing(self):
+        """Старты запросов разнесены не меньше чем на 1/rps"""
+        async def go():
+            limiter = notion._RateLimiter(50)
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            for _ in range(5):
+                await limiter.wait()
+            return loop.time() - started
+        self.assertGreaterEqual(asyncio.run(go()), 4 * 0.02 - 0.005)
+
+class TestNotionUpsert(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeNotionClient()
+        self.patches = [mock.patch.object(notion, "_cli", return_value=self.fake),
+                        mock.patch.object(notion, "NOTION_RPS", 0),
+                        mock.patch.dict(notion._page_cache, clear=True)]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+
+    def _push(self, rows):
+        return asyncio.run(notion.push_week_tasks(rows, database_id="db-week"))
+
+    def test_update_changed_row(self):
+        """Изменённая строка обновляет свою страницу, неизменённые пропускаются"""
+        rows = [{"Direction": "Работа", "Task": "Отчёт", "Outcome": "черновик"},
+                {"Direction": "Дом", "Task": "Уборка", "Outcome": ""}]
+        self.assertEqual(self._push(rows), {"created": 2, "updated": 0, "skipped": 0, "failed": 0})
+        rows[0] = dict(rows[0], Outcome="готов")
+        self.assertEqual(self._push(rows), {"created": 0, "updated": 1, "skipped": 1, "failed": 0})
+
+        pages = list(self.fake.databases_store["db-week"].values())
+        self.assertEqual(len(pages), 2)
+        outcomes = {notion._plain(p["properties"]["Task"]): notion._plain(p["properties"]["Outcome"]) for p in pages}
+        self.assertEqual(outcomes["Отчёт"], "готов")
+
+    def test_existing_pages_matched_by_key(self):
+        """Страницы, созданные не этим процессом, находятся по (Direction, Task) без учёта регистра и ё"""
+        self._push([{"Direction": "Работа", "Task": "Счёт клиенту"}])
+        notion._page_cache.clear()
+        stats = self._push([{"Direction": "работа", "Task": "счет  клиенту"}])
+        self.assertEqual((stats["created"], stats["updated"]), (0, 1))
+        self.assertEqual(len(self.fake.databases_store["db-week"]), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+import pytz
+from src.app import handlers, tenants
+from src.app.db import iso_utc, list_inbox_page, list_week_page
+from tests.base import DBTestCase
+
+class TestPagination(DBTestCase):
+
+    def setUp(self):
+        """Временная БД"""
+        super().setUp()
+        tenants.invalidate()
+
+    def tearDown(self):
+        tenants.invalidate()
+
+    def _add(self, priority, due=None, chat_id=1):
+        return self._add_task(chat_id, f"Задача {priority}", due, priority=priority)
+
+    def _walk(self, fetch):
+        """Все страницы вперёд, затем обратно; возвращает (ids вперёд, ids назад по страницам)"""
+        pages, cursor = [], None
+        while True:
+            rows, has_prev, has_next = fetch(cursor, False)
+            self.assertEqual(has_prev, cursor is not None)
+            pages.append([r["id"] for r in rows])
+            if not has_next:
+                break
+            cursor = rows[-1]["id"]
+        back, first = [pages[-1]], pages[-1][0]
+        while True:
+            rows, has_prev, has_next = fetch(first, True)
+            self.assertTrue(has_next)
+            back.append([r["id"] for r in rows])
+            if not has_prev:
+                break
+            first = rows[0]["id"]
+        return pages, back[::-1]
+
+    def test_inbox_keyset_with_equal_priorities(self):
+        """Страницы инбокса без пропусков и повторов, в том числе при равных приоритетах"""
+        ids = [self._add(p) for p in (50, 70, 50, 50, 90, 10, 50)]
+        self._add(99, due=datetime.now(timezone.utc))  # со сроком — не инбокс
+        self._add(80, chat_id=2)
+        expected = [ids[4], ids[1], ids[6], ids[3], ids[2], ids[0], ids[5]]
+
+        pages, back = self._walk(lambda cursor, backward: list_inbox_page(1, cursor, backward, limit=3))
+        self.assertEqual([len(p) for p in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual(back, pages)
+
+    def test_week_keyset(self):
+        """Неделя листается в порядке (срок, приоритет убыв.) и обратно"""
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        same = now + timedelta(hours=2)
+        ids = [self._add(40, same), self._add(60, same), self._add(60, same),
+               self._add(90, now + timedelta(hours=1)), self._add(10, now + timedelta(days=1))]
+        self._add(99, now + timedelta(days=8))  # вне окна
+        expected = [ids[3], ids[2], ids[1], ids[0], ids[4]]
+        start, end = iso_utc(now), iso_utc(now + timedelta(days=7))
+
+        pages, back = self._walk(lambda cursor, backward: list_week_page(1, start, end, cursor, backward, limit=2))
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual(back, pages)
+
+    def test_page_buttons(self):
+        """Кнопки несут id крайних задач страницы, последняя страница без ▶"""
+        ids = [self._add(p) for p in range(1, 5)]
+        with mock.patch.object(handlers, "PAGE_SIZE", 3):
+            text, keyboard = handlers.inbox_page(1)
+            self.assertIn(f"#{ids[3]}", text)
+            (nxt,), = keyboard.inline_keyboard
+            self.assertEqual((nxt.text, nxt.callback_data), ("▶", f"page:inbox:n:{ids[1]}"))
+
+            text, keyboard = handlers.inbox_page(1, ids[1])
+            (prev,), = keyboard.inline_keyboard
+            self.assertEqual((prev.text, prev.callback_data), ("◀", f"page:inbox:p:{ids[0]}"))
+
+            tz = pytz.timezone("Europe/Moscow")
+            self.assertEqual(handlers.week_page(1, tz, datetime.now(tz).date()), (None, None))
+
+if __name__ == "__main__":
+    unittest.main()
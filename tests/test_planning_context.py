@@ -0,0 +1,76 @@
+import unittest
+from unittest import mock
+from src.app.integrations import planning_context as pc
+
+def _task(tid, priority, title=None, due="2025-11-10T10:00:00+00:00"):
+    return {"id": tid, "title": title or f"Задача {tid}", "context": "Работа", "priority": priority,
+            "est_minutes": 30, "due_at": due}
+
+class TestPlanningContext(unittest.TestCase):
+
+    def setUp(self):
+        """Чистые кэши модуля"""
+        pc._goals.clear()
+        pc._last_prompt.clear()
+
+    def test_goals_snapshot_cached_until_invalidated(self):
+        """Таблица читается раз в TTL; invalidate_goals и пустой ответ не оставляют кэш"""
+        loader = mock.Mock(return_value=([{"Goal_Objective": "Рост"}], []))
+        pc.goals_snapshot("sheet-1", loader)
+        pc.goals_snapshot("sheet-1", loader)
+        self.assertEqual(loader.call_count, 1)
+        loader.assert_called_with("sheet-1")
+        pc.invalidate_goals("sheet-1")
+        pc.goals_snapshot("sheet-1", loader)
+        self.assertEqual(loader.call_count, 2)
+
+        with mock.patch.object(pc, "AI_CONTEXT_TTL_MIN", 0):
+            pc.goals_snapshot("sheet-1", loader)
+        self.assertEqual(loader.call_count, 3)
+
+        empty = mock.Mock(return_value=([], []))
+        pc.goals_snapshot("sheet-2", empty)
+        pc.goals_snapshot("sheet-2", empty)
+        self.assertEqual(empty.call_count, 2)
+
+    def test_goals_snapshot_per_sheet(self):
+        """Снимок одной таблицы не отдаётся другой, сброс затрагивает только свою"""
+        loader = lambda sheet_id: ([{"Goal_Objective": f"Цель {sheet_id}"}], [])
+        self.assertEqual(pc.goals_snapshot("a", loader)[0][0]["Goal_Objective"], "Цель a")
+        self.assertEqual(pc.goals_snapshot("b", loader)[0][0]["Goal_Objective"], "Цель b")
+        self.assertEqual(pc.goals_snapshot(None, loader)[0][0]["Goal_Objective"], "Цель None")
+        pc.invalidate_goals("a")
+        self.assertEqual(set(pc._goals), {"b", None})
+
+    def test_task_lines(self):
+        """Строка задачи: id, название, контекст, приоритет, оценка и дата дедлайна"""
+        lines = pc.task_lines([_task(1, 80.6), _task(2, None, due=None)])
+        self.assertEqual(lines[0], "#1: Задача 1 [Работа] — приоритет 80, ~30м, дедлайн: 2025-11-10")
+        self.assertIn("приоритет 0", lines[1])
+        self.assertTrue(lines[1].endswith("дедлайн: нет"))
+
+    def test_budget_drops_lowest_priority(self):
+        """При нехватке бюджета уходят задачи с конца (меньший приоритет), цели — по весу"""
+        tasks = [_task(i, 100 - i) for i in range(1, 41)]
+        goals = [{"Goal_Objective": "Мелкая", "Weight": 1}, {"Goal_Objective": "Главная", "Weight": 5}]
+        prompt = pc.build_prompt(1, goals, [], tasks, 3, 3, budget=200)
+        self.assertLess(prompt.index("Главная"), prompt.index("Мелкая"))
+        self.assertIn("#1: ", prompt)
+        self.assertNotIn("#40: ", prompt)
+        info = pc.last_prompt(1)
+        self.assertGreater(info["dropped"], 0)
+        self.assertIn(f"… и ещё {info['dropped']} задач", prompt)
+        self.assertIn("Открытых задач сейчас: 40", prompt)
+
+    def test_digest_recorded(self):
+        """Одинаковый контекст даёт тот же дайджест, изменение задачи — другой"""
+        pc.build_prompt(1, [], [], [_task(1, 50)], 0, 3)
+        digest = pc.last_prompt(1)["digest"]
+        pc.build_prompt(1, [], [], [_task(1, 50)], 0, 3)
+        self.assertEqual(pc.last_prompt(1)["digest"], digest)
+        pc.build_prompt(1, [], [], [_task(1, 90)], 0, 3)
+        self.assertNotEqual(pc.last_prompt(1)["digest"], digest)
+        self.assertIsNone(pc.last_prompt(2))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 from datetime import datetime, timedelta
-from src.app.handlers import estimate_minutes, compute_priority, importance_boost
+from src.app.handlers import estimate_minutes, compute_priority
+from src.app.priority import importance_boost
 from src.app.config import TZINFO
 
 class TestPriority(unittest.TestCase):
@@ -0,0 +1,85 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+from src.app import priority
+from src.app.db import db_connect
+from src.app.priority import compute_priority, refresh_priorities
+from tests.base import DBTestCase
+
+class TestPriorityRefresh(DBTestCase):
+
+    def setUp(self):
+        """Временная БД"""
+        super().setUp()
+        self.now = datetime.now(timezone.utc).replace(microsecond=0)
+
+    def _add(self, title, due=None, est=30, chat_id=1):
+        return self._add_task(chat_id, title, due, est, priority=0, added=self.now)
+
+    def _priorities(self):
+        conn = db_connect()
+        rows = conn.execute("SELECT id, priority FROM tasks ORDER BY id").fetchall()
+        conn.close()
+        return {r["id"]: r["priority"] for r in rows}
+
+    def _exec(self, sql, params=()):
+        conn = db_connect()
+        conn.execute(sql, params)
+        conn.commit()
+        conn.close()
+
+    def test_matches_python_formula(self):
+        """Пересчёт в SQL совпадает с compute_priority для тех же данных и момента"""
+        cases = [("Оплата налога", self.now + timedelta(hours=5), 20),
+                 ("Прогулка", self.now - timedelta(hours=1), 90),
+                 ("Съесть лягушку: звонок клиенту", self.now + timedelta(days=3), 45),
+                 ("Без срока", None, 30)]
+        ids = [self._add(*c) for c in cases]
+        self.assertEqual(refresh_priorities(now_utc=self.now), len(cases))
+
+        got = self._priorities()
+        with mock.patch.object(priority, "datetime", wraps=datetime) as dt:
+            dt.now.return_value = self.now
+            for tid, (title, due, est) in zip(ids, cases):
+                self.assertAlmostEqual(got[tid], compute_priority(title, due, est), places=6)
+        # Повторный пересчёт на тот же момент ничего не меняет
+        self.assertEqual(refresh_priorities(now_utc=self.now), 0)
+
+    def test_order_follows_deadlines(self):
+        """С приближением срока задача обгоняет ту, что была важнее"""
+        far = self._add("Оплата счёта клиенту", self.now + timedelta(days=2))
+        soon = self._add("Прогулка", self.now + timedelta(days=1))
+        refresh_priorities(now_utc=self.now)
+        p = self._priorities()
+        self.assertGreater(p[far], p[soon])
+
+        refresh_priorities(now_utc=self.now + timedelta(hours=23))
+        p = self._priorities()
+        self.assertGreater(p[soon], p[far])
+
+    def test_scope_and_base_reset(self):
+        """Пересчёт по чату не трогает другие чаты; смена названия сбрасывает кэш"""
+        mine = self._add("Прогулка")
+        other = self._add("Прогулка", chat_id=2)
+        self.assertEqual(refresh_priorities(chat_id=1, now_utc=self.now), 1)
+        self.assertEqual(self._priorities()[other], 0)
+
+        before = self._priorities()[mine]
+        self._exec("UPDATE tasks SET title='Прогулка и банк' WHERE id=?", (mine,))
+        refresh_priorities(chat_id=1, now_utc=self.now)
+        self.assertAlmostEqual(self._priorities()[mine] - before, 0.4 * 8.0)
+
+    def test_refresh_not_journaled(self):
+        """Пересчёт приоритета не пишет событий в журнал"""
+        self._add("Задача", self.now + timedelta(hours=3))
+        conn = db_connect()
+        before = conn.execute("SELECT COUNT(*) FROM task_events").fetchone()[0]
+        conn.close()
+        self.assertEqual(refresh_priorities(now_utc=self.now), 1)
+        conn = db_connect()
+        after = conn.execute("SELECT COUNT(*) FROM task_events").fetchone()[0]
+        conn.close()
+        self.assertEqual(after, before)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import os
+import time
+import asyncio
+import threading
+from src.app.profiler import SamplingProfiler, profile_for, parse_duration, measure_stalls
+
+def _busy_loop(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+class TestSamplingProfiler(unittest.TestCase):
+
+    def test_collapsed_stacks(self):
+        """Сэмплер видит стеки других потоков и пишет collapsed-формат"""
+        stop = threading.Event()
+        worker = threading.Thread(target=_busy_loop, args=(stop,), name="busy-worker")
+        worker.start()
+        sampler = SamplingProfiler(interval_s=0.001)
+        sampler.start()
+        time.sleep(0.2)
+        sampler.stop()
+        stop.set()
+        worker.join()
+
+        self.assertGreater(sampler.samples, 0)
+        text = sampler.collapsed()
+        busy = [l for l in text.splitlines() if l.startswith("busy-worker;") and "_busy_loop" in l]
+        self.assertTrue(busy)
+        self.assertTrue(busy[0].rsplit(" ", 1)[1].isdigit())
+        self.assertTrue(sampler.top_frames())
+
+    def test_parse_duration(self):
+        self.assertEqual(parse_duration("30s"), 30)
+        self.assertEqual(parse_duration("2m"), 120)
+        self.assertEqual(parse_duration(None, default=15), 15)
+
+class TestProfileFor(unittest.TestCase):
+
+    def test_stall_detected(self):
+        """Блокирующий вызов в event loop фиксируется как остановка"""
+        async def run():
+            loop = asyncio.get_running_loop()
+            loop.call_later(0.05, time.sleep, 0.25)
+            return await measure_stalls(0.5, threshold_s=0.1)
+        stalls = asyncio.run(run())
+        self.assertEqual(len(stalls), 1)
+        self.assertGreaterEqual(stalls[0], 0.2)
+
+    def test_modes_write_files(self):
+        """Оба режима сохраняют файл и сводку"""
+        for mode in ("sample", "cprofile"):
+            result = asyncio.run(profile_for(1, mode))
+            try:
+                self.assertEqual(result["mode"], mode)
+                self.assertGreater(os.path.getsize(result["path"]), 0)
+                self.assertIn("count", result["stalls"])
+            finally:
+                os.remove(result["path"])
+        with self.assertRaises(ValueError):
+            asyncio.run(profile_for(1, "perf"))
+
+class TestProfileCommand(unittest.TestCase):
+
+    def test_does_not_block_updates(self):
+        """/profile выполняется задачей, остальные апдейты обрабатываются во время замера"""
+        from src.app.main import build_application
+        app = build_application(token="123456:TEST")
+        profile = [h for hs in app.handlers.values() for h in hs if "profile" in getattr(h, "commands", ())]
+        self.assertEqual(len(profile), 1)
+        self.assertFalse(profile[0].block)
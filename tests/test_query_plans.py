@@ -0,0 +1,104 @@
+import unittest
+import re
+from datetime import datetime, timedelta, timezone
+from src.app import db, tenants, export, archive, priority
+from src.app.db import iso_utc
+from tests.base import DBTestCase
+
+# Полный проход по таблице задач (без индекса): "SCAN tasks" / "SCAN t"
+FULL_SCAN = re.compile(r"^SCAN (tasks|tasks_archive|t)$")
+
+class TestQueryPlans(DBTestCase):
+    """Горячие запросы db.py идут по индексам. SQL берётся из самих функций
+    (trace callback соединения), так что правка запроса без индекса уронит тест."""
+
+    def setUp(self):
+        """Временная БД; все соединения пишут выполненный SQL в self.sql"""
+        super().setUp()
+        self.sql = []
+        real_connect = db.db_connect
+
+        def traced_connect():
+            conn = real_connect()
+            conn.set_trace_callback(self.sql.append)
+            return conn
+        for m in (db, tenants, export, archive, priority):
+            self.patch_object(m, "db_connect", traced_connect)
+
+    def _plans(self, call):
+        """Выполняет call и возвращает [(sql, [строки плана])] его запросов"""
+        self.sql.clear()
+        call()
+        # Служебные запросы FTS5 к своим теневым таблицам ('main'.'tasks_fts_*') не наши
+        statements = [s for s in self.sql if s.split(None, 1)[0].upper() in ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT")
+                      and "'main'." not in s]
+        self.assertTrue(statements, "функция не выполнила ни одного запроса")
+        conn = db.db_connect()
+        try:
+            return [(s, [r["detail"] for r in conn.execute("EXPLAIN QUERY PLAN " + s).fetchall()]) for s in statements]
+        finally:
+            conn.close()
+
+    def assertIndexed(self, call, index=None, covering=False, sorted_by_index=False):
+        for sql, plan in self._plans(call):
+            details = " | ".join(plan)
+            self.assertFalse([d for d in plan if FULL_SCAN.match(d)], f"full scan in: {details}\n{sql}")
+            if index:
+                self.assertIn(index, details, sql)
+            if covering:
+                self.assertIn("COVERING INDEX", details, sql)
+            if sorted_by_index:
+                self.assertNotIn("TEMP B-TREE FOR ORDER BY", details, sql)
+
+    def test_open_lists(self):
+        """Списки открытых задач чата: частичные индексы, сортировка без B-tree"""
+        self.assertIndexed(lambda: db.list_open_tasks(1), "idx_tasks_open_priority", sorted_by_index=True)
+        self.assertIndexed(lambda: db.list_inbox(1))
+        tid = db.add_task(1, "a", "", "", None, iso_utc(datetime.now(timezone.utc)), 1, 30, "text")
+        for cursor, backward in ((None, False), (tid, False), (tid, True)):
+            self.assertIndexed(lambda: db.list_inbox_page(1, cursor, backward), "idx_tasks_inbox", sorted_by_index=True)
+        tenants.add_tenant(42, max_open_tasks=5)
+        self.assertIndexed(lambda: tenants.open_tasks_limit_reached(42), covering=True)
+
+    def test_due_ranges(self):
+        """Диапазоны сроков идут по (chat_id, status, due_epoch)"""
+        now = datetime.now(timezone.utc)
+        start, end = iso_utc(now), iso_utc(now + timedelta(days=1))
+        self.assertIndexed(lambda: db.list_today(1, start, start, end))
+        self.assertIndexed(lambda: db.list_week_tasks(1, start, end), "idx_tasks_chat_status_due")
+        self.assertIndexed(lambda: db.list_week_page(1, start, end, cursor_id=1), "idx_tasks_chat_status_due")
+        self.assertIndexed(lambda: db.list_overdue(1, start), "idx_tasks_chat_status_due", sorted_by_index=True)
+        self.assertIndexed(lambda: db.list_midnight_due(1, [0, 10800]), "idx_tasks_chat_status_due")
+        self.assertIndexed(lambda: db.open_due_in_windows([(1, start, end), (2, start, end)]), "idx_tasks_chat_status_due")
+
+    def test_due_overdues(self):
+        """Напоминания по всем чатам идут по частичному индексу открытых, без сортировки"""
+        self.assertIndexed(lambda: db.due_overdues(iso_utc(datetime.now(timezone.utc))), "idx_tasks_open_due",
+                           sorted_by_index=True)
+
+    def test_point_updates_and_archive(self):
+        """Изменения по id — по первичному ключу, архиватор — по индексу закрытых"""
+        tid = db.add_task(1, "a", "", "", None, iso_utc(datetime.now(timezone.utc)), 1, 30, "text")
+        self.assertIndexed(lambda: db.mark_done(1, tid), "PRIMARY KEY")
+        self.assertIndexed(lambda: db.reschedule_tasks(1, [(tid, None)]), "PRIMARY KEY")
+        self.assertIndexed(lambda: archive.archive_closed_tasks(30), "COVERING INDEX idx_tasks_closed")
+
+    def test_priority_refresh(self):
+        """Пересчёт приоритетов (всех и по чату) не сканирует всю таблицу"""
+        db.add_task(1, "a", "", "", None, iso_utc(datetime.now(timezone.utc)), 1, 30, "text")
+        self.assertIndexed(lambda: priority.refresh_priorities())
+        self.assertIndexed(lambda: priority.refresh_priorities(1))
+
+    def test_search_uses_fts(self):
+        """Поиск идёт по tasks_fts, строки задач — по первичному ключу"""
+        self.assertIndexed(lambda: db.search_tasks(1, "отчёт"), "VIRTUAL TABLE INDEX")
+        self.assertIndexed(lambda: db.find_tasks_by_title(1, "Написать отчёт"), "PRIMARY KEY")
+        self.assertIndexed(lambda: db.find_tasks_by_title(1, "🔥"))
+
+    def test_export_over_archive(self):
+        """Экспорт через tasks_all ищет по чату и в горячей таблице, и в архиве"""
+        since = iso_utc(datetime.now(timezone.utc) - timedelta(days=7))
+        self.assertIndexed(lambda: export.export_tasks(1, since_iso=since)[0].close(), "idx_tasks_archive_chat_added")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+from datetime import datetime, date
+from unittest import mock
+import pytz
+from src.app import db, rollover
+from src.app.db import db_connect, iso_utc
+from src.app.rollover import rollover_day, format_report
+from tests.base import DBTestCase
+
+MSK = pytz.timezone("Europe/Moscow")
+
+class TestRolloverDay(DBTestCase):
+
+    def _add(self, title, due_local, est=30, chat_id=1):
+        return self._add_task(chat_id, title, MSK.localize(due_local), est)
+
+    def _due(self, task_id):
+        conn = db_connect()
+        due = conn.execute("SELECT due_at FROM tasks WHERE id=?", (task_id,)).fetchone()[0]
+        conn.close()
+        return due
+
+    def test_slots_and_report(self):
+        """Лягушка — на вечер завтра, крупная — на воскресенье, отчёт с разбивкой"""
+        frog = self._add("Лягушка: отчёт", datetime(2025, 3, 5, 9, 0))       # среда
+        big = self._add("Архитектура", datetime(2025, 3, 5, 14, 0), est=90)
+        other_day = self._add("Завтрашняя", datetime(2025, 3, 6, 9, 0))
+        self._add("Чужая", datetime(2025, 3, 5, 9, 0), chat_id=2)
+
+        report = rollover_day(1, date(2025, 3, 5), tz=MSK)
+        self.assertEqual((report["moved"], report["large"], report["regular"]), (2, 1, 1))
+        self.assertEqual(self._due(frog), iso_utc(MSK.localize(datetime(2025, 3, 6, 19, 30))))
+        self.assertEqual(self._due(big), iso_utc(MSK.localize(datetime(2025, 3, 9, 10, 0))))
+        self.assertEqual(self._due(other_day), iso_utc(MSK.localize(datetime(2025, 3, 6, 9, 0))))
+        text = format_report(report, auto=True)
+        self.assertIn("Автоматически перенесено 2", text)
+        self.assertIn("воскресенье", text)
+
+    def test_one_select_one_write(self):
+        """Одна выборка и одна пакетная запись, сколько бы задач ни было"""
+        for i in range(20):
+            self._add(f"Задача {i}", datetime(2025, 3, 5, 10, i))
+        with mock.patch.object(rollover, "open_due_in_windows", wraps=db.open_due_in_windows) as q, \
+             mock.patch.object(rollover, "reschedule_tasks", wraps=db.reschedule_tasks) as w:
+            report = rollover_day(1, date(2025, 3, 5), tz=MSK)
+        self.assertEqual(report["moved"], 20)
+        self.assertEqual((q.call_count, w.call_count), (1, 1))
+
+    def test_partial_write_moves_nothing(self):
+        """Если задача исчезла между выборкой и записью, перенос откатывается целиком"""
+        keep = self._add("Задача", datetime(2025, 3, 5, 10, 0))
+        gone = self._add("Разработать проект", datetime(2025, 3, 5, 11, 0), est=90)
+        before = self._due(keep)
+        real = db.reschedule_tasks
+
+        def vanish_then_write(chat_id, changes, strict=False):
+            conn = db_connect()
+            conn.execute("DELETE FROM tasks WHERE id=?", (gone,))
+            conn.commit()
+            conn.close()
+            return real(chat_id, changes, strict)
+        with mock.patch.object(rollover, "reschedule_tasks", vanish_then_write):
+            report = rollover_day(1, date(2025, 3, 5), tz=MSK)
+        self.assertEqual((report["moved"], report["large"], report["regular"], report["moves"]), (0, 0, 0, []))
+        self.assertEqual(self._due(keep), before)
+        self.assertIn("нечего", format_report(report))
+
+    def test_dry_run(self):
+        """dry_run только считает"""
+        tid = self._add("Задача", datetime(2025, 3, 5, 10, 0))
+        before = self._due(tid)
+        report = rollover_day(1, date(2025, 3, 5), tz=MSK, dry_run=True)
+        self.assertEqual(len(report["moves"]), 1)
+        self.assertEqual(self._due(tid), before)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import sqlite3
+from src.app.db import (
+    db_init, db_connect, search_tasks, find_tasks_by_title, MATCH_START, MATCH_END
+)
+from tests.base import DBTestCase
+
+class TestSearch(DBTestCase):
+
+    init_db = False
+
+    def _add(self, title, description="", chat_id=1):
+        return self._add_task(chat_id, title, description=description)
+
+    def _exec(self, sql, params=()):
+        conn = db_connect()
+        conn.execute(sql, params)
+        conn.commit()
+        conn.close()
+
+    def test_ranked_prefix_search_with_snippets(self):
+        """Слова ищутся по префиксу, совпадение в названии выше, чем в описании"""
+        db_init()
+        in_desc = self._add("Позвонить Алёне", "обсудить бюджет проекта")
+        in_title = self._add("Бюджет на квартал")
+        self._add("Бюджет чужого чата", chat_id=2)
+
+        rows = search_tasks(1, "бюдж")
+        self.assertEqual([r["id"] for r in rows], [in_title, in_desc])
+        self.assertEqual(rows[0]["title_hl"], f"{MATCH_START}Бюджет{MATCH_END} на квартал")
+        self.assertIn(f"{MATCH_START}бюджет{MATCH_END}", rows[1]["snippet"])
+        # ё и е не различаются
+        self.assertEqual([r["id"] for r in search_tasks(1, "алене")], [in_desc])
+        self.assertEqual(search_tasks(1, "  !!  "), [])
+
+    def test_index_follows_writes(self):
+        """Триггеры держат индекс в синхронизации с tasks"""
+        db_init()
+        tid = self._add("Купить молоко")
+        self._exec("UPDATE tasks SET title='Купить хлеб' WHERE id=?", (tid,))
+        self.assertEqual(search_tasks(1, "молоко"), [])
+        self.assertEqual([r["id"] for r in search_tasks(1, "хлеб")], [tid])
+        self._exec("DELETE FROM tasks WHERE id=?", (tid,))
+        self.assertEqual(search_tasks(1, "хлеб"), [])
+
+    def test_existing_tasks_indexed_on_upgrade(self):
+        """Задачи, созданные до появления индекса, попадают в него при db_init"""
+        conn = sqlite3.connect(self.temp_db)
+        conn.execute("""CREATE TABLE tasks(id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER NOT NULL,
+            title TEXT NOT NULL, description TEXT, context TEXT, due_at TEXT, added_at TEXT, status TEXT,
+            priority REAL, est_minutes INTEGER, source TEXT)""")
+        conn.execute("INSERT INTO tasks(chat_id,title,status) VALUES (1,'Старая задача','open')")
+        conn.commit()
+        conn.close()
+        db_init()
+        db_init()
+        self.assertEqual([r["title"] for r in search_tasks(1, "старая")], ["Старая задача"])
+
+    def test_title_candidates_for_sheets(self):
+        """Кандидаты для сопоставления — открытые задачи чата со всеми словами названия"""
+        db_init()
+        exact = self._add("Написать отчёт")
+        longer = self._add("Написать отчёт для клиента")
+        self._add("Отчёт", "написать")  # слово только в описании
+        done = self._add("Написать отчёт")
+        self._exec("UPDATE tasks SET status='done' WHERE id=?", (done,))
+
+        ids = [r["id"] for r in find_tasks_by_title(1, "написать ОТЧЕТ")]
+        self.assertEqual(ids, [longer, exact])
+        self.assertEqual(find_tasks_by_title(2, "Написать отчёт"), [])
+
+    def test_title_candidates_not_crowded_out(self):
+        """Точное совпадение не вытесняется более новыми задачами с теми же словами;
+        название без слов ищется точным сравнением"""
+        db_init()
+        exact = self._add("Отчёт")
+        for i in range(60):
+            self._add(f"Отчёт {i}")
+        self.assertIn(exact, [r["id"] for r in find_tasks_by_title(1, "Отчёт")])
+        self.assertEqual(find_tasks_by_title(1, "Отчёт", limit=1)[0]["title"], "Отчёт 59")
+
+        smile = self._add("🔥🔥")
+        self._add("🔥")
+        self.assertEqual([r["id"] for r in find_tasks_by_title(1, " 🔥🔥 ")], [smile])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+import unittest
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest import mock
+import pytz
+from src.app import db, tenants, rollover, handlers
+from src.app.integrations import sheets, planner
+from tests.base import DBTestCase
+from tests.fakes import FakeSpreadsheet
+from src.app.config import ALLOWED_USER_ID
+from src.app.db import iso_utc, db_connect
+
+class TestTenants(DBTestCase):
+
+    def setUp(self):
+        """Временная БД и чистый кэш тенантов"""
+        super().setUp()
+        tenants.invalidate()
+
+    def tearDown(self):
+        tenants.invalidate()
+
+    def _add(self, chat_id, title, due_dt, est=30):
+        return self._add_task(chat_id, title, due_dt, est)
+
+    def test_admin_is_first_tenant(self):
+        """ALLOWED_USER_ID заводится тенантом при инициализации"""
+        t = tenants.get_tenant(ALLOWED_USER_ID)
+        self.assertIsNotNone(t)
+        self.assertEqual(t["plan_at"], "08:00")
+        self.assertEqual([x["chat_id"] for x in tenants.active_tenants()], [ALLOWED_USER_ID])
+
+    def test_cache_single_query_and_invalidate(self):
+        """Повторные обращения не ходят в БД, изменения видны после invalidate"""
+        tenants.get_tenant(ALLOWED_USER_ID)
+        with mock.patch.object(tenants, "db_connect", side_effect=AssertionError("no DB expected")):
+            for _ in range(10):
+                tenants.get_tenant(ALLOWED_USER_ID)
+                tenants.active_tenants()
+        tenants.add_tenant(555, "Asia/Tokyo", plan_at="07:30")
+        t = tenants.get_tenant(555)
+        self.assertEqual(t["tz"].zone, "Asia/Tokyo")
+        self.assertEqual(t["plan_at"], "07:30")
+
+    def test_is_allowed(self):
+        """Чужой чат допускается, только пока он активный тенант"""
+        self.assertTrue(tenants.is_allowed(ALLOWED_USER_ID, 999))
+        self.assertFalse(tenants.is_allowed(777, 777))
+        tenants.add_tenant(777)
+        self.assertTrue(tenants.is_allowed(777, 777))
+        tenants.deactivate_tenant(777)
+        self.assertFalse(tenants.is_allowed(777, 777))
+
+    def test_validation(self):
+        """Некорректные поля и значения отклоняются"""
+        tenants.add_tenant(42)
+        with self.assertRaises(ValueError):
+            tenants.set_tenant(42, "chat_id", "1")
+        with self.assertRaises(ValueError):
+            tenants.set_tenant(42, "timezone", "Mars/Olympus")
+        with self.assertRaises(ValueError):
+            tenants.set_tenant(42, "plan_at", "25:99")
+
+    def test_integration_ids_isolated(self):
+        """Чужой чат без своей таблицы не получает общую из env"""
+        self.assertIsNone(tenants.integration_id(ALLOWED_USER_ID, "sheets_id"))
+        tenants.add_tenant(42)
+        with self.assertRaises(RuntimeError):
+            tenants.integration_id(42, "sheets_id")
+        tenants.set_tenant(42, "sheets_id", "sheet-42")
+        self.assertEqual(tenants.integration_id(42, "sheets_id"), "sheet-42")
+
+    def test_sheet_commands_refused_without_own_sheet(self):
+        """/generate_week и /ai_rebalance чужого чата без sheets_id не открывают общую таблицу"""
+        tenants.add_tenant(42)
+        for cmd in (handlers.cmd_generate_week, handlers.cmd_ai_rebalance):
+            reply = mock.AsyncMock()
+            update = SimpleNamespace(effective_user=SimpleNamespace(id=42), effective_chat=SimpleNamespace(id=42),
+                                     message=SimpleNamespace(reply_text=reply))
+            with mock.patch.object(sheets, "_open_sheet", side_effect=AssertionError("global sheet opened")) as opened:
+                asyncio.run(cmd(update, SimpleNamespace(args=[])))
+            opened.assert_not_called()
+            self.assertIn("sheets_id", reply.await_args.args[0])
+
+    def test_process_wide_diagnostics_admin_only(self):
+        """/profile и латентность/остановки в /health видит только администратор"""
+        tenants.add_tenant(42)
+
+        def update(user_id):
+            return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), effective_chat=SimpleNamespace(id=user_id),
+                                   message=SimpleNamespace(reply_text=mock.AsyncMock()))
+        with mock.patch("src.app.profiler.PROFILER_ENABLED", True), \
+             mock.patch("src.app.profiler.profile_for", side_effect=AssertionError("profiled")) as profile_for:
+            tenant = update(42)
+            asyncio.run(handlers.cmd_profile(tenant, SimpleNamespace(args=[])))
+        profile_for.assert_not_called()
+        self.assertIn("администратору", tenant.message.reply_text.await_args.args[0])
+
+        wd = {"lag_p95_s": 0.01, "max_lag_s": 0.5, "stalls": 1, "slow_callbacks": 0,
+              "last_stall": {"at": 0, "lag_s": 0.5, "handler": "cmd_plan", "frame": "db.py:1"}}
+        with mock.patch("src.app.watchdog.watchdog_summary", return_value=wd), \
+             mock.patch("src.app.instrumentation.format_latency_summary", return_value=["cmd_plan 1ms"]):
+            texts = {}
+            for user_id in (42, ALLOWED_USER_ID):
+                u = update(user_id)
+                asyncio.run(handlers.cmd_health(u, SimpleNamespace(args=[])))
+                texts[user_id] = u.message.reply_text.await_args.args[0]
+        self.assertNotIn("Event loop", texts[42])
+        self.assertNotIn("cmd", texts[42])
+        self.assertIn("Event loop", texts[ALLOWED_USER_ID])
+        self.assertIn("Команды", texts[ALLOWED_USER_ID])
+
+    def test_dates_parsed_in_tenant_zone(self):
+        """«завтра 10:00» и полночные сроки из Sheets — по местному времени чата"""
+        tokyo = pytz.timezone("Asia/Tokyo")
+        due = handlers.parse_human_dt("завтра 10:00", tokyo)
+        self.assertEqual((due.astimezone(tokyo).hour, due.astimezone(tokyo).minute), (10, 0))
+
+        tenants.add_tenant(42, "Asia/Tokyo", sheets_id="sheet-42")
+        fake = FakeSpreadsheet([sheets.SHEET_WEEK_TASKS])
+        fake.worksheet(sheets.SHEET_WEEK_TASKS).rows = [
+            ["Direction", "Task", "Outcome", "Deadline", "Status", "Bot_ID", "Notes"],
+            ["Работа", "Камень: отчёт", "", "2025-11-10", "planned", "", ""]]
+        with mock.patch.object(sheets, "_open_sheet", return_value=fake):
+            sheets.import_week_from_sheets_to_bot(chat_id=42, spreadsheet_id="sheet-42")
+        conn = db_connect()
+        due_at = conn.execute("SELECT due_at FROM tasks WHERE chat_id=42").fetchone()["due_at"]
+        conn.close()
+        self.assertEqual(due_at, iso_utc(tokyo.localize(datetime(2025, 11, 10, 14, 0))))
+
+    def test_plan_in_tenant_zone(self):
+        """План чата из Нью-Йорка: время показа, корзина и доступное время — по его поясу"""
+        ny = pytz.timezone("America/New_York")
+        monday = datetime(2025, 11, 10).date()
+        due = ny.localize(datetime(2025, 11, 10, 9, 0))
+        row = {"id": 1, "title": "Отчёт", "context": "AI", "due_at": iso_utc(due), "priority": 50, "est_minutes": 30}
+        frog, stones, sand = handlers._pick_plan([row], monday, ny)
+        self.assertEqual(([r["id"] for r in frog], stones, sand), ([1], [], []))
+        self.assertIn("🗓 09:00", handlers._plan_line(row, ny))
+
+    def test_rebalance_slots_in_tenant_zone(self):
+        """/rebalance_week ставит слоты по местному времени чата, без LMT-сдвига pytz"""
+        tenants.add_tenant(42, "America/New_York")
+        ny = pytz.timezone("America/New_York")
+        today = datetime.now(ny).date()
+        task = self._add(42, "Лягушка: отчёт", ny.localize(datetime(today.year, today.month, today.day, 12, 0)))
+        update = SimpleNamespace(effective_user=SimpleNamespace(id=42), effective_chat=SimpleNamespace(id=42),
+                                 message=SimpleNamespace(reply_text=mock.AsyncMock()))
+        asyncio.run(handlers.cmd_rebalance_week(update, SimpleNamespace(args=[])))
+        conn = db_connect()
+        due_at = conn.execute("SELECT due_at FROM tasks WHERE id=?", (task,)).fetchone()["due_at"]
+        conn.close()
+        local = datetime.fromisoformat(due_at).astimezone(ny)
+        self.assertTrue(today <= local.date() < today + timedelta(days=7))
+        self.assertEqual((local.hour, local.minute), (9, 0) if local.weekday() == 6 else (19, 30))
+
+    def test_generate_week_deadlines_in_tenant_zone(self):
+        """/generate_week ставит дедлайны на 21:00 по поясу чата"""
+        tenants.add_tenant(42, "America/New_York", sheets_id="sheet-42")
+        ny = pytz.timezone("America/New_York")
+        fake = FakeSpreadsheet(["Goals", "Projects", "Week_Tasks", "Days"])
+        fake.worksheet("Goals").rows = [["Level", "Objective", "Weight"], ["Год", "Рост", "2"]]
+        fake.worksheet("Projects").rows = [
+            ["Project_ID", "Title", "Context", "Status", "Goal_Level", "Goal_Objective", "Deadline", "Weekly_Slots"],
+            ["P1", "Бот", "AI", "active", "Год", "Рост", "", "2"]]
+        with mock.patch.object(planner, "_open_sheet", return_value=fake):
+            planner.generate_week_from_goals(42, "sheet-42")
+        conn = db_connect()
+        dues = [r["due_at"] for r in conn.execute("SELECT due_at FROM tasks WHERE chat_id=42").fetchall()]
+        conn.close()
+        self.assertEqual(len(dues), 2)
+        for due_at in dues:
+            local = datetime.fromisoformat(due_at).astimezone(ny)
+            self.assertEqual((local.hour, local.minute), (21, 0))
+
+    def test_open_tasks_limit(self):
+        """max_open_tasks ограничивает число открытых задач чата"""
+        tenants.add_tenant(42, max_open_tasks=2)
+        now = datetime.now(timezone.utc)
+        self._add(42, "Раз", now)
+        self.assertFalse(tenants.open_tasks_limit_reached(42))
+        self._add(42, "Два", now)
+        self.assertTrue(tenants.open_tasks_limit_reached(42))
+        self.assertFalse(tenants.open_tasks_limit_reached(ALLOWED_USER_ID))
+
+    def test_auto_rollover_per_tenant_day(self):
+        """Автоперенос берёт «сегодня» в поясе каждого чата и выбирает задачи одним запросом"""
+        tenants.add_tenant(42, "Asia/Tokyo")
+        tokyo, moscow = pytz.timezone("Asia/Tokyo"), pytz.timezone("Europe/Moscow")
+        tenants.set_tenant(ALLOWED_USER_ID, "timezone", "Europe/Moscow")
+        # 2025-03-05 20:00 UTC: в Токио уже 6 марта 05:00, в Москве 5 марта 23:00
+        now_utc = datetime(2025, 3, 5, 20, 0, tzinfo=timezone.utc)
+        tokyo_today = self._add(42, "Позвонить", tokyo.localize(datetime(2025, 3, 6, 3, 0)))
+        tokyo_yesterday = self._add(42, "Написать", tokyo.localize(datetime(2025, 3, 5, 12, 0)))
+        moscow_today = self._add(ALLOWED_USER_ID, "Разработать бота", moscow.localize(datetime(2025, 3, 5, 12, 0)), est=90)
+
+        with mock.patch.object(rollover, "open_due_in_windows", wraps=db.open_due_in_windows) as q:
+            reports = rollover.rollover_tenants(tenants.active_tenants(), now_utc)
+        self.assertEqual(q.call_count, 1)
+        self.assertEqual({k: (r["moved"], r["large"]) for k, r in reports.items()}, {42: (1, 0), ALLOWED_USER_ID: (1, 1)})
+
+        conn = db_connect()
+        due = {r["id"]: r["due_at"] for r in conn.execute("SELECT id, due_at FROM tasks").fetchall()}
+        conn.close()
+        # Токио: завтра (7 марта, пятница) вечером
+        self.assertEqual(due[tokyo_today], iso_utc(tokyo.localize(datetime(2025, 3, 7, 20, 30))))
+        self.assertEqual(due[tokyo_yesterday], iso_utc(tokyo.localize(datetime(2025, 3, 5, 12, 0))))
+        # Москва: крупная задача — на воскресенье 10:00
+        self.assertEqual(due[moscow_today], iso_utc(moscow.localize(datetime(2025, 3, 9, 10, 0))))
+
+if __name__ == "__main__":
+    unittest.main()
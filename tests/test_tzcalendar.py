@@ -0,0 +1,67 @@
+import unittest
+from datetime import datetime, date, timedelta, timezone
+import pytz
+from src.app import tzcalendar
+from src.app.tzcalendar import Timetable, day_bounds, week_bounds, next_occurrence
+
+def _tenant(chat_id, zone, **times):
+    t = {"chat_id": chat_id, "tz": pytz.timezone(zone), "plan_at": "08:00", "weekend_at": "22:00"}
+    t.update(times)
+    return t
+
+class TestTzCalendar(unittest.TestCase):
+
+    def test_day_bounds_dst(self):
+        """Сутки перехода на летнее время — 23 часа, границы в UTC"""
+        start, end = day_bounds("Europe/Berlin", date(2025, 3, 30))
+        self.assertEqual(start, "2025-03-29T23:00:00+00:00")
+        self.assertEqual(end, "2025-03-30T22:00:00+00:00")
+
+    def test_week_bounds_monday_start(self):
+        """Неделя — с понедельника по воскресенье в поясе чата"""
+        start, end = week_bounds("Asia/Tokyo", date(2025, 3, 6))  # четверг
+        self.assertEqual(start, "2025-03-02T15:00:00+00:00")
+        self.assertEqual(end, "2025-03-09T15:00:00+00:00")
+
+    def test_bounds_cached(self):
+        """Повторный запрос тех же границ берётся из кэша"""
+        day_bounds("Europe/Moscow", date(2025, 1, 1))
+        hits = tzcalendar._range_bounds.cache_info().hits
+        day_bounds("Europe/Moscow", date(2025, 1, 1))
+        self.assertEqual(tzcalendar._range_bounds.cache_info().hits, hits + 1)
+
+    def test_next_occurrence(self):
+        """Ближайшее местное HH:MM, в том числе в заданный день недели"""
+        after = datetime(2025, 3, 5, 6, 0, tzinfo=timezone.utc)  # ср, 09:00 в Москве
+        self.assertEqual(next_occurrence("Europe/Moscow", "21:00", after),
+                         datetime(2025, 3, 5, 18, 0, tzinfo=timezone.utc))
+        self.assertEqual(next_occurrence("Europe/Moscow", "08:00", after),
+                         datetime(2025, 3, 6, 5, 0, tzinfo=timezone.utc))
+        self.assertEqual(next_occurrence("Europe/Moscow", "22:00", after, weekday=6),
+                         datetime(2025, 3, 9, 19, 0, tzinfo=timezone.utc))
+
+    def test_timetable_fires_once_per_tenant_zone(self):
+        """Каждый чат получает событие в своё местное время и один раз"""
+        tt = Timetable({"plan": ("plan_at", None)})
+        moscow, tokyo = _tenant(1, "Europe/Moscow"), _tenant(2, "Asia/Tokyo")
+        tokyo_8 = datetime(2025, 3, 5, 23, 0, tzinfo=timezone.utc)  # 08:00 6 марта в Токио
+        self.assertEqual(tt.due([moscow, tokyo], tokyo_8 - timedelta(minutes=1)), [])
+        fired = tt.due([moscow, tokyo], tokyo_8 + timedelta(minutes=1))
+        self.assertEqual([(t["chat_id"], k) for t, k in fired], [(2, "plan")])
+        self.assertEqual(tt.due([moscow, tokyo], tokyo_8 + timedelta(minutes=2)), [])
+        fired = tt.due([moscow, tokyo], datetime(2025, 3, 6, 5, 0, tzinfo=timezone.utc))
+        self.assertEqual([(t["chat_id"], k) for t, k in fired], [(1, "plan")])
+        self.assertEqual(tt.next_fire(), datetime(2025, 3, 6, 23, 0, tzinfo=timezone.utc))
+
+    def test_timetable_skips_missed_and_follows_settings(self):
+        """Давно пропущенное не догоняется; смена времени перепланирует событие"""
+        tt = Timetable({"plan": ("plan_at", None)})
+        t = _tenant(1, "Europe/Moscow")
+        self.assertEqual(tt.due([t], datetime(2025, 3, 5, 7, 0, tzinfo=timezone.utc)), [])  # 10:00
+        t["plan_at"] = "10:02"
+        self.assertEqual(tt.due([t], datetime(2025, 3, 5, 7, 0, tzinfo=timezone.utc)), [])
+        fired = tt.due([t], datetime(2025, 3, 5, 7, 3, tzinfo=timezone.utc))
+        self.assertEqual(len(fired), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+import time
+import asyncio
+from src.app import watchdog
+from src.app.instrumentation import registry
+from src.app.watchdog import LoopWatchdog, _attributed
+
+class TestLoopWatchdog(unittest.TestCase):
+
+    def test_stall_attributed_to_handler(self):
+        """Блокирующий хендлер фиксируется как остановка с его именем"""
+        async def cmd_blocking(update, context):
+            time.sleep(0.3)
+
+        handler = _attributed(cmd_blocking, "cmd_blocking")
+        before = registry.counter_value("loop_stalls_total", handler="cmd_blocking")
+
+        async def run():
+            dog = LoopWatchdog(asyncio.get_running_loop(), interval_s=0.02, stall_s=0.1)
+            dog.start()
+            try:
+                await asyncio.sleep(0.1)
+                await handler(None, None)
+                await asyncio.sleep(0.1)
+            finally:
+                dog.stop()
+            return dog
+
+        dog = asyncio.run(run())
+        self.assertEqual(dog.stalls, 1)
+        self.assertGreaterEqual(dog.max_lag_s, 0.2)
+        self.assertEqual(dog.last_stall["handler"], "cmd_blocking")
+        self.assertIn("cmd_blocking", dog.last_stall["frame"])
+        self.assertEqual(registry.counter_value("loop_stalls_total", handler="cmd_blocking"), before + 1)
+        self.assertFalse(watchdog._active_handlers)
+
+    def test_no_stall_when_idle(self):
+        """Свободный loop — только лаг в гистограмме, без остановок"""
+        async def run():
+            dog = LoopWatchdog(asyncio.get_running_loop(), interval_s=0.01, stall_s=0.2)
+            dog.start()
+            await asyncio.sleep(0.1)
+            dog.stop()
+            return dog
+        dog = asyncio.run(run())
+        self.assertEqual(dog.stalls, 0)
+        self.assertTrue(registry.summary("loop_lag_seconds"))